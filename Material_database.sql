@@ -21,7 +21,11 @@ CREATE TABLE "Categories"
 	"Name" TEXT UNIQUE NOT NULL,
 	"LastUse" TIMESTAMP DEFAULT NULL,
 	"Completed" INTEGER DEFAULT 0,
+	"Type" INTEGER DEFAULT 0,
 	PRIMARY KEY("Id")
 );
 
+-- Indexes are added by the migrations in migrations.py
+PRAGMA user_version = 0;
+
 COMMIT;
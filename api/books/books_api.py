@@ -2,11 +2,11 @@ import logging
 from os import environ
 from pathlib import Path
 
-from flask import Blueprint, jsonify, abort
+from flask import Blueprint, abort
 from dotenv import load_dotenv
 
 from material_loader import MaterialLoader
-from util import make_image_response
+from util import app_response_cache, make_cached_json_response, make_image_response, make_json_response, to_json
 
 logger = logging.getLogger(__name__)
 
@@ -25,13 +25,13 @@ logger.info(f'Found {books} books in {ctgs} categories.')
 
 @books_api.route('/books/info')
 def get_books_info():
-    return jsonify(loader.get_element_count('books'))
+    return make_json_response(to_json(loader.get_element_count('books')))
 
 
 @books_api.route('/books')
 def get_books():
     logger.debug('get_books')
-    return jsonify(loader.categories)
+    return make_cached_json_response(app_response_cache(), 'books', loader.version, lambda: loader.categories)
 
 
 @books_api.route('/books/text/<int:book_id>')
@@ -40,7 +40,7 @@ def get_text_book(book_id):
     category, found_book = loader.find_book(book_id)
     if found_book is None:
         abort(404)
-    return jsonify(found_book)
+    return make_json_response(to_json(found_book))
 
 
 @books_api.route('/books/<int:book_id>')
@@ -51,7 +51,7 @@ def get_book(book_id):
     if 'imagefilepath' in found_book:
         return make_image_response(found_book['imagefilepath'])
     else:
-        return jsonify(found_book)
+        return make_json_response(to_json(found_book))
 
 
 @books_api.route('/books/cover/<int:book_id>')
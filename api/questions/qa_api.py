@@ -6,7 +6,7 @@ from flask import Blueprint, jsonify, abort, request
 from dotenv import load_dotenv
 
 from material_loader import MaterialLoader
-from util import make_image_response
+from util import app_response_cache, make_cached_json_response, make_image_response, make_json_response, to_json
 
 logger = logging.getLogger(__name__)
 
@@ -25,13 +25,13 @@ loader.load_groups()
 
 @qa_api.route('/qa')
 def get_qa():
-    return jsonify(loader.categories)
+    return make_cached_json_response(app_response_cache(), 'qa', loader.version, lambda: loader.categories)
 
 
 @qa_api.route('/qa/category/<int:category_id>')
 def get_category(category_id):
     category = loader.find_category(category_id)
-    return jsonify(category)
+    return make_json_response(to_json(category))
 
 
 @qa_api.route('/qa/image/<int:qa_id>')
@@ -45,7 +45,7 @@ def get_image(qa_id):
 @qa_api.route('/qa/groups')
 def get_groups():
     groups = loader.load_groups()
-    return jsonify(groups)
+    return make_json_response(to_json(groups))
 
 
 @qa_api.route('/qa/groups/<int:group_id>', methods=['GET'])
@@ -53,7 +53,7 @@ def get_group(group_id):
     found = loader.find_group(group_id)
     if found is None:
         abort(404)
-    return jsonify(found)
+    return make_json_response(to_json(found))
 
 
 @qa_api.route('/qa/groups/new', methods=['POST'])
@@ -0,0 +1,80 @@
+"""
+    Compare loading every category with one query per category against
+    the single-query bulk hydration used by /categories.
+
+        python -m benchmarks.categories_benchmark --categories 2000 --items 20
+"""
+import sys
+import tempfile
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+
+from material_service import MaterialService
+from sqlite_repository import SQLiteRepository
+
+
+def build_database(database: Path, categories: int, items: int) -> SQLiteRepository:
+    """Create a database with the given number of categories and items per category"""
+    repository = SQLiteRepository(database)
+    repository.run_script("Material_database.sql")
+    repository.execute_many(
+        "INSERT INTO Categories (Id, Name) VALUES (?, ?)",
+        [(c, f"category{c}") for c in range(1, categories + 1)],
+    )
+    repository.execute_many(
+        "INSERT INTO Items (Text, Image, Views, CategoryId) VALUES (?, ?, ?, ?)",
+        [
+            (f"item{c}-{i}", f"category{c}/item{i}.jpg", i % 6, c)
+            for c in range(1, categories + 1)
+            for i in range(items)
+        ],
+    )
+    repository.commit()
+    return repository
+
+
+def per_category(service: MaterialService):
+    """Previous strategy: list categories, then load each one"""
+    return [service.get_category(c.Id) for c in service.get_all_categories()]
+
+
+def measure(repository: SQLiteRepository, load, repeat: int):
+    """Return best time in seconds and number of statements of load()"""
+    statements = []
+    repository.set_trace_callback(statements.append)
+    load()
+    repository.set_trace_callback(None)
+    best = min(_timed(load) for _ in range(repeat))
+    return best, len(statements)
+
+
+def _timed(load) -> float:
+    start = perf_counter()
+    load()
+    return perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--categories", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repository = build_database(
+            Path(tmp, "benchmark.db3"), args.categories, args.items
+        )
+        service = MaterialService(repository)
+        for name, load in (
+            ("per category", lambda: per_category(service)),
+            ("single query", service.get_all_complete_categories),
+        ):
+            seconds, statements = measure(repository, load, args.repeat)
+            print(f"{name:>14}: {seconds * 1000:9.1f} ms  {statements:6} queries")
+        repository.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+    Compare image throughput of reading the whole file into memory against
+    handing the open file to waitress through wsgi.file_wrapper, and against
+    the X-Sendfile offload, where the server only sends headers.
+
+        python -m benchmarks.image_benchmark --size 2000000 --requests 400 --clients 8
+"""
+import http.client
+import io
+import logging
+import os
+import sys
+import tempfile
+import threading
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from flask import Flask, make_response
+from waitress.server import create_server
+
+from util import make_image_response, make_offload_response
+
+
+def create_app(image_path: str) -> Flask:
+    app = Flask(__name__)
+
+    @app.route("/readall")
+    def readall():
+        """Previous strategy: copy the whole file into a bytes object"""
+        with io.FileIO(image_path) as img:
+            img_bytes = img.readall()
+        response = make_response(img_bytes)
+        response.headers.set("Content-Type", "image/jpeg")
+        return response
+
+    @app.route("/file_wrapper")
+    def file_wrapper():
+        return make_image_response(image_path)
+
+    @app.route("/offload")
+    def offload():
+        return make_offload_response(image_path, "x-sendfile")
+
+    return app
+
+
+def download(port: int, path: str) -> int:
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    connection.request("GET", path)
+    length = len(connection.getresponse().read())
+    connection.close()
+    return length
+
+
+def measure(port: int, path: str, requests: int, clients: int):
+    """Return seconds and bytes received downloading path requests times"""
+    with ThreadPoolExecutor(clients) as executor:
+        start = perf_counter()
+        received = sum(executor.map(lambda _: download(port, path), range(requests)))
+        return perf_counter() - start, received
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--size", type=int, default=2_000_000, help="image bytes")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--clients", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image_path = os.path.join(tmp, "image.jpg")
+        with open(image_path, "wb") as image:
+            image.write(os.urandom(args.size))
+
+        logging.getLogger("waitress.queue").setLevel(logging.ERROR)
+        server = create_server(
+            create_app(image_path), host="127.0.0.1", port=0, threads=args.clients
+        )
+        port = server.effective_port
+        # The server thread ends with the process
+        threading.Thread(target=server.run, daemon=True).start()
+        for path in ("/readall", "/file_wrapper", "/offload"):
+            download(port, path)
+            seconds, received = measure(port, path, args.requests, args.clients)
+            print(
+                f"{path:>14}: {args.requests / seconds:8.1f} req/s "
+                f"{received / seconds / 1_000_000:8.1f} MB/s"
+            )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+    Compare saving a catalog one category at a time, with a commit each,
+    against the bulk save_categories in a single transaction, with the
+    indexes kept up to date or created at the end.
+
+        python -m benchmarks.import_benchmark --categories 10000 --items 100
+"""
+import sys
+import tempfile
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+
+from model import Category, Item
+from sqlite_repository import SQLiteRepository
+
+
+def catalog(categories: int, items: int):
+    return [
+        Category(
+            f"category{c}",
+            [Item(f"item{c}-{i}", f"category{c}/item{i}.jpg") for i in range(items)],
+        )
+        for c in range(categories)
+    ]
+
+
+def per_category(repository: SQLiteRepository, categories):
+    for category in categories:
+        repository.save_category(category)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--categories", type=int, default=10000)
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument(
+        "--per-category-limit",
+        type=int,
+        default=1000,
+        help="categories saved one at a time, the rest is extrapolated",
+    )
+    args = parser.parse_args()
+
+    rows = args.categories * (args.items + 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, save, count in (
+            ("per category", per_category, min(args.categories, args.per_category_limit)),
+            ("bulk", lambda r, c: r.save_categories(c), args.categories),
+            ("bulk, deferred", lambda r, c: r.save_categories(c, True), args.categories),
+        ):
+            repository = SQLiteRepository(Path(tmp, f"{name}.db3"))
+            repository.run_script("Material_database.sql")
+            categories = catalog(count, args.items)
+            start = perf_counter()
+            save(repository, categories)
+            seconds = (perf_counter() - start) * args.categories / count
+            repository.close()
+            print(f"{name:>14}: {seconds:8.2f} s  {rows / seconds:10.0f} rows/s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""
+    Compare queries built with the values in the SQL text, prepared again on
+    every call, against fixed parameterized statements reused from the
+    connection statement cache.
+
+        python -m benchmarks.query_benchmark --queries 20000
+"""
+import json
+import sqlite3
+import sys
+import tempfile
+from argparse import ArgumentParser
+from pathlib import Path
+from time import process_time
+
+from benchmarks.categories_benchmark import build_database
+
+
+def literal(connection, item_id, ids):
+    connection.execute(f"SELECT * FROM Items WHERE Id = {item_id}").fetchall()
+    connection.execute(
+        f"SELECT * FROM Items WHERE CategoryId IN ({','.join(str(i) for i in ids)})"
+    ).fetchall()
+
+
+def parameterized(connection, item_id, ids):
+    connection.execute("SELECT * FROM Items WHERE Id = ?", (item_id,)).fetchall()
+    connection.execute(
+        "SELECT * FROM Items WHERE CategoryId IN (SELECT value FROM json_each(?))",
+        (json.dumps(ids),),
+    ).fetchall()
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--categories", type=int, default=1000)
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Path(tmp, "benchmark.db3")
+        build_database(database, args.categories, args.items).close()
+        connection = sqlite3.connect(database)
+        total_items = args.categories * args.items
+        for name, query in (("literal", literal), ("parameterized", parameterized)):
+            start = process_time()
+            for n in range(args.queries):
+                first = n % args.categories + 1
+                query(connection, n % total_items + 1, [first, first + 7, first + 13])
+            seconds = process_time() - start
+            print(f"{name:>14}: {seconds / args.queries * 1e6:7.1f} us CPU per query pair")
+        connection.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
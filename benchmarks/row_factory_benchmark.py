@@ -0,0 +1,97 @@
+"""
+    Compare loading items as dictionaries copied into Item objects against
+    building Item objects straight from the row tuples.
+
+        python -m benchmarks.row_factory_benchmark --categories 5000 --items 20
+"""
+import sys
+import tempfile
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+
+from benchmarks.categories_benchmark import build_database
+from material_service import MaterialService
+from model import Category
+
+
+def categories_from_rows(service: MaterialService, rows):
+    """Group dictionaries of categories joined with their items, ordered by
+    category, into Category objects in a single pass.
+    """
+    category = None
+    for row in rows:
+        if category is None or category.Id != row["c_Id"]:
+            if category is not None:
+                yield category
+            category = Category(
+                Id=row["c_Id"],
+                Name=row["Name"],
+                LastUse=row["c_LastUse"],
+                Type=row["Type"],
+            )
+        # Categories without items come with null item columns
+        if row["Id"] is not None:
+            category.Items.append(service.item_from_row(row))
+    if category is not None:
+        yield category
+
+
+def measure(load, repeat: int):
+    """Return best time in seconds and peak of memory allocated by load()"""
+    tracemalloc.start()
+    load()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        load()
+        best = min(best, perf_counter() - start)
+    return best, peak
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--categories", type=int, default=5000)
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repository = build_database(
+            Path(tmp, "benchmark.db3"), args.categories, args.items
+        )
+        service = MaterialService(repository)
+        for name, load in (
+            (
+                "dict rows",
+                lambda: [
+                    service.item_from_row(row)
+                    for row in repository.execute_sql_select("SELECT * FROM Items")
+                ],
+            ),
+            ("item rows", repository.load_items),
+            (
+                "dict categories",
+                lambda: list(
+                    categories_from_rows(
+                        service,
+                        repository.execute_sql_select(
+                            "SELECT c.Id AS c_Id, Name, c.LastUse AS c_LastUse, Type, "
+                            "it.Id, Text, Views, Image, it.LastUse FROM Categories c "
+                            "LEFT JOIN Items it ON c.Id = it.CategoryId ORDER BY c.Id, it.Id"
+                        ),
+                    )
+                ),
+            ),
+            ("object categories", repository.load_complete_categories),
+        ):
+            seconds, peak = measure(load, args.repeat)
+            print(f"{name:>17}: {seconds * 1000:8.1f} ms  peak {peak / 2**20:7.1f} MiB")
+        repository.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
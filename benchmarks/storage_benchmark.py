@@ -0,0 +1,92 @@
+"""
+    Compare storage profiles under mixed load: reader threads loading
+    categories while writer threads update views, as /categories and
+    /updatebatch do.
+
+        python -m benchmarks.storage_benchmark --readers 4 --writers 2 --seconds 5
+"""
+import sys
+import tempfile
+import threading
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+
+from benchmarks.categories_benchmark import build_database
+from material_service import MaterialService
+from sqlite_repository import SQLiteRepository
+from storage_profile import PROFILES
+
+
+def run(repository: SQLiteRepository, readers: int, writers: int, seconds: float, categories: int):
+    """Return read latencies and number of writes done in the given time"""
+    service = MaterialService(repository)
+    stop = threading.Event()
+    latencies = []
+    writes = [0]
+    lock = threading.Lock()
+
+    def read(first):
+        category_id = first
+        done = []
+        while not stop.is_set():
+            start = perf_counter()
+            service.get_category(category_id)
+            done.append(perf_counter() - start)
+            category_id = category_id % categories + 1
+        with lock:
+            latencies.extend(done)
+
+    def write(first):
+        category_id = first
+        count = 0
+        while not stop.is_set():
+            repository.execute(
+                "UPDATE Items SET Views = Views + 1 WHERE CategoryId = ?", (category_id,)
+            )
+            repository.commit()
+            count += 1
+            category_id = category_id % categories + 1
+        with lock:
+            writes[0] += count
+
+    threads = [threading.Thread(target=read, args=(n + 1,)) for n in range(readers)]
+    threads += [threading.Thread(target=write, args=(n + 1,)) for n in range(writers)]
+    for thread in threads:
+        thread.start()
+    stop.wait(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), writes[0]
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--categories", type=int, default=500)
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    for name, profile in PROFILES.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            database = Path(tmp, "benchmark.db3")
+            build_database(database, args.categories, args.items).close()
+            repository = SQLiteRepository(database, profile=profile)
+            latencies, writes = run(
+                repository, args.readers, args.writers, args.seconds, args.categories
+            )
+            repository.close()
+        p50 = latencies[len(latencies) // 2] if latencies else 0
+        p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0
+        print(
+            f"{name:>8}: {len(latencies) / args.seconds:9.0f} reads/s"
+            f"  p50 {p50 * 1000:7.2f} ms  p99 {p99 * 1000:7.2f} ms"
+            f"  {writes / args.seconds:7.0f} writes/s"
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""
+    Read-through cache of query results.
+
+    CachedRepository wraps a repository and keeps the results of its lookups,
+    such as load_category(id) or get_recent(count), by method and arguments
+    in an LRU cache. Loaders of whole tables are not cached: the cache is
+    bounded by its number of results, not their size. Each table has a version that its write methods increase
+    when they change it, both when the statement runs and when it is
+    committed. A result is stored with the versions of the tables it was read
+    from and is a miss once any of them changes.
+
+    Only writes made through the wrapper are seen: changes made to the
+    database by other processes are not. Cached results are shared by every
+    caller, so they must not be modified.
+"""
+import re
+import threading
+from typing import Hashable, Iterable, Iterator, List, Tuple
+
+from model import Category, Item
+from repository import ImportResult, Repository
+from response_cache import ByteCache
+
+ITEMS = "Items"
+CATEGORIES = "Categories"
+TABLES = (ITEMS, CATEGORIES)
+
+# Table changed by an INSERT, REPLACE, UPDATE or DELETE statement
+_WRITTEN_TABLE = re.compile(
+    r"^\s*(?:(?:INSERT|REPLACE)(?:\s+OR\s+\w+)?\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)"
+    r"\s+[\"`\[]?(\w+)",
+    re.IGNORECASE,
+)
+
+
+def written_tables(sql: str) -> Tuple[str, ...]:
+    """Tables a statement may change, all of them when it cannot tell"""
+    match = _WRITTEN_TABLE.match(sql)
+    if match is None:
+        return TABLES
+    for table in TABLES:
+        if table.lower() == match.group(1).lower():
+            return (table,)
+    return ()
+
+
+class ResultCache(ByteCache):
+    """LRU cache of query results bounded by their number"""
+
+    def size_of(self, content) -> int:
+        return 1
+
+
+class CachedRepository(Repository):
+    """Repository keeping the results of lookups until their tables change"""
+
+    def __init__(self, repository: Repository, max_entries: int = 1024, enabled: bool = True):
+        self.repository = repository
+        self.enabled = enabled  # When False every call goes to the repository
+        self.cache = ResultCache(max_entries)
+        self.invalidations = 0  # Number of table changes seen
+        self.__versions = dict.fromkeys(TABLES, 0)
+        self.__dirty = set()  # Tables changed since the last commit
+        self.__lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # Anything else, such as close() or set_trace_callback(), is the repository's
+        return getattr(self.repository, name)
+
+    def __cached(self, tables: Tuple[str, ...], method: str, *args):
+        """Result of the repository method, read from the cache when still valid"""
+        load = getattr(self.repository, method)
+        if not self.enabled:
+            return load(*args)
+        key: Hashable = (method, args)
+        with self.__lock:
+            version = tuple(self.__versions[table] for table in tables)
+        # Results are wrapped so that a stored None is not taken for a miss
+        entry = self.cache.get(key, version)
+        if entry is None:
+            entry = self.cache.put(key, version, (load(*args),))
+        return entry[0]
+
+    def __changed(self, tables, pending: bool = False) -> None:
+        """Increase the version of changed tables, pending ones also on the next commit"""
+        with self.__lock:
+            for table in tables:
+                self.__versions[table] += 1
+                self.invalidations += 1
+            if pending:
+                self.__dirty.update(tables)
+
+    def __committed(self) -> None:
+        with self.__lock:
+            tables, self.__dirty = self.__dirty, set()
+        self.__changed(tables)
+
+    def stats(self) -> dict:
+        """Hit and miss counters, number of results kept and of invalidations"""
+        return dict(self.cache.stats(), invalidations=self.invalidations, enabled=self.enabled)
+
+    def clear(self) -> None:
+        """Remove all the results kept"""
+        self.cache.clear()
+
+    # Cached lookups
+
+    def category(self, category_id: int) -> List[dict]:
+        return self.__cached(TABLES, "category", category_id)
+
+    def load_items_page(self, limit: int, after: int = 0) -> List[Item]:
+        return self.__cached((ITEMS,), "load_items_page", limit, after)
+
+    def load_item(self, item_id: int) -> Item:
+        return self.__cached((ITEMS,), "load_item", item_id)
+
+    def load_category(self, category_id: int) -> Category:
+        return self.__cached(TABLES, "load_category", category_id)
+
+    def load_categories_page(self, limit: int, after: int = 0) -> List[Category]:
+        return self.__cached(TABLES, "load_categories_page", limit, after)
+
+    def get_recent(self, count):
+        return self.__cached((CATEGORIES,), "get_recent", count)
+
+    def load_recent_items(self, ids: List[int]) -> List[Tuple[int, Item]]:
+        return self.__cached((ITEMS,), "load_recent_items", tuple(ids))
+
+    def get_items(self, ids: List[int]):
+        return self.__cached((ITEMS,), "get_items", tuple(ids))
+
+    def get_item(self, item_id: int):
+        return self.__cached((ITEMS,), "get_item", item_id)
+
+    # Uncached reads: iterators are consumed once, and whole tables would
+    # keep the catalog in memory, bounded only by the number of results
+
+    def load_items(self) -> List[Item]:
+        return self.repository.load_items()
+
+    def load_complete_categories(self) -> List[Category]:
+        return self.repository.load_complete_categories()
+
+    def all_categories(self) -> List[dict]:
+        return self.repository.all_categories()
+
+    def all_categories2(self) -> List[dict]:
+        return self.repository.all_categories2()
+
+    def all_items(self) -> List[dict]:
+        return self.repository.all_items()
+
+    def iter_item_objects(self) -> Iterator[Item]:
+        return self.repository.iter_item_objects()
+
+    def iter_category_objects(self) -> Iterator[Category]:
+        return self.repository.iter_category_objects()
+
+    def get_info(self):
+        return self.repository.get_info()
+
+    def data_version(self):
+        return self.repository.data_version()
+
+    # Writes
+
+    def transaction(self, function, *args):
+        try:
+            return self.repository.transaction(function, *args)
+        finally:
+            self.__changed(TABLES)
+
+    def save_category(self, category: Category) -> int:
+        try:
+            return self.repository.save_category(category)
+        finally:
+            self.__changed(TABLES)
+
+    def save_categories(
+        self, categories: Iterable[Category], defer_indexes: bool = False
+    ) -> ImportResult:
+        try:
+            return self.repository.save_categories(categories, defer_indexes)
+        finally:
+            self.__changed(TABLES)
+
+    def update_views(
+        self, categories: List[tuple], items: List[tuple], completed: List[tuple] = ()
+    ) -> None:
+        try:
+            self.repository.update_views(categories, items, completed)
+        finally:
+            self.__changed(TABLES)
+
+    def update_views_and_load(
+        self,
+        categories: List[tuple],
+        items: List[tuple],
+        category_id: int,
+        completed: List[tuple] = (),
+    ) -> Category:
+        try:
+            return self.repository.update_views_and_load(
+                categories, items, category_id, completed
+            )
+        finally:
+            self.__changed(TABLES)
+
+    def mark_category_completed(self, category_id):
+        try:
+            self.repository.mark_category_completed(category_id)
+        finally:
+            self.__changed((CATEGORIES,), pending=True)
+
+    def run_script(self, script: str):
+        try:
+            return self.repository.run_script(script)
+        finally:
+            self.__changed(TABLES)
+
+    def execute(self, cmd, new_data):
+        try:
+            self.repository.execute(cmd, new_data)
+        finally:
+            self.__changed(written_tables(cmd), pending=True)
+
+    def execute_statement(self, cmd):
+        try:
+            self.repository.execute_statement(cmd)
+        finally:
+            self.__changed(written_tables(cmd), pending=True)
+
+    def execute_many(self, cmd, many_new_data):
+        try:
+            self.repository.execute_many(cmd, many_new_data)
+        finally:
+            self.__changed(written_tables(cmd), pending=True)
+
+    def commit(self):
+        try:
+            self.repository.commit()
+        finally:
+            self.__committed()
@@ -0,0 +1,166 @@
+"""
+    Pool of sqlite3 connections shared by the server threads.
+
+    A thread leases a connection for a block of reads, such as one repository
+    call or the rows of a streamed response, so reads from different threads
+    neither serialize on one connection nor share cursor state. The
+    connection goes back to the pool when the block ends, so threads that are
+    idle, such as waiting server workers, hold none and max_connections only
+    bounds the reads running at the same time.
+"""
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List
+
+
+def memory_database_uri() -> str:
+    """URI of a new in-memory database that several connections can open"""
+    return f"file:memory-{uuid.uuid4().hex}?mode=memory&cache=shared"
+
+
+class _Lease:
+    """Connection held by a thread, with the number of lease blocks using it"""
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+        self.depth = 1
+
+
+class ConnectionPool:
+    """sqlite3 connections leased by threads, up to max_connections at the same time"""
+
+    def __init__(
+        self,
+        connect: Callable[[], sqlite3.Connection],
+        max_connections: int = 8,
+        timeout: float = 30.0,
+        check_interval: float = 60.0,
+    ):
+        self.connect = connect  # Opens a new connection
+        self.max_connections = max_connections
+        self.timeout = timeout  # Seconds to wait for a free connection
+        # Seconds after which a connection is checked again before being used
+        self.check_interval = check_interval
+        self.__local = threading.local()
+        self.__idle: List[sqlite3.Connection] = []
+        self.__connections: List[sqlite3.Connection] = []  # Open ones, idle or held
+        self.__checked: Dict[sqlite3.Connection, float] = {}  # Last health check
+        self.__closed = False
+        self.__available = threading.Condition()
+
+    @contextmanager
+    def lease(self) -> Iterator[sqlite3.Connection]:
+        """Connection of the current thread for the duration of the block.
+
+        Blocks nested in the same thread share the connection, which goes back
+        to the pool when the outermost one ends.
+        """
+        lease = getattr(self.__local, "lease", None)
+        if lease is None or lease.depth == 0:
+            lease = self.__local.lease = _Lease(self.__acquire())
+        else:
+            lease.depth += 1
+        try:
+            yield lease.connection
+        finally:
+            # May run in another thread, when an unfinished generator is collected
+            lease.depth -= 1
+            if lease.depth == 0:
+                self.release(lease.connection)
+
+    def connection(self) -> sqlite3.Connection:
+        """Connection of the current thread, inside a lease block"""
+        lease = getattr(self.__local, "lease", None)
+        if lease is None or lease.depth == 0:
+            raise sqlite3.ProgrammingError("No connection leased by this thread")
+        return lease.connection
+
+    def __acquire(self) -> sqlite3.Connection:
+        deadline = time.monotonic() + self.timeout
+        with self.__available:
+            while True:
+                if self.__closed:
+                    raise sqlite3.ProgrammingError("Connection pool is closed")
+                while self.__idle:
+                    connection = self.__idle.pop()
+                    if self.__check(connection):
+                        return connection
+                    self.__forget(connection)
+                    connection.close()
+                if len(self.__connections) < self.max_connections:
+                    self.__connections.append(None)  # Reserve the place
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.__available.wait(remaining):
+                    raise sqlite3.OperationalError(
+                        f"No database connection free after {self.timeout} seconds"
+                    )
+        try:
+            connection = self.connect()
+        except Exception:
+            with self.__available:
+                self.__connections.remove(None)
+                self.__available.notify()
+            raise
+        with self.__available:
+            self.__connections[self.__connections.index(None)] = connection
+            self.__checked[connection] = time.monotonic()
+        return connection
+
+    def release(self, connection: sqlite3.Connection) -> None:
+        """Give back a connection that is no longer used by its thread"""
+        with self.__available:
+            if self.__closed:
+                self.__forget(connection)
+                connection.close()
+                return
+            try:
+                if connection.in_transaction:
+                    connection.rollback()
+            except sqlite3.Error:
+                self.__forget(connection)
+                self.__available.notify()
+                return
+            self.__idle.append(connection)
+            self.__available.notify()
+
+    def __forget(self, connection: sqlite3.Connection) -> None:
+        self.__connections.remove(connection)
+        del self.__checked[connection]
+
+    def __check(self, connection: sqlite3.Connection) -> bool:
+        """Whether an idle connection works, tried at most every check_interval"""
+        now = time.monotonic()
+        if now - self.__checked[connection] <= self.check_interval:
+            return True
+        try:
+            connection.execute("SELECT 1").fetchone()
+        except sqlite3.Error:
+            return False
+        self.__checked[connection] = now
+        return True
+
+    def for_each(self, apply: Callable[[sqlite3.Connection], None]) -> None:
+        """Call apply with every open connection, idle or held by a thread"""
+        with self.__available:
+            connections = [c for c in self.__connections if c is not None]
+        for connection in connections:
+            apply(connection)
+
+    def size(self) -> int:
+        """Number of open connections"""
+        with self.__available:
+            return len(self.__connections)
+
+    def close(self) -> None:
+        """Close the idle connections. Leased ones are closed when released."""
+        with self.__available:
+            self.__closed = True
+            for connection in self.__idle:
+                self.__forget(connection)
+                connection.close()
+            self.__idle.clear()
+            self.__available.notify_all()
@@ -52,9 +52,13 @@ class Generator:
         return categories
 
     def save_categories(self, categories: List):
-        """Save given categories to repository"""
-        for category in categories:
-            self.repository.save_category(category)
+        """Save given categories to repository in a single transaction"""
+        result = self.repository.save_categories(categories, defer_indexes=True)
+        logger.info(
+            f"Saved {result.categories} categories and {result.items} items "
+            + f"in {result.seconds:.2f} s ({result.rows_per_second:.0f} rows/s)"
+        )
+        return result
 
 
 def load_categories_json(model_path, hook):
@@ -1,3 +1,4 @@
+import json
 import sys
 import sqlite3
 from datetime import datetime, timedelta
@@ -73,8 +74,8 @@ def create_category(database, category: Category):
 
 def get_recent(database: str, days: int, count: int):
     recent_day = (datetime.now() - timedelta(days=days)).strftime("%Y/%m/%d")
-    sql = f"SELECT * FROM Categories WHERE LastUse > '{ recent_day }' OR lastUse IS NULL ORDER BY LastUSE DESC LIMIT { count }"
-    return execute_sql_select(database, sql)
+    sql = "SELECT * FROM Categories WHERE LastUse > ? OR lastUse IS NULL ORDER BY LastUSE DESC LIMIT ?"
+    return execute_sql_select(database, sql, (recent_day, count))
     # try:
     #     connection = open_connection(database)
     #     connection.row_factory = sqlite3.Row
@@ -91,15 +92,13 @@ def get_recent(database: str, days: int, count: int):
 
 
 def get_recent_items(database: str, ids: List[int]):
-    sql = (
-        f"SELECT * FROM Items WHERE CategoryId IN ({','.join([str(id) for id in ids])})"
-    )
-    return execute_sql_select(database, sql)
+    sql = "SELECT * FROM Items WHERE CategoryId IN (SELECT value FROM json_each(?))"
+    return execute_sql_select(database, sql, (json.dumps(ids),))
 
 
 def get_item(database: str, item_id: int):
-    sql = f"SELECT * FROM Items WHERE Id = {item_id}"
-    return execute_sql_select(database, sql)
+    sql = "SELECT * FROM Items WHERE Id = ?"
+    return execute_sql_select(database, sql, (item_id,))
 
 
 def get_info(database: str) -> tuple:
@@ -108,12 +107,12 @@ def get_info(database: str) -> tuple:
     return info[0] if info is not None and len(info) > 0 else None
 
 
-def execute_sql_select(database: str, sql: str) -> dict:
+def execute_sql_select(database: str, sql: str, parameters=()) -> dict:
     try:
         connection = open_connection(database)
         connection.row_factory = sqlite3.Row
         cursor = connection.cursor()
-        cursor.execute(sql)
+        cursor.execute(sql, parameters)
         rows = cursor.fetchall()
         return [dict(row) for row in rows]
     except sqlite3.Error as db_error:
@@ -160,9 +159,11 @@ def update_views(database, updated_views):
             # cursor.executemany(cmd, [tp for tp in iter(updated_views)])
             # cursor.execute("commit")
 
-            for tp in iter(updated_views):
-                cmd = f"UPDATE Items SET LastUse = '{datetime.now().strftime('%Y/%m/%d')}', Views = {tp[0]} WHERE id = {tp[1]}"
-                cursor.execute(cmd)
+            last_use = datetime.now().strftime("%Y/%m/%d")
+            cursor.executemany(
+                "UPDATE Items SET LastUse = ?, Views = ? WHERE id = ?",
+                [(last_use, views, item_id) for views, item_id in updated_views],
+            )
 
             cursor.execute("commit")
 
@@ -32,6 +32,7 @@ class MaterialLoader:
         self.category_counter = 0
         self.groups = []
         self.groups_path = self.path.joinpath('groups.json')
+        self.version = 0  # Increased every time categories are loaded
 
     def load(self):
         ''' Launches a recursive search '''
@@ -41,6 +42,7 @@ class MaterialLoader:
         self.counter = 1
         self.categories = []
         self.load_from_dir(self.path)
+        self.version += 1
         return self.categories
 
     def load_from_dir(self, working_dir):
@@ -1,20 +1,34 @@
 """
     Material service
 """
-from copy import deepcopy
-from dataclasses import fields
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import fields, replace
 from datetime import datetime as dt
 
-from typing import List
+from typing import Iterator, List, Tuple
 
-from model import Category, Item
+from model import Batch, Category, Item
+from pagination import split_page
 from repository import Repository
+from view_order import ViewOrder
+from write_behind import ViewBuffer
+
+logger = logging.getLogger(__name__)
 
 
 class MaterialService:
-    def __init__(self, repository: Repository):
+    def __init__(
+        self,
+        repository: Repository,
+        view_buffer: ViewBuffer = None,
+        batch_workers: int = 0,
+    ):
 
         self.repository = repository
+        # Groups view updates into fewer transactions. None writes each one.
+        self.view_buffer = view_buffer
         self.recent_count = 5  # Max number of recently viewed categories to return.
         self.recent_days = 7  # Date range to look for recently viewed items, in days.
         self.batch_size = 5  # Max number of elements returned in a batch.
@@ -24,10 +38,32 @@ class MaterialService:
             True  # Set whether should update views counter for the same day.
         )
         self.categories = []
+        # View order of the items of recent categories, valid while the data
+        # version is the one they were read at, updated by update_batch
+        self.view_orders = {}
+        # Next batch of categories, items and completed flag, prepared by
+        # batch_workers threads after each update. Valid like the view orders.
+        self.ready_batches = {}
+        self.__orders_version = None
+        self.__orders_lock = threading.Lock()
+        self.__batch_workers = (
+            ThreadPoolExecutor(batch_workers, thread_name_prefix="next-batch")
+            if batch_workers
+            else None
+        )
+
+    def close(self) -> None:
+        """Stop preparing batches in the background"""
+        if self.__batch_workers is not None:
+            self.__batch_workers.shutdown()
 
     def get_info(self) -> tuple:
         return self.repository.get_info()
 
+    def data_version(self):
+        """Version of the stored data. Changes after every update."""
+        return self.repository.data_version()
+
     def get_all_categories(self) -> List[Category]:
         """Retrieve all categories in the database."""
         categories = []
@@ -38,34 +74,19 @@ class MaterialService:
 
     def get_all_items(self) -> List[Item]:
         """Retrieve all items in the database."""
-        items = []
-        rows = self.repository.all_items()
-        for row in rows:
-            items.append(self.item_from_row(row))
-        return items
+        return self.repository.load_items()
+
+    def iter_all_items(self) -> Iterator[Item]:
+        """Yield all items in the database as they are read."""
+        return self.repository.iter_item_objects()
 
     def get_item(self, item_id: int) -> Item:
         """Retrieve the item with the given id."""
-        items = self.repository.get_item(item_id)
-        return items[0] if len(items) > 0 else None
+        return self.repository.load_item(item_id)
 
     def get_category(self, category_id: int) -> Category:
         """Retrieve the category with the given id."""
-        rows = self.repository.category(category_id)
-        category = Category(
-            Id=category_id, Name=rows[0]["Name"], LastUse=rows[0]["c_LastUse"]
-        )
-        category.Items = [
-            Item(
-                Id=r["Id"],
-                Image=r["Image"],
-                LastUse=r["LastUse"],
-                Text=r["Text"],
-                Views=r["Views"],
-            )
-            for r in rows
-        ]
-        return category
+        return self.repository.load_category(category_id)
 
     # def get_category(self, category_id: int) -> Category:
     #     """Retrieve the category with the given id."""
@@ -85,33 +106,98 @@ class MaterialService:
     #     ]
     #     return category
 
-    def get_all_complete_categories(self):
-        ctgs = self.get_all_categories()
-        category_ids = [category.Id for category in ctgs]
-        categories = []
-        for category_id in category_ids:
-            categories.append(self.get_category(category_id))
-        return categories
+    def get_all_complete_categories(self) -> List[Category]:
+        """Retrieve all categories with their items using a single query."""
+        return self.repository.load_complete_categories()
+
+    def iter_complete_categories(self) -> Iterator[Category]:
+        """Yield every category with its items as soon as it is read."""
+        return self.repository.iter_category_objects()
 
-    def get_recent(self):
-        """Get recently viewed categories"""
-        recent_dict = self.repository.get_recent(self.recent_count)
-        recent = [self.map_to_category(rec) for rec in recent_dict]
+    def get_categories_page(
+        self, limit: int, after: int = 0
+    ) -> Tuple[List[Category], str]:
+        """Retrieve up to limit categories with their items, starting after the given Id.
 
-        # Load items for selected categories
-        ids = [x.Id for x in recent]
-        recent_items = self.repository.get_recent_items(ids)
-        for category in recent:
-            category.items = [
-                self.map_to_item(item)
-                for item in recent_items
-                if item["CategoryId"] == category.Id
-            ]
+        Return the categories and the cursor of the next page, None for the last one.
+        """
+        categories = self.repository.load_categories_page(limit + 1, after)
+        return split_page(categories, limit, lambda c: c.Id)
 
-        batches = [self.get_batch(category) for category in recent]
-        return batches
+    def get_items_page(self, limit: int, after: int = 0) -> Tuple[List[Item], str]:
+        """Retrieve up to limit items, starting after the given Id.
 
-        # return recent
+        Return the items and the cursor of the next page, None for the last one.
+        """
+        items = self.repository.load_items_page(limit + 1, after)
+        return split_page(items, limit, lambda i: i.Id)
+
+    def get_recent(self) -> List[Batch]:
+        """Get batches of the recently viewed categories.
+
+        Batches prepared after the last updates are used as they are.
+        """
+        recent = [
+            self.map_to_category(row)
+            for row in self.repository.get_recent(self.recent_count)
+        ]
+        with self.__orders_lock:
+            self.__check_version()
+            selections = {
+                category.Id: self.ready_batches[category.Id]
+                for category in recent
+                if category.Id in self.ready_batches
+            }
+        missing = [category.Id for category in recent if category.Id not in selections]
+        if missing:
+            orders = self.get_view_orders(missing)
+            for category_id in missing:
+                selections[category_id] = self.__next_batch(orders[category_id])
+        return [self.__batch(category, selections[category.Id]) for category in recent]
+
+    def get_view_orders(self, ids: List[int]) -> dict:
+        """View order of the items of each category, reading only those not known"""
+        with self.__orders_lock:
+            version = self.__check_version()
+            orders = {i: self.view_orders[i] for i in ids if i in self.view_orders}
+        missing = [i for i in ids if i not in orders]
+        if missing:
+            # Items of the categories, in a single pass over rows ordered by category
+            items_of = {category_id: [] for category_id in missing}
+            for category_id, item in self.repository.load_recent_items(missing):
+                items_of[category_id].append(item)
+            read = {i: ViewOrder(items) for i, items in items_of.items()}
+            with self.__orders_lock:
+                if self.__orders_version == version:
+                    self.view_orders.update(read)
+            orders.update(read)
+        return orders
+
+    def __check_version(self):
+        """Forget view orders and ready batches read from a previous version of
+        the data. Called holding the orders lock. Return the current version.
+        """
+        version = self.repository.data_version()
+        if version != self.__orders_version:
+            self.__forget_orders(version)
+        return version
+
+    def __forget_orders(self, version=None) -> None:
+        """Drop the view orders and ready batches, valid from now on at version"""
+        self.view_orders = {}
+        self.ready_batches = {}
+        self.__orders_version = version
+
+    def __prepare_batch(self, category_id: int) -> None:
+        """Compute the next batch of the category, for get_recent to use"""
+        try:
+            order = self.get_view_orders([category_id])[category_id]
+            with self.__orders_lock:
+                # Not if the order was replaced or forgotten meanwhile
+                if self.view_orders.get(category_id) is order:
+                    self.ready_batches[category_id] = self.__next_batch(order)
+        except Exception as error:
+            logger.error(f"Could not prepare the next batch of {category_id}: {error}")
 
     def category_from_row(self, row):
         category = Category(Id=row["Id"], Name=row["Name"], LastUse=row["LastUse"])
@@ -127,80 +213,157 @@ class MaterialService:
         )
         return item
 
-    def get_batch(self, category: Category):
-        """Build a new batch from the given category"""
-
-        batch = deepcopy(category)
-        # batch = Category(
-        #     id=category.id,
-        #     name=category.name,
-        #     items=category.items,
-        #     last_view=category.last_view,
-        # )
-
-        # Look for elements that have not reached max_views
-        to_view = self.to_view_items(batch)
-        # All elements have reached max_views. Mark as completed and terminate
-        if not to_view:
-            batch.completed = True
-            self.repository.mark_category_completed(category.id)
-            return batch
-
-        # Category has less or equal number of elements than batch size. The batch will be
-        # the category itself. Nothing to do.
-        if len(category.items) <= self.batch_size:
-            batch.items = category.items
-            return batch
-
-        sorted_items = sorted(category.items, key=lambda item: item.views, reverse=True)
-
-        # If no element has reached max_views, take the first batch_size elements
-        # When batch_size is greater or equal than the number of elements in the category,
-        # it will return all the words in the category.
-        if sorted_items[0].views < self.max_views:
-            batch.items = sorted_items[: self.batch_size]
-            return batch
-
-        # Position of the first element with views below max_views
-        pos = next(
-            (i for i, item in enumerate(sorted_items) if item.views < self.max_views),
-            None,
-        )
-        if pos > self.refresh_rate:
-            pos = pos - pos % self.refresh_rate
-        if len(sorted_items) - (pos + 1) >= self.batch_size:
-            batch.items = sorted_items[pos : pos + self.batch_size]
-        else:
-            batch.items = sorted_items[len(sorted_items) - self.batch_size :]
-        return batch
+    def get_batch(self, category: Category) -> Batch:
+        """Build a new batch from the given category.
 
-    def update_batch(self, batch):
-        """Increases by one the count of views of every item in the batch"""
-        try:
-            last_use = dt.now()
-            sql_update_category_use = (
-                f"UPDATE Categories SET LastUse = '{last_use}' WHERE Id = {batch.id}"
-            )
-            self.repository.execute_statement(sql_update_category_use)
+        The batch refers to the items of the category, none is copied.
+        """
+        return self.batch_from_order(category, ViewOrder(category.Items))
+
+    def batch_from_order(self, category: Category, order: ViewOrder) -> Batch:
+        """Build the next batch of category from the view order of its items"""
+        return self.__batch(category, self.__next_batch(order))
 
-            item_ids = [item.id for item in batch.items]
-            views = [item.views + 1 for item in batch.items]
-            updated_values = list(zip(views, item_ids))
+    def __next_batch(self, order: ViewOrder) -> Tuple[List[Item], bool]:
+        return order.next_batch(self.batch_size, self.max_views, self.refresh_rate)
 
-            sql = f"UPDATE Items SET LastUse = '{last_use}', Views = ? WHERE Id = ?"
-            self.repository.execute_many(sql, updated_values)
-            self.repository.commit()
+    def __batch(self, category: Category, selection: Tuple[List[Item], bool]) -> Batch:
+        # Completed when all elements have reached max_views. The stored flag
+        # is set by the update that brings them there, see __view.
+        items, completed = selection
+        return Batch.of(category, items, completed)
+
+    def update_batch(self, batch):
+        """Increases by one the count of views of every item in the batch.
+        The views sent with the items are never stored, and a warning is logged
+        when they differ from the known ones.
+        """
+        try:
+            self.__view(batch)
             return True
         except AttributeError as attr_error:
-            print(f"Attribute error: {attr_error.args}")
+            logger.error(f"Attribute error: {attr_error.args}")
             return False
         except Exception as exception:
-            print(f"Error: {exception.args}")
+            logger.error(f"Could not update batch: {exception.args}")
             return False
 
+    def update_and_get_next_batch(self, batch) -> Batch:
+        """Increase by one the count of views of every item in the batch and
+        build the next batch of its category, None if it has no items.
+
+        The category is read in the same transaction that adds the views, and
+        the batch built from its items. With a view buffer the items come from
+        the view order of the category, which has the views not yet written.
+        """
+        if self.view_buffer is not None:
+            category = self.get_category(batch.Id)
+            # Read before adding the views, which then move in it even if it
+            # is forgotten meanwhile
+            order = self.get_view_orders([batch.Id])[batch.Id]
+            self.__view(batch, order=order)
+            if category is None:
+                return None
+            return self.batch_from_order(category, order)
+        category = self.__view(batch, load=True)
+        if category is None:
+            return None
+        return self.batch_from_order(category, ViewOrder(category.Items))
+
+    def __view(self, batch, load: bool = False, order: ViewOrder = None) -> Category:
+        """Add the views of the batch and update the view order of its category.
+        The category is marked as completed when all its items reach max_views.
+        With load, return the category as left by the views. With a view
+        buffer, the views also move in the given order of the category.
+        """
+        last_use = dt.now()
+        item_ids = [item.Id for item in batch.Items]
+        category = None
+        with self.__orders_lock:
+            self.__check_client_views(batch)
+            if self.view_buffer is not None:
+                self.view_buffer.add(batch.Id, item_ids, last_use, self.max_views)
+                kept = self.view_orders.get(batch.Id)
+                self.__add_views(batch.Id, item_ids, last_use)
+                if order is not None and order is not kept:
+                    # Forgotten after it was read
+                    self.__move_views(order, item_ids, last_use)
+                self.__schedule_batch(batch.Id)
+                return None
+            before = self.repository.data_version()
+            categories = [(str(last_use), batch.Id)]
+            items = [(1, str(last_use), item_id) for item_id in item_ids]
+            completed = [(batch.Id, self.max_views)]
+            if load:
+                category = self.repository.update_views_and_load(
+                    categories, items, batch.Id, completed
+                )
+            else:
+                self.repository.update_views(categories, items, completed)
+            external, commits = before
+            after = (external, commits + 1)  # With this transaction as the only change
+            if self.__orders_version == before and self.repository.data_version() == after:
+                self.__orders_version = after
+            else:
+                # Something else changed too, or the orders were already outdated
+                self.__forget_orders()
+            if category is not None:
+                self.view_orders[batch.Id] = ViewOrder(category.Items)
+                self.ready_batches.pop(batch.Id, None)
+            else:
+                self.__add_views(batch.Id, item_ids, last_use)
+            self.__schedule_batch(batch.Id)
+        return category
+
+    def __check_client_views(self, batch) -> None:
+        """Warn about items whose views sent by the client are not the known
+        ones. Views are always added by the database and these are ignored:
+        they differ when other clients viewed the category meanwhile, but also
+        when the client expects them to be stored.
+        """
+        order = self.view_orders.get(batch.Id)
+        if order is None:
+            return
+        differing = [
+            item.Id
+            for item in batch.Items
+            if order.get(item.Id) is not None and order.get(item.Id).Views != item.Views
+        ]
+        if differing:
+            logger.warning(
+                f"Views sent for items {differing} of category {batch.Id} "
+                + "differ from the stored ones and are ignored"
+            )
+
+    def __schedule_batch(self, category_id: int) -> None:
+        """Prepare the next batch of the category in the background"""
+        if self.__batch_workers is not None:
+            self.__batch_workers.submit(self.__prepare_batch, category_id)
+
+    def __add_views(self, category_id: int, item_ids: List[int], last_use) -> None:
+        """Move viewed items of the category in its view order"""
+        self.ready_batches.pop(category_id, None)
+        order = self.view_orders.get(category_id)
+        if order is not None:
+            self.__move_views(order, item_ids, last_use)
+
+    @staticmethod
+    def __move_views(order: ViewOrder, item_ids: List[int], last_use) -> None:
+        for item_id in item_ids:
+            item = order.get(item_id)
+            if item is not None:
+                # Items may be shared with cached results: replace, do not modify
+                order.update(replace(item, Views=item.Views + 1, LastUse=last_use))
+
+    def batch_from_json(self, data: dict) -> Category:
+        """Category of a batch sent by a client, with the items it shows"""
+        batch = self.map_from_dictionary(Category, data)
+        batch.Items = [self.map_from_dictionary(Item, item) for item in batch.Items]
+        return batch
+
     def to_view_items(self, category: Category) -> List[Item]:
         """Return items in the category that have not yet reached max_views"""
-        return [item for item in category.items if item.views < self.max_views]
+        return [item for item in category.Items if item.Views < self.max_views]
 
     def create_database(self) -> None:
         # db.run_script(database, "material_database.sql")
@@ -215,13 +378,13 @@ class MaterialService:
         return class_name(**args)
 
     def map_to_category(self, dct: dict) -> Category:
-        return Category(name=dct["Name"], last_view=dct["LastUse"], id=dct["Id"])
+        return Category(Name=dct["Name"], LastUse=dct["LastUse"], Id=dct["Id"])
 
     def map_to_item(self, dct: dict) -> Item:
         return Item(
-            text=dct["Text"],
-            last_view=dct["LastUse"],
-            views=dct["Views"],
-            image=dct["Image"],
-            id=dct["Id"],
+            Text=dct["Text"],
+            LastUse=dct["LastUse"],
+            Views=dct["Views"],
+            Image=dct["Image"],
+            Id=dct["Id"],
         )
@@ -0,0 +1,265 @@
+"""
+    Request metrics exposed in Prometheus text format.
+
+    Every server thread records into its own shard, so recording a request
+    takes no lock. Shards are only added up when the metrics are rendered.
+"""
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+from flask import request
+
+# Upper bounds of the request duration histogram, in seconds.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Upper bounds of the response size histogram, in bytes.
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Content type of the rendered metrics.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Environ key where the endpoint that handled the request is stored.
+ENDPOINT_KEY = "metrics.endpoint"
+
+# Label of requests that did not match any route.
+UNMATCHED = "none"
+
+
+class Histogram:
+    """Counts of observations per bucket, with their sum"""
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def add(self, other: "Histogram") -> None:
+        for position, count in enumerate(other.counts):
+            self.counts[position] += count
+        self.sum += other.sum
+
+
+class Shard:
+    """Metrics recorded by a single thread"""
+
+    def __init__(self):
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.durations: Dict[str, Histogram] = {}
+        self.sizes: Dict[str, Histogram] = {}
+        self.in_flight = 0
+
+
+class Metrics:
+    """Request counts, duration and size histograms per endpoint, and requests in flight"""
+
+    def __init__(
+        self,
+        latency_buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+        size_buckets: Tuple[int, ...] = SIZE_BUCKETS,
+    ):
+        self.latency_buckets = latency_buckets
+        self.size_buckets = size_buckets
+        self.__local = threading.local()
+        self.__shards: List[Shard] = []
+        self.__lock = threading.Lock()  # Only taken when a thread adds its shard
+
+    def shard(self) -> Shard:
+        """Shard of the current thread"""
+        shard = getattr(self.__local, "shard", None)
+        if shard is None:
+            shard = self.__local.shard = Shard()
+            with self.__lock:
+                self.__shards.append(shard)
+        return shard
+
+    def record(
+        self, endpoint: str, method: str, status: str, seconds: float, size: int
+    ) -> None:
+        """Record a finished request"""
+        shard = self.shard()
+        key = (endpoint, method, status)
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+        durations = shard.durations.get(endpoint)
+        if durations is None:
+            durations = shard.durations[endpoint] = Histogram(self.latency_buckets)
+            shard.sizes[endpoint] = Histogram(self.size_buckets)
+        durations.observe(seconds)
+        shard.sizes[endpoint].observe(size)
+
+    def collect(self) -> Shard:
+        """All the shards added up"""
+        with self.__lock:
+            shards = list(self.__shards)
+        total = Shard()
+        for shard in shards:
+            total.in_flight += shard.in_flight
+            for key, count in list(shard.requests.items()):
+                total.requests[key] = total.requests.get(key, 0) + count
+            for histograms, buckets, totals in (
+                (shard.durations, self.latency_buckets, total.durations),
+                (shard.sizes, self.size_buckets, total.sizes),
+            ):
+                for endpoint, histogram in list(histograms.items()):
+                    totals.setdefault(endpoint, Histogram(buckets)).add(histogram)
+        return total
+
+    def render(self) -> str:
+        """Metrics in Prometheus text exposition format"""
+        total = self.collect()
+        lines = [
+            "# HELP http_requests_total Requests handled by endpoint, method and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (endpoint, method, status), count in sorted(total.requests.items()):
+            labels = _labels(endpoint=endpoint, method=method, status=status)
+            lines.append(f"http_requests_total{{{labels}}} {count}")
+        lines.extend(
+            _histogram_lines(
+                "http_request_duration_seconds",
+                "Time until the response was sent, by endpoint.",
+                total.durations,
+            )
+        )
+        lines.extend(
+            _histogram_lines(
+                "http_response_size_bytes",
+                "Bytes of response body sent, by endpoint.",
+                total.sizes,
+            )
+        )
+        lines.append("# HELP http_requests_in_flight Requests being handled.")
+        lines.append("# TYPE http_requests_in_flight gauge")
+        lines.append(f"http_requests_in_flight {total.in_flight}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items())
+
+
+def _bound(value: float) -> str:
+    return "+Inf" if value == float("inf") else str(value)
+
+
+def _histogram_lines(
+    name: str, description: str, histograms: Dict[str, Histogram]
+) -> Iterable[str]:
+    yield f"# HELP {name} {description}"
+    yield f"# TYPE {name} histogram"
+    for endpoint, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+            cumulative += count
+            labels = _labels(endpoint=endpoint, le=_bound(bound))
+            yield f"{name}_bucket{{{labels}}} {cumulative}"
+        labels = _labels(endpoint=endpoint)
+        yield f"{name}_sum{{{labels}}} {histogram.sum}"
+        yield f"{name}_count{{{labels}}} {cumulative}"
+
+
+class MetricsMiddleware:
+    """
+    WSGI middleware recording the requests of a Flask application, including
+    those of its blueprints. A request is recorded once its body has been sent,
+    so streamed responses count their whole duration.
+    """
+
+    def __init__(self, app, metrics: Metrics):
+        self.wsgi_app = app.wsgi_app
+        self.metrics = metrics
+        app.before_request(self.__store_endpoint)
+        app.wsgi_app = self
+
+    @staticmethod
+    def __store_endpoint():
+        request.environ[ENDPOINT_KEY] = request.endpoint
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        shard = self.metrics.shard()
+        shard.in_flight += 1
+        status = ["500"]
+        headers = [()]
+
+        def recording_start_response(response_status, response_headers, *args):
+            status[0] = response_status.split(" ", 1)[0]
+            headers[0] = response_headers
+            return start_response(response_status, response_headers, *args)
+
+        def finish(size):
+            shard.in_flight -= 1
+            self.metrics.record(
+                environ.get(ENDPOINT_KEY) or UNMATCHED,
+                environ.get("REQUEST_METHOD", ""),
+                status[0],
+                time.perf_counter() - started,
+                size,
+            )
+
+        try:
+            app_iter = self.wsgi_app(environ, recording_start_response)
+        except Exception:
+            finish(0)
+            raise
+        file_wrapper = environ.get("wsgi.file_wrapper")
+        if isinstance(file_wrapper, type) and isinstance(app_iter, file_wrapper):
+            # Keep the server's own file sending. The body is sent after this
+            # returns, so the duration only covers building the response.
+            finish(_content_length(headers[0]))
+            return app_iter
+        return RecordingIterable(app_iter, finish)
+
+
+def _content_length(headers) -> int:
+    for name, value in headers:
+        if name.lower() == "content-length":
+            return int(value)
+    return 0
+
+
+class RecordingIterable:
+    """Response body that reports the bytes sent once the server closes it.
+
+    The request is also reported when the body has been sent in full without
+    being closed, or with no bytes sent when the server drops the body.
+    """
+
+    def __init__(self, app_iter, finish):
+        self.app_iter = app_iter
+        self.size = 0
+        # Runs finish(0) if the body is collected before being reported
+        self.__finalizer = weakref.finalize(self, finish, 0)
+
+    def __finish(self):
+        pending = self.__finalizer.detach()
+        if pending is not None:
+            _, finish, _, _ = pending
+            finish(self.size)
+
+    def __iter__(self):
+        try:
+            for chunk in self.app_iter:
+                self.size += len(chunk)
+                yield chunk
+        finally:
+            self.__finish()
+
+    def close(self):
+        try:
+            if hasattr(self.app_iter, "close"):
+                self.app_iter.close()
+        finally:
+            self.__finish()
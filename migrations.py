@@ -0,0 +1,57 @@
+"""
+    Versioned schema migrations.
+
+    PRAGMA user_version holds the number of migrations applied to a database.
+    migrate() runs the ones still missing, each in its own transaction with the
+    version update, so an existing database is upgraded in place and a failed
+    migration leaves it at the previous version.
+
+    Migrations are only appended: a released one is never changed.
+"""
+import sqlite3
+from typing import List, Sequence
+
+# Material database, created by Material_database.sql
+MATERIAL_MIGRATIONS: List[Sequence[str]] = [
+    # 1. Items of a category: category(), load_recent_items() and the join of
+    #    all categories with their items, which reads them ordered by Id.
+    #    Recent categories: ORDER BY LastUse DESC LIMIT reads the index backwards.
+    (
+        'CREATE INDEX IF NOT EXISTS "Items_CategoryId" ON "Items" ("CategoryId", "Id")',
+        'CREATE INDEX IF NOT EXISTS "Categories_LastUse" ON "Categories" ("LastUse")',
+    ),
+]
+
+# Vocabulary database, created by DBWords
+WORDS_MIGRATIONS: List[Sequence[str]] = [
+    # 1. Words of a category: select_category() and get_words_for_categories().
+    #    Recent categories: get_recent().
+    (
+        "CREATE INDEX IF NOT EXISTS Words_categoryId ON Words (categoryId, lastUse)",
+        "CREATE INDEX IF NOT EXISTS Categories_lastUse ON Categories (lastUse)",
+    ),
+]
+
+
+def schema_version(connection: sqlite3.Connection) -> int:
+    """Number of migrations applied to the database"""
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(connection: sqlite3.Connection, migrations: List[Sequence[str]]) -> int:
+    """Apply the migrations missing in the database. Return the resulting version."""
+    version = schema_version(connection)
+    if connection.in_transaction:
+        connection.commit()
+    for number, statements in enumerate(migrations[version:], version + 1):
+        connection.execute("BEGIN")
+        try:
+            for statement in statements:
+                connection.execute(statement)
+            connection.execute(f"PRAGMA user_version = {number}")
+        except sqlite3.Error:
+            connection.rollback()
+            raise
+        connection.commit()
+        version = number
+    return version
@@ -1,7 +1,7 @@
 """ Model """
 import datetime
 from dataclasses import dataclass, field
-from typing import List
+from typing import List, Sequence, Tuple
 import inspect
 
 
@@ -28,6 +28,34 @@ class Category:
     Id: int = field(default=0)
 
 
+@dataclass(frozen=True, slots=True)
+class Batch:
+    """Items of a category to view next.
+
+    Refers to the Item objects of the category instead of copying them. Fields
+    are those of Category, so a batch is encoded like the category would be.
+    """
+
+    Name: str
+    Items: Tuple[Item, ...]
+    LastUse: datetime.datetime = None
+    Completed: bool = False
+    Type: int = 0
+    Id: int = 0
+
+    @classmethod
+    def of(cls, category: Category, items: Sequence[Item], completed: bool = False):
+        """Batch of the given items of category"""
+        return cls(
+            category.Name,
+            tuple(items),
+            category.LastUse,
+            completed or category.Completed,
+            category.Type,
+            category.Id,
+        )
+
+
 @dataclass
 class ItemDb:
     text: str
@@ -1,5 +1,7 @@
+from dataclasses import fields, is_dataclass
 from datetime import date
 from json import JSONEncoder
+from werkzeug.http import http_date
 import model
 
 
@@ -11,5 +13,18 @@ class ModelEncoder(JSONEncoder):
             return o.__dict__
         if isinstance(o, model.Item):
             return o.__dict__
+        if isinstance(o, model.Batch):
+            return {f.name: getattr(o, f.name) for f in fields(o)}
 
         return super().default(o)
+
+
+class ResponseEncoder(JSONEncoder):
+    """Encoder for API responses. Dataclasses as objects and dates as HTTP dates."""
+
+    def default(self, o):
+        if isinstance(o, date):
+            return http_date(o)
+        if is_dataclass(o):
+            return {f.name: getattr(o, f.name) for f in fields(o)}
+        return super().default(o)
@@ -0,0 +1,29 @@
+"""
+    Keyset pagination helpers.
+
+    Pages are read with "Id > cursor ORDER BY Id LIMIT limit + 1". The extra
+    row tells whether there is a next page, whose cursor is the Id of the last
+    element returned.
+"""
+from typing import Callable, List, Tuple
+
+# Max number of elements returned in a page.
+MAX_PAGE_SIZE = 1000
+
+
+def split_page(rows: List, limit: int, key: Callable) -> Tuple[List, str]:
+    """Split rows read with limit + 1 into the page and the cursor of the next one"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, str(key(rows[-1]))
+
+
+def parse_cursor(cursor: str) -> int:
+    """Id after which the page starts. No cursor starts from the beginning."""
+    if cursor is None or cursor == "":
+        return 0
+    after = int(cursor)
+    if after < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return after
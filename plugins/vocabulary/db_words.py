@@ -3,19 +3,89 @@
 """
 import logging
 import csv
+import functools
+import json
+from contextlib import nullcontext
 from datetime import datetime, timedelta
 import sqlite3
+import threading
+
+from connection_pool import ConnectionPool, memory_database_uri
+from migrations import WORDS_MIGRATIONS, migrate
+from storage_profile import StorageProfile, WriterThread
 
 
 logger = logging.getLogger(__name__)
 
+# Prepared statements kept by each connection. Statements take their values as
+# parameters, lists of ids as a JSON array read with json_each.
+STATEMENT_CACHE_SIZE = 256
 
-class DBWords:
-    """ CRUD operations for sqlite database. """
+# Columns of a category that update_category can change
+CATEGORY_COLUMNS = ("name", "lastUse")
+
+# Format of the lastUse columns, as written by str(datetime)
+LAST_USE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def parse_last_use(value):
+    """ Datetime of a stored lastUse value, None when not set """
+    if value is None:
+        return None
+    return datetime.strptime(value, LAST_USE_FORMAT)
+
+
+def writes(method):
+    """ Run the method in the writer thread when the storage profile has one,
+        and count it as a write once it returns
+    """
+
+    @functools.wraps(method)
+    def write(self, *args, **kwargs):
+        try:
+            if self.writer is None:
+                return method(self, *args, **kwargs)
+            return self.writer.call(method, self, *args, **kwargs)
+        finally:
+            self.count_write()
+
+    return write
+
+
+def reads(method):
+    """ Run the method with a reader connection leased from the pool for as
+        long as it runs, when the storage profile has a reader pool
+    """
+
+    @functools.wraps(method)
+    def read(self, *args, **kwargs):
+        with self.lease_reader():
+            return method(self, *args, **kwargs)
 
-    def __init__(self, database):
+    return read
+
+
+class DBWords:
+    """ CRUD operations for sqlite database.
+
+        Writes use connection. With a profile that has a reader pool, reads
+        lease a connection of the pool while they run instead, see
+        storage_profile.
+    """
+
+    def __init__(self, database, profile: StorageProfile = None):
+        self.profile = profile or StorageProfile()
+        self.__uri = False
+        if self.profile.reader_pool and database == ":memory:":
+            # Readers and writer open the same in-memory database
+            database = memory_database_uri()
+            self.__uri = True
         self.database = database
         self.__connection = None
+        self.__readers = None
+        self.writer = WriterThread("words-writer") if self.profile.writer_thread else None
+        self.writes = 0  # Number of write methods run
+        self.__writes_lock = threading.Lock()
 
     @property
     def connection(self):
@@ -25,15 +95,50 @@ class DBWords:
             self.check_database(self.__connection)
         return self.__connection
 
+    @property
+    def reader(self):
+        """ Get database connection for reading, inside lease_reader """
+        if not self.profile.reader_pool:
+            return self.connection
+        return self.__reader_pool().connection()
+
+    def lease_reader(self):
+        """ Context holding the connection that reader returns """
+        if not self.profile.reader_pool:
+            return nullcontext(self.connection)
+        return self.__reader_pool().lease()
+
+    def __reader_pool(self):
+        if self.__readers is None:
+            self.connection  # Tables exist before the first read
+            self.__readers = ConnectionPool(self.open_reader)
+        return self.__readers
+
+    def data_version(self):
+        """ Value that changes whenever the content of the database changes.
+
+            PRAGMA data_version of the writing connection tracks commits from
+            other connections, and the write counter the ones made here: each
+            write method adds exactly one to it.
+        """
+        row = self.connection.execute("PRAGMA data_version").fetchone()
+        return (row[0], self.writes)
+
+    def count_write(self):
+        """ Count a write in data_version """
+        with self.__writes_lock:
+            self.writes += 1
+
+    @reads
     def select_category(self, category_id):
-        self.connection.row_factory = sqlite3.Row
-        cursor = self.connection.cursor()
-        sql = f"SELECT C.id as c_id, name as c_name, C.lastUse as c_lastUse, \
+        self.reader.row_factory = sqlite3.Row
+        cursor = self.reader.cursor()
+        sql = "SELECT C.id as c_id, name as c_name, C.lastUse as c_lastUse, \
                         W.id as w_id, word as w_word, W.lastUse as w_lastUse, views as w_views \
                     FROM Categories C \
                     INNER JOIN Words W ON C.id = W.categoryId \
-                    WHERE C.id = {category_id}"
-        cursor.execute(sql)
+                    WHERE C.id = ?"
+        cursor.execute(sql, (category_id,))
         rows = cursor.fetchall()
         cursor.close()
         ddata = [dict(row) for row in rows]
@@ -41,14 +146,8 @@ class DBWords:
             return None
         # TODO: Move this code to a custom row factory
         for data in ddata:
-            if data["c_lastUse"] is not None:
-                data["c_lastUse"] = datetime.strptime(
-                    data["c_lastUse"], "%Y-%m-%d %H:%M:%S.%f"
-                )
-            if data["w_lastUse"] is not None:
-                data["w_lastUse"] = datetime.strptime(
-                    data["w_lastUse"], "%Y-%m-%d %H:%M:%S.%f"
-                )
+            data["c_lastUse"] = parse_last_use(data["c_lastUse"])
+            data["w_lastUse"] = parse_last_use(data["w_lastUse"])
         category = {k[2:]: ddata[0][k]
                     for k in ddata[0].keys() if k.startswith("c_")}
         words = []
@@ -58,11 +157,12 @@ class DBWords:
         category["words"] = words
         return category
 
+    @reads
     def select_categories(self):
         """ Retrieve all categories """
         try:
-            self.connection.row_factory = sqlite3.Row
-            cursor = self.connection.cursor()
+            self.reader.row_factory = sqlite3.Row
+            cursor = self.reader.cursor()
             cursor.execute("SELECT * FROM Categories")
             rows = cursor.fetchall()
             return [dict(row) for row in rows]
@@ -70,6 +170,33 @@ class DBWords:
             logger.error(db_error.args[0])
             raise Exception(db_error.args[0])
 
+    def select_categories_page(self, limit, after=0):
+        """ Retrieve up to limit categories with id greater than after """
+        return self.select_page(
+            "SELECT * FROM Categories WHERE id > ? ORDER BY id LIMIT ?", limit, after
+        )
+
+    def select_words_page(self, limit, after=0):
+        """ Retrieve up to limit words with id greater than after """
+        return self.select_page(
+            "SELECT * FROM Words WHERE id > ? ORDER BY id LIMIT ?", limit, after
+        )
+
+    @reads
+    def select_page(self, sql, limit, after):
+        """ Run a keyset page query taking the last id read and the page size """
+        try:
+            self.reader.row_factory = sqlite3.Row
+            cursor = self.reader.cursor()
+            cursor.execute(sql, (after, limit))
+            rows = cursor.fetchall()
+            cursor.close()
+            return [dict(row) for row in rows]
+        except sqlite3.Error as db_error:
+            logger.error(db_error.args[0])
+            raise Exception(db_error.args[0])
+
+    @writes
     def create_category(self, category):
         try:
             cursor = self.connection.cursor()
@@ -96,30 +223,37 @@ class DBWords:
             logger.error(db_error.args[0])
             raise Exception(db_error.args[0])
 
+    @writes
     def update_category(self, category):
+        """ Update the name and lastUse of the category, those it has """
+        columns = [c for c in CATEGORY_COLUMNS if c in category]
+        if not columns:
+            return
         try:
             cursor = self.connection.cursor()
-            sql = f'UPDATE Categories \
-                    SET name = {category["name"]}, SET lastUsed = {category["lastUse"]} \
-                    WHERE id = category["id"]'
-            cursor.execute(sql)
+            assignments = ", ".join(f"{column} = ?" for column in columns)
+            sql = f"UPDATE Categories SET {assignments} WHERE id = ?"
+            cursor.execute(
+                sql, [category[column] for column in columns] + [category["id"]])
             self.connection.commit()
         except sqlite3.Error as db_error:
             logger.error(db_error.args[0])
             raise Exception(db_error.args[0])
 
+    @writes
     def delete_category(self, category_id):
         try:
             cursor = self.connection.cursor()
-            sql = f"DELETE FROM Categories WHERE id = {category_id}"
-            cursor.execute(sql)
-            sql = f"DELETE FROM Words WHERE categoryId = {category_id}"
-            cursor.execute(sql)
+            sql = "DELETE FROM Categories WHERE id = ?"
+            cursor.execute(sql, (category_id,))
+            sql = "DELETE FROM Words WHERE categoryId = ?"
+            cursor.execute(sql, (category_id,))
             self.connection.commit()
         except sqlite3.Error as db_error:
             logger.error(db_error.args[0])
             raise Exception(db_error.args[0])
 
+    @writes
     def update_words(self, words):
         try:
             cursor = self.connection.cursor()
@@ -133,18 +267,19 @@ class DBWords:
             logger.error(db_error.args[0])
             raise Exception(db_error.args[0])
 
+    @writes
     def delete_words(self, words):
         try:
             cursor = self.connection.cursor()
-            ids = str([item["id"] for item in words]).replace(
-                "[", "").replace("]", "")
-            sql = f"DELETE FROM Words WHERE id IN ({ids})"
-            cursor.execute(sql)
+            ids = json.dumps([item["id"] for item in words])
+            sql = "DELETE FROM Words WHERE id IN (SELECT value FROM json_each(?))"
+            cursor.execute(sql, (ids,))
             self.connection.commit()
         except sqlite3.Error as db_error:
             logger.error(db_error.args[0])
             raise Exception(db_error.args[0])
 
+    @writes
     def create_words(self, words, category_id):
         try:
             cursor = self.connection.cursor()
@@ -164,6 +299,7 @@ class DBWords:
             logger.error(db_error.args[0])
             raise Exception(db_error.args[0])
 
+    @reads
     def get_recent(self, days, count):
         """ Return categories used recently.
 
@@ -176,37 +312,39 @@ class DBWords:
         """
 
         try:
-            self.connection.row_factory = sqlite3.Row
-            cursor = self.connection.cursor()
+            self.reader.row_factory = sqlite3.Row
+            cursor = self.reader.cursor()
             recent_day = (datetime.today() + timedelta(days=-days)
                           ).strftime("%Y-%m-%d")
-            sql = f"SELECT * FROM Categories \
-                WHERE lastUse > '{recent_day}' OR lastUse IS Null\
-                ORDER BY lastUSE DESC LIMIT {count}"
-            cursor.execute(sql)
+            sql = "SELECT * FROM Categories \
+                WHERE lastUse > ? OR lastUse IS Null\
+                ORDER BY lastUSE DESC LIMIT ?"
+            cursor.execute(sql, (recent_day, count))
             rows = cursor.fetchall()
             return [dict(row) for row in rows]
         except sqlite3.Error as error:
             logger.error(error.args[0])
 
+    @writes
     def update_views(self, batch):
         try:
             self.connection.row_factory = sqlite3.Row
             cursor = self.connection.cursor()
-            today = datetime.today()
-            ids = ",".join(map(str, [w["id"] for w in batch["words"]]))
-            sql = f"UPDATE words SET views = views + 1, lastUse = '{today}' WHERE id IN ({ids})"
-            cursor.execute(sql)
-            sql = f"UPDATE categories SET lastUse = '{today}' WHERE id = {batch['id']}"
-            cursor.execute(sql)
+            today = str(datetime.today())
+            ids = json.dumps([w["id"] for w in batch["words"]])
+            sql = "UPDATE words SET views = views + 1, lastUse = ? \
+                WHERE id IN (SELECT value FROM json_each(?))"
+            cursor.execute(sql, (today, ids))
+            sql = "UPDATE categories SET lastUse = ? WHERE id = ?"
+            cursor.execute(sql, (today, batch["id"]))
             self.connection.commit()
 
-            sql = f"SELECT * FROM Words WHERE id IN ({ids})"
-            cursor.execute(sql)
+            sql = "SELECT * FROM Words WHERE id IN (SELECT value FROM json_each(?))"
+            cursor.execute(sql, (ids,))
             rows = cursor.fetchall()
             words = [dict(row) for row in rows]
-            sql = f"SELECT * FROM Categories WHERE id = {batch['id']}"
-            cursor.execute(sql)
+            sql = "SELECT * FROM Categories WHERE id = ?"
+            cursor.execute(sql, (batch["id"],))
             row = cursor.fetchone()
             cursor.close()
 
@@ -216,14 +354,16 @@ class DBWords:
         except sqlite3.Error as error:
             logger.error(error.args[0])
 
+    @reads
     def get_words_for_categories(self, ids):
+        """ Retrieve the words of the categories with the given ids """
         try:
-            self.connection.row_factory = sqlite3.Row
-            cursor = self.connection.cursor()
-            sql = f"SELECT * FROM Words \
-                    WHERE categoryId in ({ids}) \
+            self.reader.row_factory = sqlite3.Row
+            cursor = self.reader.cursor()
+            sql = "SELECT * FROM Words \
+                    WHERE categoryId in (SELECT value FROM json_each(?)) \
                     ORDER BY lastUse DESC"
-            cursor.execute(sql)
+            cursor.execute(sql, (json.dumps(list(ids)),))
             rows = cursor.fetchall()
             return [dict(row) for row in rows]
         except sqlite3.Error as error:
@@ -231,16 +371,43 @@ class DBWords:
 
     def open_connection(self):
         try:
-            return sqlite3.connect(self.database, check_same_thread=False)
+            connection = sqlite3.connect(
+                self.database,
+                check_same_thread=False,
+                uri=self.__uri,
+                cached_statements=STATEMENT_CACHE_SIZE,
+            )
+            self.profile.apply(connection)
+            return connection
         except sqlite3.Error as db_error:
             logger.error(db_error.args[0])
             raise Exception(db_error.args[0])
 
+    def open_reader(self):
+        """ Open a connection of the reader pool """
+        connection = self.open_connection()
+        connection.row_factory = sqlite3.Row
+        if self.__uri:
+            # Like a single connection, see the changes not yet committed
+            connection.execute("PRAGMA read_uncommitted = 1")
+        return connection
+
+    def close(self):
+        """ Finish the pending writes and close the connections """
+        if self.writer is not None:
+            self.writer.close()
+        if self.__readers is not None:
+            self.__readers.close()
+        if self.__connection is not None:
+            self.__connection.close()
+
     def check_database(self, connection):
-        """ Create tables in the database if they do not exist.
+        """ Create tables in the database if they do not exist, and bring
+            the schema up to date with the migrations.
         """
 
         try:
+            created = False
             cursor = connection.cursor()
             sql = """
                 SELECT name FROM sqlite_master
@@ -250,6 +417,7 @@ class DBWords:
             row = cursor.fetchone()
             if row is None:
                 self.create_categories_table(connection)
+                created = True
 
             sql = """
                 SELECT name FROM sqlite_master
@@ -259,6 +427,12 @@ class DBWords:
             row = cursor.fetchone()
             if row is None:
                 self.create_words_table(connection)
+                created = True
+
+            if created:
+                # Indexes of the new tables have to be created again
+                connection.execute("PRAGMA user_version = 0")
+            migrate(connection, WORDS_MIGRATIONS)
 
         except sqlite3.Error as db_error:
             logger.error(db_error.args[0])
@@ -305,6 +479,7 @@ class DBWords:
             logger.error(db_error.args[0])
             raise Exception(db_error.args[0])
 
+    @writes
     def load_csv(self, csv_file):
         """ Load data from a csv file."""
         rows = []
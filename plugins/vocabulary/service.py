@@ -2,17 +2,22 @@
     Vocabulary service
 """
 
+import threading
+from operator import itemgetter
+
 from loginit import logger
-from plugins.vocabulary.db_words import DBWords
+from pagination import split_page
+from plugins.vocabulary.db_words import DBWords, parse_last_use
+from view_order import ViewOrder
 
 
 class Service:
     """ Vocabulary service"""
 
-    def __init__(self, database=None):
+    def __init__(self, database=None, profile=None):
         super().__init__()
 
-        self.db_words = DBWords(database)
+        self.db_words = DBWords(database, profile)
 
         # Max number of recently viewed categories to return.
         self.recent_count = 5
@@ -26,11 +31,43 @@ class Service:
         self.refresh_rate = 3
         # Set whether should update views counter for the same day.
         self.same_day_count = True
+        # Categories and the view order of their words, by category id. Valid
+        # while the data version is the one they were read at, updated by
+        # update_views.
+        self.view_orders = {}
+        self.__orders_version = None
+        self.__orders_lock = threading.Lock()
+
+    def data_version(self):
+        """ Version of the stored data. Changes after every update."""
+        return self.db_words.data_version()
 
     def get_categories(self):
         """ Retrieve all categories."""
         return self.db_words.select_categories()
 
+    def get_categories_page(self, limit, after=0):
+        """ Retrieve up to limit categories starting after the given id.
+
+            Return:
+
+                list(dict), str. Categories and cursor of the next page,
+                None for the last one
+        """
+        rows = self.db_words.select_categories_page(limit + 1, after)
+        return split_page(rows, limit, lambda c: c["id"])
+
+    def get_words_page(self, limit, after=0):
+        """ Retrieve up to limit words starting after the given id.
+
+            Return:
+
+                list(dict), str. Words and cursor of the next page,
+                None for the last one
+        """
+        rows = self.db_words.select_words_page(limit + 1, after)
+        return split_page(rows, limit, lambda w: w["id"])
+
     def get_category(self, category_id):
         """ Retrieve a category by id."""
         return self.db_words.select_category(category_id)
@@ -106,9 +143,64 @@ class Service:
                 words: string Comma separated list of words
         """
 
-        updated = self.db_words.update_views(batch)
+        with self.__orders_lock:
+            before = self.data_version()
+            updated = self.db_words.update_views(batch)
+            external, writes = before
+            after = (external, writes + 1)  # With this update as the only change
+            if (
+                    updated is not None
+                    and self.__orders_version == before
+                    and self.data_version() == after
+            ):
+                self.__orders_version = after
+                self.__add_views(updated)
+            else:
+                # Not written, something else changed too, or already outdated
+                self.__forget_orders()
         return updated
 
+    def __add_views(self, updated):
+        """ Move the updated words of the category in its view order """
+        entry = self.view_orders.get(updated["id"])
+        if entry is None:
+            return
+        _, order = entry
+        for word in updated["words"]:
+            current = order.get(word["id"])
+            # Words of other categories are not in the order
+            if current is not None:
+                # Same keys and types as the words read by select_category
+                order.update(dict(
+                    current,
+                    views=word["views"],
+                    lastUse=parse_last_use(word["lastUse"])))
+
+    def __forget_orders(self, version=None):
+        """ Drop the view orders, valid from now on at version """
+        self.view_orders = {}
+        self.__orders_version = version
+
+    def get_view_order(self, category_id):
+        """ Category and view order of its words, read only when not known.
+            None if the category does not exist or has no words.
+        """
+        with self.__orders_lock:
+            version = self.data_version()
+            if version != self.__orders_version:
+                self.__forget_orders(version)
+            entry = self.view_orders.get(category_id)
+        if entry is not None:
+            return entry
+        category = self.db_words.select_category(category_id)
+        if category is None:
+            return None
+        entry = (category, self.__view_order(category))
+        with self.__orders_lock:
+            if self.__orders_version == version:
+                self.view_orders[category_id] = entry
+        return entry
+
     def get_recent(self):
         """Get recently used categories.
 
@@ -134,49 +226,38 @@ class Service:
         return recent
 
     def build_batch_from_category_id(self, category_id):
-        """ Build a new batch from a category."""
-        category = self.db_words.select_category(category_id)
-        return self.build_batch_from_category(category)
+        """ Build a new batch from a category, from its known view order.
+            None if the category has no words.
+        """
+        entry = self.get_view_order(category_id)
+        if entry is None:
+            return None
+        return self.build_batch_from_order(*entry)
 
     def build_batch_from_category(self, category):
         """ Build a new batch from the given category."""
+        return self.build_batch_from_order(category, self.__view_order(category))
+
+    def build_batch_from_order(self, category, order):
+        """ Build the next batch of a category from the view order of its words."""
         batch = {"id": category["id"], "name": category["name"]}
 
+        words, completed = order.next_batch(
+            self.batch_size, self.max_views, self.refresh_rate)
+
         # All elements have reached max_views. Mark as completed and terminate
-        to_view = [w for w in category["words"] if w["views"] < self.max_views]
-        if not to_view:
+        if completed:
             batch["completed"] = True
             return batch
 
-        # Category has less or equal number of elements than batch size. The batch will be
-        # the category itself. Nothing to do.
-        if len(category["words"]) <= self.batch_size:
-            batch["words"] = category["words"]
-            return batch
-
-        sorted_words = sorted(
-            category["words"], key=lambda w: w["views"], reverse=True)
-
-        # If no element has reached max_views, take the first batch_size elements
-        # When batch_size is greater or equal than the number of elements in the category,
-        # it will return all the words in the category.
-        if sorted_words[0]["views"] < self.max_views:
-            batch["words"] = sorted_words[: self.batch_size]
-            return batch
-
-        # Position of the first word with views below max_views
-        pos = next(
-            (i for i, w in enumerate(sorted_words)
-             if w["views"] < self.max_views), None
-        )
-        if pos > self.refresh_rate:
-            pos = pos - pos % self.refresh_rate
-        if len(sorted_words) - (pos + 1) >= self.batch_size:
-            batch["words"] = sorted_words[pos: pos + self.batch_size]
-        else:
-            batch["words"] = sorted_words[len(sorted_words) - self.batch_size:]
+        batch["words"] = words
         return batch
 
+    @staticmethod
+    def __view_order(category):
+        return ViewOrder(
+            category["words"], views=itemgetter("views"), key=itemgetter("id"))
+
 
 def merge_words(current_words, new_words):
     """ Determine words to add and delete for words update.
@@ -10,6 +10,15 @@ from flask import Blueprint, jsonify, make_response, abort, request
 from material_plugin import MaterialPlugin
 from plugins.vocabulary.loader import Loader
 from plugins.vocabulary.service import Service
+from storage_profile import get_profile
+from util import (
+    app_response_cache,
+    make_cached_json_response,
+    make_json_response,
+    page_arguments,
+    page_body,
+    to_json,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -22,7 +31,7 @@ class Vocabulary(MaterialPlugin):
         database = environ.get("DATABASE", "vocabulary.db")
         self.counter = 0
         self.categories = []
-        self.service = Service(database)
+        self.service = Service(database, get_profile(environ.get("storage_profile")))
 
     def load(self, data):
         """ Loads vocabulary """
@@ -37,15 +46,48 @@ class Vocabulary(MaterialPlugin):
         @vocabulary.route("/vocabulary")
         def get_vocabulary():
             """ Get the list of vocabulary categories """
-            categories = self.service.get_categories()
-            return jsonify(categories)
+            page = page_arguments()
+            if page is not None:
+                return make_cached_json_response(
+                    app_response_cache(),
+                    ("vocabulary", *page),
+                    self.service.data_version(),
+                    lambda: page_body(*self.service.get_categories_page(*page)),
+                )
+            return make_cached_json_response(
+                app_response_cache(),
+                "vocabulary",
+                self.service.data_version(),
+                self.service.get_categories,
+            )
+
+        @vocabulary.route("/vocabulary/words")
+        def get_words():
+            """ Get a page of words: ?limit=<page size>&after=<cursor> """
+            page = page_arguments()
+            if page is None:
+                abort(400, "limit argument required.")
+            return make_cached_json_response(
+                app_response_cache(),
+                ("words", *page),
+                self.service.data_version(),
+                lambda: page_body(*self.service.get_words_page(*page)),
+            )
 
         @vocabulary.route("/vocabulary/<int:category_id>")
         def get_category(category_id):
-            category = self.service.get_category(category_id)
-            if category is None:
-                abort(404, "Category not found.")
-            return jsonify(category)
+            def load():
+                category = self.service.get_category(category_id)
+                if category is None:
+                    abort(404, "Category not found.")
+                return category
+
+            return make_cached_json_response(
+                app_response_cache(),
+                ("vocabulary", category_id),
+                self.service.data_version(),
+                load,
+            )
 
         @vocabulary.route("/vocabulary", methods=["POST"])
         def post_category():
@@ -67,7 +109,7 @@ class Vocabulary(MaterialPlugin):
         @vocabulary.route("/vocabulary/recent")
         def get_recent():
             recent = self.service.get_recent()
-            return jsonify(recent)
+            return make_json_response(to_json(recent))
 
         @vocabulary.route("/vocabulary/batch", methods=["PUT"])
         def update_batch():
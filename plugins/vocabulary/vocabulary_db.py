@@ -124,7 +124,7 @@ def select_category(category_id, connection=None):
     try:
         connection.row_factory = sqlite3.Row
         cursor = connection.cursor()
-        cursor.execute(f"SELECT * FROM Categories WHERE id = {category_id};")
+        cursor.execute("SELECT * FROM Categories WHERE id = ?;", (category_id,))
         row = cursor.fetchone()
         cursor.close()
         return dict(row) if row is not None else None
@@ -161,8 +161,8 @@ def update_category(connection, category):
     check_database(connection)
     try:
         cursor = connection.cursor()
-        sql = f"UPDATE Categories SET name = '{category['name']}' WHERE id = {category['id']};"
-        cursor.execute(sql)
+        sql = "UPDATE Categories SET name = ? WHERE id = ?;"
+        cursor.execute(sql, (category["name"], category["id"]))
         connection.commit()
         return select_category(category["id"])
     except sqlite3.Error as error:
@@ -180,7 +180,7 @@ def delete_category(category_id):
     check_database(connection)
     try:
         cursor = connection.cursor()
-        cursor.execute(f"DELETE FROM Categories WHERE id = {category_id}")
+        cursor.execute("DELETE FROM Categories WHERE id = ?", (category_id,))
         connection.commit()
     except sqlite3.Error as error:
         raise Exception(error.args[0])
@@ -276,7 +276,7 @@ def get_words_for_category(category_id, connection=None):
     try:
         connection.row_factory = sqlite3.Row
         cursor = connection.cursor()
-        cursor.execute(f"SELECT * FROM Words WHERE categoryId = {category_id};")
+        cursor.execute("SELECT * FROM Words WHERE categoryId = ?;", (category_id,))
         rows = cursor.fetchall()
         cursor.close()
         return [dict(row) for row in rows]
@@ -0,0 +1,101 @@
+"""
+    In-memory replica of a database file.
+
+    The file is copied with the backup API into a shared in-memory database,
+    which then serves the reads, so they never wait for the disk. Writes run
+    on the file first, which stays authoritative, and are repeated on the
+    replica in the same order.
+
+    A statement that fails on the replica after it ran on the file leaves the
+    copies different. MirroredCursor marks the replica as diverged, and its
+    owner rolls both back and copies the file into it again.
+
+    The replica only follows the writes made through its cursor: changes made
+    to the file by other processes are not seen until it is loaded again.
+    Statements must give the same result on both copies, so values such as
+    the current date go in as parameters instead of datetime('now').
+"""
+import sqlite3
+
+
+def load_replica(
+    source: sqlite3.Connection, location: str, **connect_args
+) -> sqlite3.Connection:
+    """Open the in-memory database at the location URI and copy the content of
+    source into it. The replica lives while the returned connection is open.
+    """
+    replica = sqlite3.connect(location, uri=True, **connect_args)
+    reload_replica(source, replica)
+    return replica
+
+
+def reload_replica(source: sqlite3.Connection, replica: sqlite3.Connection) -> None:
+    """Replace the content of the replica with the committed content of source"""
+    if source.in_transaction:
+        source.commit()
+    source.backup(replica)
+
+
+class MirroredCursor:
+    """Cursor running each statement on the database and then on its replica.
+
+    Results, lastrowid and rowcount come from the database. diverged is set
+    when a statement ran on the database and then failed on the replica.
+    """
+
+    def __init__(self, primary: sqlite3.Cursor, replica: sqlite3.Cursor):
+        self.primary = primary
+        self.replica = replica
+        self.diverged = False
+
+    def execute(self, sql: str, parameters=()):
+        self.primary.execute(sql, parameters)
+        self.__mirror(self.replica.execute, sql, parameters)
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters):
+        # Both copies need the parameters, which may come from a generator
+        seq_of_parameters = list(seq_of_parameters)
+        self.primary.executemany(sql, seq_of_parameters)
+        self.__mirror(self.replica.executemany, sql, seq_of_parameters)
+        return self
+
+    def executescript(self, sql_script: str):
+        self.primary.executescript(sql_script)
+        self.__mirror(self.replica.executescript, sql_script)
+        return self
+
+    def __mirror(self, method, *args) -> None:
+        try:
+            method(*args)
+        except Exception:
+            self.diverged = True
+            raise
+
+    def fetchone(self):
+        return self.primary.fetchone()
+
+    def fetchmany(self, size: int = None):
+        return self.primary.fetchmany(size or self.primary.arraysize)
+
+    def fetchall(self):
+        return self.primary.fetchall()
+
+    def __iter__(self):
+        return iter(self.primary)
+
+    @property
+    def lastrowid(self):
+        return self.primary.lastrowid
+
+    @property
+    def rowcount(self):
+        return self.primary.rowcount
+
+    @property
+    def description(self):
+        return self.primary.description
+
+    def close(self) -> None:
+        self.primary.close()
+        self.replica.close()
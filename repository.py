@@ -1,9 +1,22 @@
 """ Abstract class for repositories """
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Iterable, Iterator, List, NamedTuple, Tuple
 from model import Category, Item
 
 
+class ImportResult(NamedTuple):
+    """Rows written by a bulk import and the time it took"""
+
+    categories: int
+    items: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        rows = self.categories + self.items
+        return rows / self.seconds if self.seconds else float(rows)
+
+
 class Repository(ABC):
     @abstractmethod
     def all_categories(self) -> List[dict]:
@@ -21,10 +34,64 @@ class Repository(ABC):
     def all_items(self) -> List[dict]:
         pass
 
+    @abstractmethod
+    def iter_item_objects(self) -> Iterator[Item]:
+        pass
+
+    @abstractmethod
+    def iter_category_objects(self) -> Iterator[Category]:
+        pass
+
+    @abstractmethod
+    def load_items(self) -> List[Item]:
+        pass
+
+    @abstractmethod
+    def load_items_page(self, limit: int, after: int = 0) -> List[Item]:
+        pass
+
+    @abstractmethod
+    def load_item(self, item_id: int) -> Item:
+        pass
+
+    @abstractmethod
+    def load_category(self, category_id: int) -> Category:
+        pass
+
+    @abstractmethod
+    def load_complete_categories(self) -> List[Category]:
+        pass
+
+    @abstractmethod
+    def load_categories_page(self, limit: int, after: int = 0) -> List[Category]:
+        pass
+
     @abstractmethod
     def save_category(self, category: Category) -> int:
         pass
 
+    @abstractmethod
+    def save_categories(
+        self, categories: Iterable[Category], defer_indexes: bool = False
+    ) -> ImportResult:
+        pass
+
+    @abstractmethod
+    def update_views(
+        self, categories: List[tuple], items: List[tuple], completed: List[tuple] = ()
+    ) -> None:
+        pass
+
+    @abstractmethod
+    def update_views_and_load(
+        self,
+        categories: List[tuple],
+        items: List[tuple],
+        category_id: int,
+        completed: List[tuple] = (),
+    ) -> Category:
+        pass
+
     @abstractmethod
     def run_script(self, script: str):
         pass
@@ -33,12 +100,16 @@ class Repository(ABC):
     def get_info(self):
         pass
 
+    @abstractmethod
+    def data_version(self):
+        pass
+
     @abstractmethod
     def get_recent(self, count):
         pass
 
     @abstractmethod
-    def get_recent_items(self, ids: List[int]):
+    def load_recent_items(self, ids: List[int]) -> List[Tuple[int, Item]]:
         pass
 
     # @abstractmethod
@@ -0,0 +1,113 @@
+"""
+    Caches of already encoded responses and other byte contents.
+
+    Entries are stored together with the data version they were built from.
+    A lookup with a different version is a miss and the entry is rebuilt.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, NamedTuple
+
+
+def etag_for(body: bytes) -> str:
+    """Strong entity tag computed from the content of a response body"""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class CachedBody(NamedTuple):
+    """Encoded response body and its entity tag"""
+
+    body: bytes
+    etag: str
+
+
+class ByteCache:
+    """LRU cache of byte contents bounded by their total size in bytes"""
+
+    def __init__(self, max_size: int = 32 * 1024 * 1024, max_entry_size: int = None):
+        self.max_size = max_size  # Max number of bytes kept in the cache.
+        # Contents larger than this are not kept, so they do not evict the rest.
+        self.max_entry_size = max_size if max_entry_size is None else max_entry_size
+        self.size = 0  # Number of bytes currently kept in the cache.
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Hashable) -> Any:
+        """Return the content stored for key and version, None if not found"""
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, version: Hashable, content: Any) -> Any:
+        """Store the content built for key and version, evicting least recently used entries"""
+        size = self.size_of(content)
+        if not self.fits(size):
+            return content
+        with self.__lock:
+            previous = self.__entries.pop(key, None)
+            if previous is not None:
+                self.size -= self.size_of(previous[1])
+            self.__entries[key] = (version, content)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted) = self.__entries.popitem(last=False)
+                self.size -= self.size_of(evicted)
+        return content
+
+    def fits(self, size: int) -> bool:
+        """Whether a content of this size can be kept"""
+        return size <= min(self.max_size, self.max_entry_size)
+
+    def get_or_create(
+        self, key: Hashable, version: Hashable, create: Callable[[], bytes]
+    ) -> Any:
+        """Return the cached content, building and storing it when missing or outdated"""
+        content = self.get(key, version)
+        if content is None:
+            content = self.put(key, version, create())
+        return content
+
+    def size_of(self, content) -> int:
+        """Number of bytes accounted for a stored content"""
+        return len(content)
+
+    def clear(self) -> None:
+        """Remove all the entries"""
+        with self.__lock:
+            self.__entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        """Hit and miss counters and resident size"""
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.__entries),
+                "size": self.size,
+                "max_size": self.max_size,
+            }
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+class ResponseCache(ByteCache):
+    """LRU cache of encoded response bodies and their ETags"""
+
+    def put(self, key: Hashable, version: Hashable, content: bytes) -> CachedBody:
+        """Store the body built for key and version, evicting least recently used entries"""
+        return super().put(key, version, CachedBody(content, etag_for(content)))
+
+    def size_of(self, content: CachedBody) -> int:
+        return len(content.body)
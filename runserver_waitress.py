@@ -1,7 +1,7 @@
 """
     Launch material server
 """
-import io
+import atexit
 import errno
 import json
 import logging
@@ -16,18 +16,31 @@ from waitress import serve
 from importlib import import_module
 from pathlib import Path
 from flask import Flask, jsonify, make_response, abort, request, Response
-from flask.json import JSONEncoder
 from werkzeug.exceptions import HTTPException
 from flask_cors import CORS
 from dotenv import load_dotenv
+from cached_repository import CachedRepository
 from material_service import MaterialService
+from response_cache import ByteCache, ResponseCache
 from loginit import logger
 from sqlite_repository import SQLiteRepository
+from storage_profile import get_profile
+from write_behind import ViewBuffer
 from material_db_service import MaterialDbService
 from material_plugin import MaterialPlugin
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Metrics, MetricsMiddleware
 from plugin_loader import load_plugins
 from api.books.books_api import books_api, loader
 from api.questions.qa_api import qa_api
+from util import (
+    make_cached_json_response,
+    make_image_response,
+    make_json_response,
+    make_streamed_json_response,
+    page_arguments,
+    page_body,
+    to_json,
+)
 
 
 # logger = logging.getLogger(__name__)
@@ -85,8 +98,48 @@ logger.info(f"Database: {database}")
 # service = MaterialDbService(database)
 
 # repository = SQLiteRepository("test_db.db3")
-repository = SQLiteRepository(database)
-service = MaterialService(repository)
+# storage_profile=wal enables WAL, a pool of reader connections, each one
+# leased while a read runs, up to db_max_connections reads at the same time,
+# and a single writer thread, storage_profile=memory also reads from a copy of
+# the database in memory, see storage_profile. The default profile reads and
+# writes through one connection.
+repository = SQLiteRepository(
+    database,
+    max_connections=int(environ.get("db_max_connections", 8)),
+    profile=get_profile(environ.get("storage_profile")),
+)
+# Results of repeated lookups, kept until a write changes their tables.
+# query_cache_size=0 turns it off.
+query_cache_size = int(environ.get("query_cache_size", 1024))
+repository = CachedRepository(
+    repository, max(query_cache_size, 1), enabled=query_cache_size > 0
+)
+# Durability of view updates: "immediate" commits each /updatebatch, "buffered"
+# groups them into one transaction every view_flush_interval seconds or
+# view_buffer_size items, losing those not yet written if the process dies.
+view_buffer = None
+if environ.get("view_durability", "immediate") == "buffered":
+    view_buffer = ViewBuffer(
+        repository,
+        max_pending=int(environ.get("view_buffer_size", 1000)),
+        flush_interval=float(environ.get("view_flush_interval", 1.0)),
+    )
+    atexit.register(view_buffer.close)
+# Threads preparing the next batch of a category after each update, so
+# /recent finds it ready. batch_workers=0 builds batches on request.
+service = MaterialService(
+    repository, view_buffer, batch_workers=int(environ.get("batch_workers", 1))
+)
+atexit.register(service.close)
+
+# Encode /items and /categories while rows are read instead of caching them
+STREAM_RESPONSES = environ.get("stream_responses", "false").lower() == "true"
+
+# Encoded catalog responses, kept until the data version changes. Shared by
+# every endpoint, books, questions and plugins included, see app_response_cache.
+response_cache = ResponseCache(
+    int(environ.get("response_cache_size", 32 * 1024 * 1024))
+)
 
 blueprints = []
 plugins = load_plugins("plugins", MaterialPlugin)
@@ -96,12 +149,43 @@ for plugin in plugins:
 app = Flask(__name__)
 CORS(app)
 
+app.config["RESPONSE_CACHE"] = response_cache
+
+# Seconds clients may keep images without asking again
+app.config["IMAGE_MAX_AGE"] = int(environ.get("image_max_age", 365 * 24 * 3600))
+
+# Bytes of image content kept in memory, 0 to read images from disk every time.
+# Files larger than 1/8 of it are not kept.
+image_cache_size = int(environ.get("image_cache_size", 0))
+app.config["IMAGE_CACHE"] = (
+    ByteCache(image_cache_size, image_cache_size // 8) if image_cache_size else None
+)
+
+# Let a front proxy send image files: x-sendfile or x-accel-redirect. For
+# x-accel-redirect, image_offload_locations maps directories to internal URIs:
+# "/data/bits=/internal/bits;/data/material=/internal/material"
+app.config["IMAGE_OFFLOAD"] = environ.get("image_offload")
+app.config["IMAGE_OFFLOAD_LOCATIONS"] = dict(
+    location.split("=", 1)
+    for location in environ.get("image_offload_locations", "").split(";")
+    if location
+)
+
 app.register_blueprint(books_api)
 app.register_blueprint(qa_api)
 
 for blueprint in blueprints:
     app.register_blueprint(blueprint)
 
+# Request counts, durations and response sizes of every endpoint
+metrics = Metrics()
+MetricsMiddleware(app, metrics)
+
+
+def cached_json_response(key, load):
+    """Make response from the cached encoding of load() for the current data version"""
+    return make_cached_json_response(response_cache, key, service.data_version(), load)
+
 
 @app.route("/")
 @app.route("/recent")
@@ -109,44 +193,64 @@ def get_recent_categories():
     """Recently used categories"""
     logger.info("get_recent_categories")
     categories = service.get_recent()
-    json_string = json.dumps(categories).encode("utf-8")
-    response = make_response(json_string.decode("utf-8"))
-    response.content_type = "application/json"
-    response.charset = "utf-8"
-    return response
+    return make_json_response(to_json(categories))
 
 
 @app.route("/categories")
 def all_categories():
     logger.info("all_categories")
-    categories = service.get_all_complete_categories()
-    json_string = json.dumps(categories, cls=JSONEncoder, ensure_ascii=False)
-    response = make_response(json_string)
-    response.content_type = "application/json"
-    response.charset = "utf-8"
-    return response
+    page = page_arguments()
+    if page is not None:
+        return cached_json_response(
+            ("categories", *page),
+            lambda: page_body(*service.get_categories_page(*page)),
+        )
+    if STREAM_RESPONSES:
+        return make_streamed_json_response(service.iter_complete_categories())
+    return cached_json_response("categories", service.get_all_complete_categories)
 
 
 @app.route("/items")
 def all_items():
     logger.info("all_items")
-    items = service.get_all_items()
-    json_string = json.dumps(items, cls=JSONEncoder, ensure_ascii=False)
-    response = make_response(json_string)
-    response.content_type = "application/json"
-    response.charset = "utf-8"
-    return response
+    page = page_arguments()
+    if page is not None:
+        return cached_json_response(
+            ("items", *page), lambda: page_body(*service.get_items_page(*page))
+        )
+    if STREAM_RESPONSES:
+        return make_streamed_json_response(service.iter_all_items())
+    return cached_json_response("items", service.get_all_items)
 
 
 @app.route("/categories/<int:category_id>")
 def get_category(category_id):
     """Return category images"""
-    category = service.get_category(category_id)
-    if category is None:
-        abort(404)
-    response = make_response(json.dumps(category, cls=JSONEncoder, ensure_ascii=False))
-    response.content_type = "application/json"
-    return response
+
+    def load():
+        category = service.get_category(category_id)
+        if category is None:
+            abort(404)
+        return category
+
+    return cached_json_response(("category", category_id), load)
+
+
+@app.route("/cache/stats")
+def get_cache_stats():
+    """Response, query and image cache hit and miss counters"""
+    image_cache = app.config["IMAGE_CACHE"]
+    return jsonify(
+        responses=response_cache.stats(),
+        queries=repository.stats(),
+        images=None if image_cache is None else image_cache.stats(),
+    )
+
+
+@app.route("/metrics")
+def get_metrics():
+    """Request metrics in Prometheus text format"""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
 
 
 @app.route("/image/<int:img_id>")
@@ -154,18 +258,26 @@ def get_image(img_id):
     bit = service.get_item(img_id)
     if bit is None:
         abort(404)
-    with io.FileIO(BITS_PATH.joinpath(bit["Image"])) as img:
-        img_bytes = img.readall()
-    response = make_response(img_bytes)
-    response.headers.set("Content-Type", "image/jpeg")
-    return response
+    return make_image_response(BITS_PATH.joinpath(bit.Image))
 
 
 @app.route("/updatebatch", methods=["POST"])
 def update_batch():
+    """Add a view to the items of the batch. With next=true, the response also
+    has the next batch of the category, so clients need not ask /recent again.
+    """
     logger.debug(request.json)
-    data = request.json
-    result = service.update_batch(data)
+    batch = service.batch_from_json(request.json)
+    if request.args.get("next", "false").lower() == "true":
+        try:
+            next_batch = service.update_and_get_next_batch(batch)
+        except Exception as exception:
+            logger.error(f"Could not update batch: {exception}")
+            return json.dumps({"success": False}), 500, {"ContentType": "application/json"}
+        return Response(
+            to_json({"success": True, "batch": next_batch}), content_type="application/json"
+        )
+    result = service.update_batch(batch)
     if not result:
         return json.dumps({"success": False}), 500, {"ContentType": "application/json"}
 
@@ -272,13 +384,15 @@ def handle_exception(exception):
     """Return JSON instead of HTML for HTTP errors."""
     # start with the correct headers and status code from the error
     response = exception.get_response()
+    # Only errors raised from an unhandled exception carry the original one
+    original = getattr(exception, "original_exception", None)
     # replace the body with JSON
     response.data = json.dumps(
         {
             "code": exception.code,
             "name": exception.name,
             "description": exception.description,
-            "exception": exception.original_exception.args[0],
+            "exception": original.args[0] if original and original.args else None,
         }
     )
     response.content_type = "application/json"
@@ -4,15 +4,79 @@
     sqlite based repository
 """
 
+import json
+import logging
 import sqlite3
-from typing import List
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, Tuple
 
-from repository import Repository
-from model import Category
+from connection_pool import ConnectionPool, memory_database_uri
+from migrations import MATERIAL_MIGRATIONS, migrate
+from replica import MirroredCursor, load_replica, reload_replica
+from repository import ImportResult, Repository
+from storage_profile import StorageProfile, WriterThread
+from model import Category, Item
+
+logger = logging.getLogger(__name__)
+
+# Item columns in the order of the Item fields, so rows map positionally
+ITEM_COLUMNS = "Text, Image, Views, LastUse, Id"
+
+# Category and item columns of categories joined with their items
+CATEGORY_ITEM_COLUMNS = (
+    "c.Name, c.LastUse, c.Completed, c.Type, c.Id, "
+    + "it.Text, it.Image, it.Views, it.LastUse, it.Id"
+)
+
+
+def item_row(cursor, row) -> Item:
+    """Row factory building an Item from a row of ITEM_COLUMNS"""
+    return Item(*row)
+
+
+def category_item_row(cursor, row) -> Tuple[int, Item]:
+    """Row factory building a (CategoryId, Item) pair from a row of CategoryId, ITEM_COLUMNS"""
+    return row[0], Item(*row[1:])
+
+
+def categories_from_tuples(rows) -> Iterator[Category]:
+    """Group rows of CATEGORY_ITEM_COLUMNS, ordered by category, into categories"""
+    category = None
+    for row in rows:
+        if category is None or category.Id != row[4]:
+            if category is not None:
+                yield category
+            category = Category(row[0], [], row[1], bool(row[2]), row[3], row[4])
+        # Categories without items come with null item columns
+        if row[9] is not None:
+            category.Items.append(Item(*row[5:]))
+    if category is not None:
+        yield category
 
 
 class SQLiteRepository(Repository):
-    """sqlite3 material database"""
+    """sqlite3 material database
+
+    Writes, and the cur cursor, go through a single writer connection, each
+    one as a whole transaction, see transaction(). With
+    a profile that has a reader pool, each read leases a connection from a
+    pool of up to max_connections for as long as it runs, otherwise reads
+    use the writer connection too. An in-memory database is opened as a
+    shared cache, so every connection sees the same content, including
+    uncommitted changes.
+
+    Streaming iterators fetch rows in chunks only where an unfinished read
+    cannot block the writer: on the writer connection, in WAL mode or in
+    memory. Pooled readers of a rollback journal read all the rows at once,
+    as their SHARED lock would make commits fail with "database is locked".
+
+    The storage profile sets the pragmas of the connections and whether
+    writes are run by a writer thread, see storage_profile. With its
+    memory_replica set, a database file is copied into memory when opened and
+    read from there, while writes go to both copies, see replica.
+    """
 
     # Default database location
     __DB_LOCATION = "./repository.db3"
@@ -23,146 +87,541 @@ class SQLiteRepository(Repository):
         + "FROM Categories c join Items it on c.Id = it.CategoryId"
     )
 
-    def __init__(self, db_location=None):
+    # A category with its items
+    __SELECT_CATEGORY = (
+        "SELECT c.Id AS c_Id, Name, c.LastUse AS c_LastUse, Type, it.Id, Text, Views, Image, it.LastUse "
+        + "FROM Categories c JOIN Items it ON c.Id = it.CategoryId WHERE c.Id = ?"
+    )
+
+    # Objects: categories with their items, a page of them and a single one
+    __LOAD_CATEGORIES = (
+        f"SELECT {CATEGORY_ITEM_COLUMNS} FROM Categories c "
+        + "LEFT JOIN Items it ON c.Id = it.CategoryId ORDER BY c.Id, it.Id"
+    )
+    __LOAD_CATEGORIES_PAGE = (
+        f"SELECT {CATEGORY_ITEM_COLUMNS} "
+        + "FROM (SELECT * FROM Categories WHERE Id > ? ORDER BY Id LIMIT ?) c "
+        + "LEFT JOIN Items it ON c.Id = it.CategoryId ORDER BY c.Id, it.Id"
+    )
+    __LOAD_CATEGORY = (
+        f"SELECT {CATEGORY_ITEM_COLUMNS} FROM Categories c "
+        + "JOIN Items it ON c.Id = it.CategoryId WHERE c.Id = ? ORDER BY it.Id"
+    )
+
+    # Items of a list of categories, in the order of the list
+    __LOAD_RECENT_ITEMS = (
+        "SELECT it.CategoryId, it.Text, it.Image, it.Views, it.LastUse, it.Id "
+        + "FROM json_each(?) j JOIN Items it ON it.CategoryId = j.value "
+        + "ORDER BY j.key, it.Id"
+    )
+
+    # Mark a category completed once all its items have max_views views
+    __MARK_COMPLETED = (
+        "UPDATE Categories SET Completed = 1 WHERE Id = ? AND Completed IS NOT 1 "
+        + "AND NOT EXISTS (SELECT 1 FROM Items WHERE CategoryId = Categories.Id AND Views < ?)"
+    )
+
+    # Number of rows retrieved on each fetch when streaming results
+    __FETCH_SIZE = 500
+
+    # Prepared statements kept by each connection. Statements take their
+    # values as parameters, lists of ids as a JSON array read with json_each,
+    # so the set of distinct statements is small and fixed.
+    __STATEMENT_CACHE_SIZE = 256
+
+    def __init__(
+        self,
+        db_location=None,
+        max_connections: int = 8,
+        profile: StorageProfile = None,
+    ):
         """Initialize db class variables"""
-        if db_location is not None:
-            self.__db_connection = sqlite3.connect(
-                db_location,
-                check_same_thread=False,
-                detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
-            )
+        self.__closed = False
+        self.__connect_args = {
+            "check_same_thread": False,
+            "cached_statements": self.__STATEMENT_CACHE_SIZE,
+        }
+        if db_location is None:
+            db_location = self.__DB_LOCATION
         else:
-            self.__db_connection = sqlite3.connect(
-                self.__DB_LOCATION, check_same_thread=False
+            self.__connect_args["detect_types"] = (
+                sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
             )
-        self.__db_connection.row_factory = sqlite3.Row
+        self.__shared_memory = db_location == ":memory:"
+        if self.__shared_memory:
+            db_location = memory_database_uri()
+            self.__connect_args["uri"] = True
+        self.__db_location = db_location
+        self.__trace_callback = None
+        self.profile = profile or StorageProfile()
+        # Keeps an in-memory database alive while readers come and go
+        self.__db_connection = self.__connect()
+        self.__write_lock = threading.RLock()
+        self.__unit = threading.local()  # Whether a transaction runs in the thread
+        self.__writer = WriterThread() if self.profile.writer_thread else None
+        self.__pool = None
+        if self.profile.reader_pool:
+            self.__pool = ConnectionPool(self.__connect_reader, max_connections)
         self.cur = self.__db_connection.cursor()
+        self.__commits = 0  # Number of commits done through this repository
+        self.__replica = None  # Connection keeping the in-memory replica alive
+        self.__replica_location = None
+        if self.__has_schema():
+            self.migrate()
+        if self.profile.memory_replica and not self.__shared_memory:
+            self.__open_replica()
+        self.__stream_rows = self.__can_stream()
+
+    def __open_replica(self) -> None:
+        """Copy the database into memory and read from the copy from now on"""
+        self.__replica_location = memory_database_uri()
+        self.__replica = load_replica(
+            self.__db_connection, self.__replica_location, **self.__connect_args
+        )
+        self.__replica.row_factory = sqlite3.Row
+        self.cur = MirroredCursor(self.cur, self.__replica.cursor())
+
+    def __can_stream(self) -> bool:
+        """Whether readers may keep a statement open without blocking writes"""
+        if self.__pool is None or self.__shared_memory or self.__replica is not None:
+            return True
+        journal_mode = self.__db_connection.execute("PRAGMA journal_mode").fetchone()[0]
+        return journal_mode.lower() == "wal"
+
+    def __has_schema(self) -> bool:
+        row = self.__db_connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Items'"
+        ).fetchone()
+        return row is not None
+
+    def migrate(self) -> int:
+        """Upgrade the schema to the latest version. Return the version."""
+        version = self.__write(migrate, self.__db_connection, MATERIAL_MIGRATIONS)
+        if self.__replica is not None:
+            self.__write(migrate, self.__replica, MATERIAL_MIGRATIONS)
+        return version
+
+    def __connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.__db_location, **self.__connect_args)
+        connection.row_factory = sqlite3.Row
+        self.profile.apply(connection)
+        return connection
+
+    def __connect_reader(self) -> sqlite3.Connection:
+        if self.__replica is None:
+            connection = self.__connect()
+        else:
+            connection = sqlite3.connect(
+                self.__replica_location, uri=True, **self.__connect_args
+            )
+            connection.row_factory = sqlite3.Row
+        if self.__shared_memory or self.__replica is not None:
+            # Like a single connection, see the changes not yet committed
+            connection.execute("PRAGMA read_uncommitted = 1")
+        connection.set_trace_callback(self.__trace_callback)
+        return connection
+
+    @contextmanager
+    def __reader(self) -> Iterator[sqlite3.Connection]:
+        """Connection to read from for the duration of the block"""
+        if self.__pool is not None:
+            with self.__pool.lease() as connection:
+                yield connection
+        elif self.__replica is not None:
+            yield self.__replica
+        else:
+            yield self.__db_connection
+
+    def __write(self, function, *args):
+        """Run a write on the writer connection, in the writer thread if there is one"""
+        if self.__writer is not None:
+            return self.__writer.call(function, *args)
+        with self.__write_lock:
+            return function(*args)
+
+    def transaction(self, function: Callable, *args):
+        """Run function(*args) as a single transaction and return its result.
+
+        The writes function makes, with execute, execute_many and
+        execute_statement, are committed when it returns and rolled back when
+        it raises. It runs in the writer as one unit, so no write from another
+        thread comes in between. Transactions started inside it are part of it.
+        """
+        return self.__write(self.__transaction, function, *args)
+
+    def __transaction(self, function: Callable, *args):
+        if getattr(self.__unit, "active", False):
+            return function(*args)
+        self.__unit.active = True
+        try:
+            result = function(*args)
+        except BaseException:
+            self.__rollback()
+            raise
+        finally:
+            self.__unit.active = False
+        self.__commit()
+        return result
 
     def close(self):
-        """close sqlite3 connection"""
+        """close sqlite3 connections. Does nothing once closed."""
+        if self.__closed:
+            return
+        self.__closed = True
+        if self.__writer is not None:
+            self.__writer.close()
+        if self.__pool is not None:
+            self.__pool.close()
+        if self.__replica is not None:
+            self.__replica.close()
         self.__db_connection.close()
 
     def all_categories(self) -> List[dict]:
         """Retrieve all the categories."""
-        self.__db_connection.row_factory = sqlite3.Row
-        rows = self.__db_connection.execute("SELECT * FROM Categories")
-        return rows
+        with self.__reader() as connection:
+            return connection.execute("SELECT * FROM Categories").fetchall()
 
     def all_categories2(self) -> List[dict]:
         """Retrieve all the categories."""
-        self.__db_connection.row_factory = sqlite3.Row
-        rows = self.__db_connection.execute(
-            "SELECT * FROM Categories c JOIN items it ON it.Id = c.Id"
-        )
-        return rows
+        with self.__reader() as connection:
+            return connection.execute(
+                "SELECT * FROM Categories c JOIN items it ON it.Id = c.Id"
+            ).fetchall()
 
     def all_items(self) -> List[dict]:
         """Retrieve all the items."""
-        rows = self.__db_connection.execute("select * from Items")
-        return [row for row in rows]
+        with self.__reader() as connection:
+            return connection.execute("select * from Items").fetchall()
 
-    def get_recent(self, count):
-        sql = f"SELECT * FROM Categories ORDER BY LastUSE DESC LIMIT { count }"
-        return self.execute_sql_select(sql)
+    def iter_item_objects(self) -> Iterator[Item]:
+        """Stream all the items as Item objects, ordered by Id."""
+        return self.execute_sql_objects_iter(
+            f"SELECT {ITEM_COLUMNS} FROM Items ORDER BY Id", row_factory=item_row
+        )
 
-    def get_recent_items(self, ids: List[int]):
-        sql = f"SELECT * FROM Items WHERE CategoryId IN ({','.join([str(id) for id in ids])})"
-        return self.execute_sql_select(sql)
+    def iter_category_objects(self) -> Iterator[Category]:
+        """Stream all the categories with their items, each one once all its items are read."""
+        rows = self.execute_sql_objects_iter(self.__LOAD_CATEGORIES)
+        try:
+            yield from categories_from_tuples(rows)
+        finally:
+            rows.close()
+
+    def get_recent(self, count):
+        sql = "SELECT * FROM Categories ORDER BY LastUse DESC LIMIT ?"
+        return self.execute_sql_select(sql, (count,))
+
+    def load_recent_items(self, ids: List[int]) -> List[Tuple[int, Item]]:
+        """Retrieve (CategoryId, Item) pairs of the given categories, ordered
+        like ids and by item Id within each category.
+        """
+        return self.execute_sql_objects(
+            self.__LOAD_RECENT_ITEMS, (json.dumps(ids),), category_item_row
+        )
 
     def get_items(self, ids: List[int]):
-        sql = f"SELECT * FROM Items WHERE Id IN ({','.join([str(id) for id in ids])})"
-        return self.execute_sql_select(sql)
+        sql = "SELECT * FROM Items WHERE Id IN (SELECT value FROM json_each(?))"
+        return self.execute_sql_select(sql, (json.dumps(ids),))
 
     def get_item(self, item_id: int):
-        sql = f"SELECT * FROM Items WHERE Id = {item_id}"
-        return self.execute_sql_select(sql)
+        sql = "SELECT * FROM Items WHERE Id = ?"
+        return self.execute_sql_select(sql, (item_id,))
 
     def category(self, category_id: int):
-        # sql = f"SELECT c.Id as c_id, Name, c.LastUse as c_LastUse, it.Id as it_id, * FROM Categories c JOIN items it ON it.CategoryId = c.id WHERE c.id = {category_id}"
-        # sql = f"SELECT * FROM Categories c JOIN items it ON it.CategoryId = c.id WHERE c.id = {category_id}"
-        sql = f"select c.Id as c_Id, Name, c.LastUse as c_LastUse, Type, it.Id, Text, Views, Image, it.LastUse from Categories c join Items it on c.Id = it.CategoryId Where c.Id = {category_id}"
-        return self.execute_sql_select(sql)
+        return self.execute_sql_select(self.__SELECT_CATEGORY, (category_id,))
+
+    def load_items(self) -> List[Item]:
+        """Retrieve all the items as Item objects."""
+        return self.execute_sql_objects(
+            f"SELECT {ITEM_COLUMNS} FROM Items ORDER BY Id", row_factory=item_row
+        )
+
+    def load_items_page(self, limit: int, after: int = 0) -> List[Item]:
+        """Retrieve up to limit items with Id greater than after, ordered by Id."""
+        return self.execute_sql_objects(
+            f"SELECT {ITEM_COLUMNS} FROM Items WHERE Id > ? ORDER BY Id LIMIT ?",
+            (after, limit),
+            item_row,
+        )
+
+    def load_item(self, item_id: int) -> Item:
+        """Retrieve the item with the given Id, None if not found."""
+        items = self.execute_sql_objects(
+            f"SELECT {ITEM_COLUMNS} FROM Items WHERE Id = ?", (item_id,), item_row
+        )
+        return items[0] if items else None
+
+    def load_category(self, category_id: int) -> Category:
+        """Retrieve the category with its items, None if not found or empty."""
+        rows = self.execute_sql_objects(self.__LOAD_CATEGORY, (category_id,))
+        return next(categories_from_tuples(rows), None)
+
+    def load_complete_categories(self) -> List[Category]:
+        """Retrieve all the categories with their items in a single query."""
+        return list(self.iter_category_objects())
+
+    def load_categories_page(self, limit: int, after: int = 0) -> List[Category]:
+        """Retrieve up to limit categories with Id greater than after, with their items."""
+        rows = self.execute_sql_objects(self.__LOAD_CATEGORIES_PAGE, (after, limit))
+        return list(categories_from_tuples(rows))
 
     def save_category(self, category: Category) -> int:
         """Store a new category in the database"""
-        self.__db_connection.row_factory = sqlite3.Row
-        self.cur.execute(
-            "INSERT INTO Categories (Name, LastUse) VALUES (?, ?)",
-            (category.Name, category.LastUse),
+        self.transaction(self.__insert_categories, [category])
+        return category.Id
+
+    def save_categories(
+        self, categories: Iterable[Category], defer_indexes: bool = False
+    ) -> ImportResult:
+        """Store new categories and their items in a single transaction.
+
+        Categories get their Id set. With defer_indexes the indexes of the
+        tables are dropped while the rows are inserted and created again at
+        the end, which is faster for a large import into a populated database.
+        """
+        start = time.perf_counter()
+        category_count, item_count = self.transaction(
+            self.__save_categories, categories, defer_indexes
+        )
+        return ImportResult(category_count, item_count, time.perf_counter() - start)
+
+    def __save_categories(self, categories, defer_indexes: bool) -> Tuple[int, int]:
+        # Dropping the indexes would not start the transaction
+        self.__begin_immediate()
+        indexes = self.__drop_indexes() if defer_indexes else []
+        counts = self.__insert_categories(categories)
+        for index in indexes:
+            self.cur.execute(index)
+        return counts
+
+    def __drop_indexes(self) -> List[str]:
+        """Drop the indexes of the material tables, return the SQL creating them"""
+        indexes = self.__db_connection.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+            + "AND tbl_name IN ('Categories', 'Items') AND sql IS NOT NULL"
+        ).fetchall()
+        for name, _ in indexes:
+            self.cur.execute(f'DROP INDEX "{name}"')
+        return [sql for _, sql in indexes]
+
+    def __insert_categories(self, categories: Iterable[Category]) -> Tuple[int, int]:
+        """Insert categories with ids following the last one, and their new items.
+        Items already stored are moved to their category. Return the number
+        of categories and items written.
+        """
+        categories = list(categories)
+        # Ids follow the last one: no other connection may insert until the commit
+        self.__begin_immediate()
+        last_id = self.__db_connection.execute(
+            "SELECT COALESCE(MAX(Id), 0) FROM Categories"
+        ).fetchone()[0]
+        for category_id, category in enumerate(categories, last_id + 1):
+            category.Id = category_id
+        self.cur.executemany(
+            "INSERT INTO Categories (Id, Name, LastUse, Completed, Type) VALUES (?, ?, ?, ?, ?)",
+            [(c.Id, c.Name, c.LastUse, c.Completed, c.Type) for c in categories],
         )
-        category_id = self.cur.lastrowid
         new_items = [
-            (it.text, it.image, it.views, it.last_view, category_id)
-            for it in category.Items
-            if it.id == 0
+            (item.Text, item.Image, item.Views, item.LastUse, category.Id)
+            for category in categories
+            for item in category.Items
+            if item.Id == 0
         ]
         self.cur.executemany(
-            "insert into Items (Text, Image, Views, LastUse, CategoryId) values (?, ?, ?, ?, ?)",
+            "INSERT INTO Items (Text, Image, Views, LastUse, CategoryId) VALUES (?, ?, ?, ?, ?)",
             new_items,
         )
+        moved_items = [
+            (category.Id, item.Id)
+            for category in categories
+            for item in category.Items
+            if item.Id != 0
+        ]
+        if moved_items:
+            self.cur.executemany("UPDATE Items SET CategoryId = ? WHERE Id = ?", moved_items)
+        return len(categories), len(new_items) + len(moved_items)
+
+    def __begin_immediate(self) -> None:
+        """Start the transaction taking the write lock of the database, if not started"""
+        if not self.__db_connection.in_transaction:
+            self.cur.execute("BEGIN IMMEDIATE")
+
+    def update_views(
+        self, categories: List[tuple], items: List[tuple], completed: List[tuple] = ()
+    ) -> None:
+        """Store views in a single transaction.
+
+        categories are (LastUse, Id) pairs and items (views to add, LastUse, Id).
+        completed are (Id, max_views) pairs: each category not completed yet is
+        marked as completed once all its items have max_views views.
+        """
+        self.transaction(self.__add_views, categories, items, completed)
+
+    def update_views_and_load(
+        self,
+        categories: List[tuple],
+        items: List[tuple],
+        category_id: int,
+        completed: List[tuple] = (),
+    ) -> Category:
+        """Store views like update_views and return the category with its items
+        as left by them, read in the same transaction. None if it has no items.
+        """
+        rows = self.transaction(
+            self.__update_views_and_load, categories, items, category_id, completed
+        )
+        return next(categories_from_tuples(rows), None)
 
-        if len(new_items) < len(category.Items):
-            existing_items = [it.id for it in category.Items if it.id != 0]
-            to_update = ",".join(existing_items)
-            update_cmd = (
-                f"update Items set CategoryId = {category_id} where Id in ({to_update})",
-            )
-            self.cur.executemany(update_cmd)
+    def __update_views_and_load(self, categories, items, category_id: int, completed) -> list:
+        self.__add_views(categories, items, completed)
+        return self.cur.execute(self.__LOAD_CATEGORY, (category_id,)).fetchall()
 
-        self.commit()
-        return category_id
+    def __add_views(self, categories: List[tuple], items: List[tuple], completed=()) -> None:
+        # Views are added by the database, never overwritten with a count read before
+        self.cur.executemany("UPDATE Categories SET LastUse = ? WHERE Id = ?", categories)
+        self.cur.executemany(
+            "UPDATE Items SET Views = Views + ?, LastUse = ? WHERE Id = ?", items
+        )
+        if completed:
+            self.cur.executemany(self.__MARK_COMPLETED, completed)
 
     def mark_category_completed(self, category_id):
-        sql = f"UPDATE Categories SET Completed = 1 WHERE Id = {category_id}"
-        self.cur.execute(sql)
+        sql = "UPDATE Categories SET Completed = 1 WHERE Id = ?"
+        self.execute(sql, (category_id,))
 
     def execute(self, cmd, new_data):
-        """execute a row of data to current cursor"""
-        self.cur.execute(cmd, new_data)
+        """execute a row of data to current cursor, committed at once outside
+        of transaction()"""
+        self.transaction(self.cur.execute, cmd, new_data)
 
     def execute_statement(self, cmd):
-        self.cur.execute(cmd)
+        self.transaction(self.cur.execute, cmd)
 
-    def execute_sql_select(self, sql: str) -> dict:
+    def execute_sql_select(self, sql: str, parameters=()) -> dict:
         """Run a SELECT statement"""
         try:
-            cur = self.__db_connection.cursor()
-            rows = cur.execute(sql)
-            rows = cur.fetchall()
-            cur.close()
+            with self.__reader() as connection:
+                cur = connection.cursor()
+                rows = cur.execute(sql, parameters)
+                rows = cur.fetchall()
+                cur.close()
             # self.cur.execute(sql)
             # rows = self.cur.fetchall()
             return [dict(row) for row in rows]
         except sqlite3.Error as db_error:
-            print(f"Error: {db_error.args[0]}")
+            logger.exception(f"Could not run {sql}: {db_error.args[0]}")
             raise
 
+    def execute_sql_objects(self, sql: str, parameters=(), row_factory=None) -> list:
+        """Run a SELECT statement, returning what row_factory builds from each row.
+
+        Without row_factory rows are plain tuples.
+        """
+        with self.__reader() as connection:
+            cur = connection.cursor()
+            cur.row_factory = row_factory
+            try:
+                return cur.execute(sql, parameters).fetchall()
+            finally:
+                cur.close()
+
+    def execute_sql_objects_iter(
+        self, sql: str, parameters=(), row_factory=None
+    ) -> Iterator:
+        """Run a SELECT statement, yielding what row_factory builds from each
+        row as rows are fetched in chunks. Without row_factory rows are tuples.
+
+        The cursor is closed, and its connection given back to the pool, when
+        the rows are exhausted or the iterator is closed, so wrap it with
+        contextlib.closing when it may be left unfinished. Where an open
+        statement would block writes, all the rows are fetched on the first
+        step instead, see the class documentation.
+        """
+        if not self.__stream_rows:
+            yield from self.execute_sql_objects(sql, parameters, row_factory)
+            return
+        with self.__reader() as connection:
+            cur = connection.cursor()
+            cur.row_factory = row_factory
+            try:
+                cur.execute(sql, parameters)
+                rows = cur.fetchmany(self.__FETCH_SIZE)
+                while rows:
+                    yield from rows
+                    rows = cur.fetchmany(self.__FETCH_SIZE)
+            finally:
+                cur.close()
+
     def execute_many(self, cmd, many_new_data):
-        """update many data to database in one go"""
-        self.cur.executemany(cmd, many_new_data)
+        """update many data to database in one go, committed at once outside
+        of transaction()"""
+        self.transaction(self.cur.executemany, cmd, many_new_data)
 
     def all_table_content(self, table: str):
         """Retrieve the content of the given table"""
-        self.__db_connection.row_factory = sqlite3.Row
-        self.cur.execute(f"SELECT * FROM {table}")
-        rows = self.cur.fetchall()
-        return [dict(row) for row in rows]
+        return self.execute_sql_select(f"SELECT * FROM {table}")
 
     def run_script(self, script: str) -> None:
-        """Run the given script file"""
+        """Run the given script file, then the schema migrations"""
         with open(script, "r", encoding="utf-8") as sqlite_file:
             sql_script = sqlite_file.read()
-        self.cur.executescript(sql_script)
+        self.transaction(self.cur.executescript, sql_script)
+        if self.__has_schema():
+            self.migrate()
 
     def get_info(self):
         pass
 
+    def set_trace_callback(self, callback) -> None:
+        """Register a callable invoked with the text of every statement executed"""
+        self.__trace_callback = callback
+        self.__db_connection.set_trace_callback(callback)
+        if self.__pool is not None:
+            self.__pool.for_each(lambda connection: connection.set_trace_callback(callback))
+
     def commit(self):
-        """commit changes to database"""
+        """commit changes to database.
+
+        Writes made with execute, execute_many, execute_statement and
+        transaction() are committed by them; this commits those made directly
+        on cur. Inside a transaction() it does nothing: the unit commits when
+        it ends.
+        """
+        self.__write(self.__commit_pending)
+
+    def __commit_pending(self):
+        if getattr(self.__unit, "active", False):
+            return
+        if self.__db_connection.in_transaction:
+            self.__commit()
+
+    def __commit(self):
         self.__db_connection.commit()
+        if self.__replica is not None:
+            self.__replica.commit()
+        self.__commits += 1
+
+    def __rollback(self):
+        self.__db_connection.rollback()
+        if self.__replica is not None:
+            self.__replica.rollback()
+            if self.cur.diverged:
+                # Changes the rollback cannot undo, such as DDL, are in the file only
+                reload_replica(self.__db_connection, self.__replica)
+                self.cur.diverged = False
+
+    def data_version(self) -> tuple:
+        """Value that changes whenever the content of the database changes.
+
+        PRAGMA data_version of the writer connection tracks commits from other
+        connections, such as the generator, while the commit counter tracks
+        the ones done here: each transaction adds exactly one to it.
+        """
+        row = self.__db_connection.execute("PRAGMA data_version").fetchone()
+        return (row[0], self.__commits)
 
     def __del__(self):
-        self.__db_connection.close()
+        self.close()
 
     # Implement __enter__ and __exit to allow expressions like
     #   with Repository() as db:
@@ -173,7 +632,7 @@ class SQLiteRepository(Repository):
     def __exit__(self, exc_type, exc_value, traceback):
         self.cur.close()
         if isinstance(exc_value, Exception):
-            self.__db_connection.rollback()
+            self.__write(self.__rollback)
         else:
-            self.__db_connection.commit()
-        self.__db_connection.close()
+            self.commit()
+        self.close()
@@ -0,0 +1,124 @@
+"""
+    SQLite storage profiles.
+
+    A profile sets the pragmas every connection is opened with and whether
+    writes are handed to a single writer thread. The "wal" profile lets
+    readers go on while a write is in progress:
+
+        journal_mode=WAL     readers do not wait for writers, nor writers for readers
+        synchronous=NORMAL   no fsync on every commit, only at checkpoints
+        cache_size           pages kept in memory by each connection
+        mmap_size            database read through memory mapping
+
+    The "memory" profile writes like "wal" and reads from a copy of the
+    database held in memory, see replica.
+"""
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, replace
+from typing import Any, Callable
+
+
+@dataclass(frozen=True)
+class StorageProfile:
+    """Settings of the connections to a SQLite database"""
+
+    name: str = "default"
+    journal_mode: str = None
+    synchronous: str = None
+    cache_size: int = None  # Pages, or KiB when negative
+    mmap_size: int = None  # Bytes
+    busy_timeout: int = None  # Milliseconds waiting for a lock held by another process
+    reader_pool: bool = False  # Read through pooled connections, one per read running
+    writer_thread: bool = False  # Run every write in a single thread, in order
+    memory_replica: bool = False  # Read from an in-memory copy of the database file
+
+    def apply(self, connection: sqlite3.Connection) -> None:
+        """Set the pragmas of the profile on the connection"""
+        for pragma, value in (
+            ("journal_mode", self.journal_mode),
+            ("synchronous", self.synchronous),
+            ("cache_size", self.cache_size),
+            ("mmap_size", self.mmap_size),
+            ("busy_timeout", self.busy_timeout),
+        ):
+            if value is not None:
+                connection.execute(f"PRAGMA {pragma} = {value}").fetchall()
+
+
+PROFILES = {
+    "default": StorageProfile(),
+    "wal": StorageProfile(
+        name="wal",
+        journal_mode="WAL",
+        synchronous="NORMAL",
+        cache_size=-16384,
+        mmap_size=256 * 1024 * 1024,
+        busy_timeout=5000,
+        reader_pool=True,
+        writer_thread=True,
+    ),
+}
+PROFILES["memory"] = replace(PROFILES["wal"], name="memory", memory_replica=True)
+
+
+def get_profile(name: str = None) -> StorageProfile:
+    """Profile with the given name, the default one when None"""
+    try:
+        return PROFILES[name or "default"]
+    except KeyError:
+        raise ValueError(
+            f"Unknown storage profile: {name}. Use one of {', '.join(PROFILES)}"
+        ) from None
+
+
+class WriterThread:
+    """Thread that runs the writes submitted from other threads, one at a time in order.
+
+    Each function runs to its end before the next one starts, so a whole
+    transaction, its statements and its commit or rollback, must be
+    submitted as a single function to keep other writes out of it.
+    """
+
+    def __init__(self, name: str = "sqlite-writer"):
+        self.__queue = queue.Queue()
+        self.__thread = threading.Thread(target=self.__run, name=name, daemon=True)
+        self.__thread.start()
+
+    def submit(self, function: Callable, *args, **kwargs) -> Future:
+        """Queue function(*args, **kwargs) and return the future of its result"""
+        future = Future()
+        self.__queue.put((future, function, args, kwargs))
+        return future
+
+    def call(self, function: Callable, *args, **kwargs) -> Any:
+        """Run function(*args, **kwargs) in the writer thread and return its result"""
+        if threading.current_thread() is self.__thread:
+            return function(*args, **kwargs)
+        return self.submit(function, *args, **kwargs).result()
+
+    def pending(self) -> int:
+        """Number of writes waiting in the queue"""
+        return self.__queue.qsize()
+
+    def __run(self) -> None:
+        while True:
+            task = self.__queue.get()
+            if task is None:
+                return
+            future, function, args, kwargs = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args, **kwargs))
+            except BaseException as error:
+                future.set_exception(error)
+
+    def close(self) -> None:
+        """Run the writes already queued and stop the thread"""
+        if self.__thread.is_alive():
+            self.__queue.put(None)
+            if threading.current_thread() is not self.__thread:
+                self.__thread.join()
@@ -0,0 +1,80 @@
+"""
+    Query result cache tests
+"""
+import unittest
+
+from cached_repository import CATEGORIES, ITEMS, TABLES, CachedRepository, written_tables
+from sqlite_repository import SQLiteRepository
+
+
+class CachedRepositoryTest(unittest.TestCase):
+    def setUp(self):
+        self.sqlite = SQLiteRepository(":memory:")
+        self.sqlite.run_script("Material_database.sql")
+        self.sqlite.execute_many(
+            "INSERT INTO Categories (Id, Name, LastUse) VALUES (?, ?, ?)",
+            [(1, "Banderas", "2024-01-01 10:00:00"), (2, "Animales", "2024-01-02 10:00:00")],
+        )
+        self.sqlite.execute_many(
+            "INSERT INTO Items (Id, Text, CategoryId) VALUES (?, ?, ?)",
+            [(1, "item1", 1), (2, "item2", 1), (3, "item3", 2)],
+        )
+        self.sqlite.commit()
+        self.statements = []
+        self.sqlite.set_trace_callback(self.statements.append)
+        self.repository = CachedRepository(self.sqlite)
+
+    def tearDown(self):
+        self.sqlite.close()
+
+    def test_repeated_lookups(self):
+        first = self.repository.load_category(1)
+        self.assertIs(first, self.repository.load_category(1))
+        self.assertIsNone(self.repository.load_item(9))
+        self.assertIsNone(self.repository.load_item(9))
+        self.assertEqual(2, len(self.statements))
+        stats = self.repository.stats()
+        self.assertEqual((2, 2, 2), (stats["hits"], stats["misses"], stats["entries"]))
+
+    def test_invalidated_by_writes(self):
+        self.assertEqual(0, self.repository.load_item(1).Views)
+        self.repository.update_views([("2024-01-03 10:00:00", 1)], [(2, "2024-01-03 10:00:00", 1)])
+        self.assertEqual(2, self.repository.load_item(1).Views)
+
+        recent = self.repository.get_recent(1)
+        self.repository.execute("UPDATE Items SET Text = ? WHERE Id = ?", ("new", 1))
+        self.repository.commit()
+        self.assertEqual("new", self.repository.load_item(1).Text)
+        # Categories did not change
+        self.assertIs(recent, self.repository.get_recent(1))
+
+        self.repository.mark_category_completed(2)
+        self.repository.commit()
+        self.assertIsNot(recent, self.repository.get_recent(1))
+        self.assertTrue(self.repository.load_category(2).Completed)
+
+    def test_whole_tables_not_cached(self):
+        self.repository.load_items()
+        self.repository.load_items()
+        self.repository.load_complete_categories()
+        self.repository.load_complete_categories()
+        self.assertEqual(4, len(self.statements))
+        self.assertEqual(0, self.repository.stats()["entries"])
+
+    def test_disabled(self):
+        self.repository.enabled = False
+        self.repository.load_item(1)
+        self.repository.load_item(1)
+        self.assertEqual(2, len(self.statements))
+        self.assertEqual(0, self.repository.stats()["misses"])
+
+    def test_written_tables(self):
+        self.assertEqual((ITEMS,), written_tables("update items set Views = 1"))
+        self.assertEqual((CATEGORIES,), written_tables('INSERT OR REPLACE INTO "Categories" VALUES (1)'))
+        self.assertEqual((CATEGORIES,), written_tables("DELETE FROM Categories"))
+        self.assertEqual((), written_tables("INSERT INTO Other VALUES (1)"))
+        self.assertEqual(TABLES, written_tables("DROP TABLE Items"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+"""
+    ConnectionPool tests
+"""
+import sqlite3
+import threading
+import unittest
+
+from connection_pool import ConnectionPool, memory_database_uri
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        uri = memory_database_uri()
+        self.keep_alive = sqlite3.connect(uri, uri=True)
+        self.pool = ConnectionPool(
+            lambda: sqlite3.connect(uri, uri=True, check_same_thread=False),
+            max_connections=2,
+            timeout=0.1,
+        )
+
+    def tearDown(self):
+        self.pool.close()
+        self.keep_alive.close()
+
+    def in_thread(self, function):
+        result = []
+        thread = threading.Thread(target=lambda: result.append(function()))
+        thread.start()
+        thread.join()
+        return result[0] if result else None
+
+    def leased(self):
+        with self.pool.lease() as connection:
+            return connection
+
+    def test_same_connection_in_block(self):
+        with self.pool.lease() as connection:
+            with self.pool.lease() as nested:
+                self.assertIs(connection, nested)
+            self.assertIs(connection, self.pool.connection())
+        self.assertEqual(1, self.pool.size())
+        self.assertRaises(sqlite3.ProgrammingError, self.pool.connection)
+
+    def test_connection_per_thread(self):
+        barrier = threading.Barrier(2)
+
+        def other():
+            with self.pool.lease() as other_connection:
+                barrier.wait()
+                barrier.wait()
+                return other_connection
+
+        with self.pool.lease() as connection:
+            thread = threading.Thread(target=other)
+            thread.start()
+            barrier.wait()
+            self.assertEqual(2, self.pool.size())
+            barrier.wait()
+            thread.join()
+            self.assertIsNot(connection, self.in_thread(self.leased))
+
+    def test_released_when_block_ends(self):
+        first = self.in_thread(self.leased)
+        second = self.in_thread(self.leased)
+        self.assertIs(first, second)
+        self.assertIs(first, self.leased())
+        self.assertEqual(1, self.pool.size())
+
+    def test_idle_threads_hold_no_connection(self):
+        # More threads than connections, each reading once and then waiting
+        done = threading.Event()
+        errors = []
+
+        def read():
+            with self.pool.lease() as connection:
+                return connection.execute("SELECT 1").fetchone()[0]
+
+        def read_and_wait():
+            try:
+                read()
+            except sqlite3.Error as error:
+                errors.append(error)
+            done.wait()
+
+        threads = [threading.Thread(target=read_and_wait) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        try:
+            self.assertEqual(1, self.in_thread(read))
+        finally:
+            done.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual([], errors)
+
+    def test_max_connections(self):
+        holding = threading.Barrier(2)
+        done = threading.Event()
+
+        def hold():
+            with self.pool.lease():
+                holding.wait()
+                done.wait()
+
+        def connect():
+            try:
+                self.leased()
+            except sqlite3.OperationalError as error:
+                return error
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        with self.pool.lease():
+            holding.wait()
+            try:
+                self.assertIsInstance(self.in_thread(connect), sqlite3.OperationalError)
+            finally:
+                done.set()
+                thread.join()
+
+    def test_broken_connection_replaced(self):
+        broken = self.leased()
+        broken.close()
+        self.pool.check_interval = 0
+        connection = self.leased()
+        self.assertIsNot(broken, connection)
+        self.assertEqual(1, connection.execute("SELECT 1").fetchone()[0])
+        self.assertEqual(1, self.pool.size())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+    DBWords tests
+"""
+import unittest
+
+from plugins.vocabulary.service import Service
+
+
+class DBWordsTest(unittest.TestCase):
+    def setUp(self):
+        self.service = Service(":memory:")
+        self.db_words = self.service.db_words
+        for category in range(1, 6):
+            self.db_words.create_category(
+                {
+                    "name": f"category{category}",
+                    "words": [{"word": f"word{category}-{i}"} for i in range(4)],
+                }
+            )
+
+    def test_select_categories_page(self):
+        page = self.db_words.select_categories_page(2, 3)
+        self.assertEqual([4, 5], [c["id"] for c in page])
+
+    def test_categories_pages(self):
+        ids = []
+        after = 0
+        while after is not None:
+            page, cursor = self.service.get_categories_page(2, after)
+            ids += [c["id"] for c in page]
+            after = None if cursor is None else int(cursor)
+        self.assertEqual([1, 2, 3, 4, 5], ids)
+
+    def test_words_page(self):
+        words, cursor = self.service.get_words_page(15)
+        self.assertEqual(list(range(1, 16)), [w["id"] for w in words])
+        self.assertEqual("15", cursor)
+        words, cursor = self.service.get_words_page(15, 15)
+        self.assertEqual(5, len(words))
+        self.assertIsNone(cursor)
+
+    def test_words_for_categories(self):
+        words = self.db_words.get_words_for_categories([2, 4])
+        self.assertEqual({2, 4}, {w["categoryId"] for w in words})
+        self.assertEqual(8, len(words))
+
+    def test_update_views(self):
+        updated = self.db_words.update_views({"id": 1, "words": [{"id": 1}, {"id": 3}]})
+        self.assertEqual([1, 3], [w["id"] for w in updated["words"]])
+        self.assertEqual([1, 1], [w["views"] for w in updated["words"]])
+        self.assertIsNotNone(updated["lastUse"])
+
+    def test_delete_words(self):
+        self.db_words.delete_words([{"id": 1}, {"id": 2}])
+        words = self.db_words.get_words_for_categories([1])
+        self.assertEqual([3, 4], sorted(w["id"] for w in words))
+
+    def test_update_category(self):
+        self.db_words.update_category({"id": 2, "name": "renamed"})
+        self.assertEqual("renamed", self.db_words.select_category(2)["name"])
+
+    def test_update_category_keeps_missing_columns(self):
+        self.db_words.update_category({"id": 2, "lastUse": "2024-01-02 10:00:00.000000"})
+        self.db_words.update_category({"id": 2, "name": "renamed"})
+        category = self.db_words.select_category(2)
+        self.assertEqual("renamed", category["name"])
+        self.assertEqual(2024, category["lastUse"].year)
+
+
+if __name__ == "__main__":
+    unittest.main()
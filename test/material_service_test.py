@@ -2,21 +2,26 @@
     MaterialService tests
 """
 
+import json
+import sqlite3
+import tempfile
 from datetime import datetime as dt, timedelta
 from doctest import testmod
+from pathlib import Path
 from unittest import TestCase
 from material_json_service import MaterialJsonService
 from material_service import MaterialService
 from model import Category
 from model import Item
 from sqlite_repository import SQLiteRepository
+from util import to_json
+from write_behind import ViewBuffer
 
 
 class MaterialServiceTest(TestCase):
-    def __init__(self):
-        super().__init__(self)
+    def setUp(self):
         repository = SQLiteRepository(":memory:")
-        repository
+        repository.run_script("Material_database.sql")
         self.service = MaterialService(repository)
 
     def test_get_recent(self):
@@ -25,6 +30,318 @@ class MaterialServiceTest(TestCase):
         self.assertIsNotNone(categories)
 
 
+class CompleteCategoriesTest(TestCase):
+    def setUp(self):
+        self.repository = SQLiteRepository(":memory:")
+        self.repository.run_script("Material_database.sql")
+        self.repository.cur.executemany(
+            "INSERT INTO Categories (Id, Name) VALUES (?, ?)",
+            [(category_id, f"category{category_id}") for category_id in range(1, 11)],
+        )
+        self.repository.cur.executemany(
+            "INSERT INTO Items (Text, Views, CategoryId) VALUES (?, ?, ?)",
+            [(f"item{i}", i % 5, i % 9 + 1) for i in range(100)],
+        )
+        self.repository.commit()
+        self.service = MaterialService(self.repository)
+
+    def test_get_all_complete_categories(self):
+        categories = self.service.get_all_complete_categories()
+        self.assertEqual(list(range(1, 11)), [c.Id for c in categories])
+        self.assertEqual(100, sum(len(c.Items) for c in categories))
+        # Category 10 has no items
+        self.assertEqual([], categories[-1].Items)
+        for category in categories[:-1]:
+            expected = self.service.get_category(category.Id)
+            self.assertEqual(expected.Items, category.Items)
+
+    def test_get_categories_page(self):
+        categories, cursor = self.service.get_categories_page(4)
+        self.assertEqual([1, 2, 3, 4], [c.Id for c in categories])
+        self.assertEqual("4", cursor)
+        categories, cursor = self.service.get_categories_page(4, 8)
+        self.assertEqual([9, 10], [c.Id for c in categories])
+        self.assertEqual([], categories[-1].Items)
+        self.assertIsNone(cursor)
+
+    def test_items_pages(self):
+        items = []
+        after = 0
+        while after is not None:
+            page, cursor = self.service.get_items_page(30, after)
+            items += page
+            after = None if cursor is None else int(cursor)
+        self.assertEqual(self.service.get_all_items(), items)
+
+    def test_iter_all_items(self):
+        items = self.service.iter_all_items()
+        self.assertEqual("item0", next(items).Text)
+        self.assertEqual(99, len(list(items)))
+
+    def test_get_all_complete_categories_single_query(self):
+        statements = []
+        self.repository.set_trace_callback(statements.append)
+        self.service.get_all_complete_categories()
+        self.repository.set_trace_callback(None)
+        self.assertEqual(1, len(statements))
+
+
+class RecentTest(TestCase):
+    def setUp(self):
+        self.repository = SQLiteRepository(":memory:")
+        self.repository.run_script("Material_database.sql")
+        today = dt(2024, 1, 10, 10)
+        self.repository.execute_many(
+            "INSERT INTO Categories (Id, Name, LastUse) VALUES (?, ?, ?)",
+            [(c, f"category{c}", today - timedelta(days=c * 3 % 8)) for c in range(1, 9)],
+        )
+        self.repository.execute_many(
+            "INSERT INTO Items (Text, Views, CategoryId) VALUES (?, ?, ?)",
+            [(f"item{i}", i % 3, i % 8 + 1) for i in range(80)],
+        )
+        self.repository.commit()
+        self.service = MaterialService(self.repository)
+        self.service.recent_count = 3
+
+    def test_get_recent(self):
+        batches = self.service.get_recent()
+        self.assertEqual([8, 3, 6], [batch.Id for batch in batches])
+        for batch in batches:
+            self.assertEqual(self.service.batch_size, len(batch.Items))
+            expected = {item.Id for item in self.service.get_category(batch.Id).Items}
+            self.assertLessEqual({item.Id for item in batch.Items}, expected)
+
+    def test_batch_refers_to_category_items(self):
+        category = self.service.get_category(2)
+        batch = self.service.get_batch(category)
+        self.assertEqual(self.service.batch_size, len(batch.Items))
+        for item in batch.Items:
+            self.assertTrue(any(item is other for other in category.Items))
+        expected = Category(
+            category.Name,
+            list(batch.Items),
+            category.LastUse,
+            category.Completed,
+            category.Type,
+            category.Id,
+        )
+        self.assertEqual(to_json(expected), to_json(batch))
+
+    def test_completed_batch(self):
+        self.repository.execute("UPDATE Items SET Views = ?", (self.service.max_views,))
+        self.repository.commit()
+        category = self.service.get_category(2)
+        batch = self.service.get_batch(category)
+        self.assertTrue(batch.Completed)
+        self.assertEqual(len(category.Items), len(batch.Items))
+
+    def test_completed_by_update(self):
+        # All the items of category 2 but one have reached max_views
+        self.repository.execute(
+            "UPDATE Items SET Views = ? - (Id = (SELECT MIN(Id) FROM Items WHERE CategoryId = 2)) "
+            + "WHERE CategoryId = 2",
+            (self.service.max_views,),
+        )
+        version = self.service.data_version()
+        statements = []
+        self.repository.set_trace_callback(statements.append)
+        self.service.recent_count = 10
+        batch = next(batch for batch in self.service.get_recent() if batch.Id == 2)
+        # Reads do not write
+        self.assertFalse(any(statement.startswith("UPDATE") for statement in statements))
+        self.assertEqual(version, self.service.data_version())
+        self.assertFalse(batch.Completed)
+
+        self.assertTrue(self.service.update_batch(batch))
+        self.assertTrue(self.service.get_category(2).Completed)
+        # Nor do they once the category is completed
+        version = self.service.data_version()
+        statements.clear()
+        self.assertTrue(self.service.get_recent()[0].Completed)
+        self.repository.set_trace_callback(None)
+        self.assertFalse(any(statement.startswith("UPDATE") for statement in statements))
+        self.assertEqual(version, self.service.data_version())
+
+    def test_update_batch_error_logged(self):
+        batch = self.service.get_recent()[0]
+        self.repository.execute_statement("DROP TABLE Items")
+        with self.assertLogs("material_service", "ERROR") as logs:
+            self.assertFalse(self.service.update_batch(batch))
+        self.assertIn("Could not update batch", logs.output[0])
+
+    def test_client_views_ignored(self):
+        batch = self.service.get_recent()[0]
+        with self.assertNoLogs("material_service", "WARNING"):
+            self.assertTrue(self.service.update_batch(batch))
+        stored = {item.Id: item.Views for item in self.service.get_category(batch.Id).Items}
+
+        sent = json.loads(to_json(self.service.get_recent()[0]))
+        self.assertEqual(batch.Id, sent["Id"])
+        sent["Items"][0]["Views"] += 10
+        with self.assertLogs("material_service", "WARNING") as logs:
+            self.assertTrue(self.service.update_batch(self.service.batch_from_json(sent)))
+        self.assertIn(str(sent["Items"][0]["Id"]), logs.output[0])
+        for item in self.service.get_category(batch.Id).Items:
+            if any(item.Id == viewed["Id"] for viewed in sent["Items"]):
+                self.assertEqual(stored[item.Id] + 1, item.Views)
+
+    def test_update_keeps_view_order(self):
+        batch = self.service.get_recent()[0]
+        self.assertTrue(self.service.update_batch(batch))
+        statements = []
+        self.repository.set_trace_callback(statements.append)
+        batches = self.service.get_recent()
+        self.repository.set_trace_callback(None)
+        self.assertFalse(any("json_each" in statement for statement in statements))
+        reloaded = self.service.get_batch(self.service.get_category(batch.Id))
+        self.assertEqual(to_json(reloaded.Items), to_json(batches[0].Items))
+
+    def test_update_and_get_next_batch(self):
+        batch = self.service.get_recent()[0]
+        views = {item.Id: item.Views for item in batch.Items}
+
+        next_batch = self.service.update_and_get_next_batch(
+            self.service.batch_from_json(json.loads(to_json(batch)))
+        )
+
+        category = self.service.get_category(batch.Id)
+        for item in category.Items:
+            if item.Id in views:
+                self.assertEqual(views[item.Id] + 1, item.Views)
+        self.assertEqual(to_json(self.service.get_batch(category)), to_json(next_batch))
+
+    def test_next_batch_with_view_buffer(self):
+        self.service.view_buffer = ViewBuffer(self.repository, flush_interval=60)
+        batch = self.service.get_recent()[0]
+        next_batch = self.service.update_and_get_next_batch(batch)
+        self.service.view_buffer.close()
+        category = self.service.get_category(batch.Id)
+        self.assertEqual(
+            [item.Views for item in self.service.get_batch(category).Items],
+            [item.Views for item in next_batch.Items],
+        )
+
+    def test_next_batch_from_updated_category(self):
+        batch = self.service.get_recent()[0]
+        # Orders outdated by another write: the batch still comes from the
+        # category read with the update, not from a read after it
+        self.repository.execute("UPDATE Categories SET Name = Name WHERE Id = ?", (1,))
+        statements = []
+        self.repository.set_trace_callback(statements.append)
+        next_batch = self.service.update_and_get_next_batch(batch)
+        self.repository.set_trace_callback(None)
+        self.assertFalse(any("json_each" in statement for statement in statements))
+        category = self.service.get_category(batch.Id)
+        self.assertEqual(to_json(self.service.get_batch(category)), to_json(next_batch))
+
+    def test_next_batch_with_view_buffer_stored_category(self):
+        self.service.view_buffer = ViewBuffer(self.repository, flush_interval=60)
+        sent = json.loads(to_json(self.service.get_recent()[0]))
+        sent["Name"] = "renamed by the client"
+        next_batch = self.service.update_and_get_next_batch(self.service.batch_from_json(sent))
+        stored = self.service.get_category(sent["Id"])
+        self.assertEqual(stored.Name, next_batch.Name)
+        self.assertEqual(stored.LastUse, next_batch.LastUse)
+
+        sent["Id"] = 100
+        self.assertIsNone(
+            self.service.update_and_get_next_batch(self.service.batch_from_json(sent))
+        )
+        self.service.view_buffer.close()
+
+    def test_next_batch_with_view_buffer_after_change(self):
+        self.service.view_buffer = ViewBuffer(self.repository, flush_interval=60)
+        batch = self.service.get_recent()[0]
+        get_view_orders = self.service.get_view_orders
+
+        def read_then_change(ids):
+            # Another write and read between reading the order and adding the
+            # views, which replaces the order kept
+            orders = get_view_orders(ids)
+            self.repository.execute("UPDATE Categories SET Name = Name WHERE Id = ?", (1,))
+            get_view_orders(ids)
+            return orders
+
+        self.service.get_view_orders = read_then_change
+        next_batch = self.service.update_and_get_next_batch(batch)
+        self.service.view_buffer.close()
+        category = self.service.get_category(batch.Id)
+        self.assertEqual(
+            [item.Views for item in self.service.get_batch(category).Items],
+            [item.Views for item in next_batch.Items],
+        )
+
+    def test_ready_batches(self):
+        self.service = MaterialService(self.repository, batch_workers=1)
+        self.service.recent_count = 3
+        batch = self.service.get_recent()[0]
+        self.service.update_batch(batch)
+        self.service.close()
+        self.assertIn(batch.Id, self.service.ready_batches)
+
+        statements = []
+        self.repository.set_trace_callback(statements.append)
+        ready = self.service.get_recent()
+        self.repository.set_trace_callback(None)
+        self.assertFalse(any("json_each" in statement for statement in statements))
+        category = self.service.get_category(batch.Id)
+        self.assertEqual(to_json(self.service.get_batch(category)), to_json(ready[0]))
+
+        # A change of the catalog discards them
+        self.repository.execute("UPDATE Items SET Views = 0", ())
+        self.repository.commit()
+        self.service.get_recent()
+        self.assertEqual({}, self.service.ready_batches)
+
+    def test_items_in_category_order(self):
+        pairs = self.repository.load_recent_items([3, 1])
+        self.assertEqual([3] * 10 + [1] * 10, [category_id for category_id, _ in pairs])
+        self.assertEqual(sorted(item.Id for _, item in pairs[:10]), [item.Id for _, item in pairs[:10]])
+
+
+class ViewOrderVersionTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = Path(self.directory.name, "material.db3")
+        self.repository = SQLiteRepository(self.database)
+        self.repository.run_script("Material_database.sql")
+        self.repository.execute_many(
+            "INSERT INTO Categories (Id, Name) VALUES (?, ?)", [(1, "category1")]
+        )
+        self.repository.execute_many(
+            "INSERT INTO Items (Text, Views, CategoryId) VALUES (?, ?, ?)",
+            [(f"item{i}", 0, 1) for i in range(8)],
+        )
+        self.service = MaterialService(self.repository)
+
+    def tearDown(self):
+        self.repository.close()
+        self.directory.cleanup()
+
+    def test_update_keeps_orders(self):
+        batch = self.service.get_recent()[0]
+        self.service.update_batch(batch)
+        self.assertIn(1, self.service.view_orders)
+
+    def test_other_commit_during_update(self):
+        batch = self.service.get_recent()[0]
+        other = sqlite3.connect(self.database)
+
+        def commit_from_other(statement):
+            # Another process changes the views just as the batch is written
+            if statement.startswith("BEGIN"):
+                self.repository.set_trace_callback(None)
+                other.execute("UPDATE Items SET Views = 3")
+                other.commit()
+
+        self.repository.set_trace_callback(commit_from_other)
+        self.assertTrue(self.service.update_batch(batch))
+        other.close()
+        self.assertEqual({}, self.service.view_orders)
+        order = self.service.get_view_orders([1])[1]
+        self.assertEqual(3 * 8 + len(batch.Items), sum(item.Views for item in order.elements))
+
+
 # class JsonMaterialServiceTest(TestCase):
 #     ''' '''
 #     def setUp(self) -> None:
@@ -0,0 +1,114 @@
+"""
+    metrics module tests
+"""
+import gc
+import threading
+import unittest
+
+from flask import Blueprint, Flask, Response
+
+from metrics import Metrics, MetricsMiddleware, RecordingIterable
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        blueprint = Blueprint("books_api", __name__)
+
+        @self.app.route("/items")
+        def items():
+            return "[1, 2, 3]"
+
+        @self.app.route("/stream")
+        def stream():
+            return Response(iter([b"ab", b"cd", b"e"]))
+
+        @blueprint.route("/books")
+        def books():
+            return "[]"
+
+        self.app.register_blueprint(blueprint)
+        self.metrics = Metrics(latency_buckets=(0.5, 10), size_buckets=(4, 100))
+        MetricsMiddleware(self.app, self.metrics)
+        self.client = self.app.test_client()
+
+    def get(self, path):
+        response = self.client.get(path)
+        data = response.get_data()
+        response.close()
+        return data
+
+    def test_counts_per_endpoint(self):
+        self.get("/items")
+        self.get("/items")
+        self.get("/books")
+        self.get("/missing")
+        text = self.metrics.render()
+        self.assertIn(
+            'http_requests_total{endpoint="items",method="GET",status="200"} 2', text
+        )
+        self.assertIn(
+            'http_requests_total{endpoint="books_api.books",method="GET",status="200"} 1',
+            text,
+        )
+        self.assertIn(
+            'http_requests_total{endpoint="none",method="GET",status="404"} 1', text
+        )
+
+    def test_histograms(self):
+        self.get("/items")
+        text = self.metrics.render()
+        self.assertIn('http_request_duration_seconds_bucket{endpoint="items",le="0.5"} 1', text)
+        self.assertIn('http_request_duration_seconds_count{endpoint="items"} 1', text)
+        self.assertIn('http_response_size_bytes_bucket{endpoint="items",le="4"} 0', text)
+        self.assertIn('http_response_size_bytes_bucket{endpoint="items",le="100"} 1', text)
+        self.assertIn('http_response_size_bytes_bucket{endpoint="items",le="+Inf"} 1', text)
+        self.assertIn('http_response_size_bytes_sum{endpoint="items"} 9', text)
+
+    def test_streamed_size(self):
+        self.assertEqual(b"abcde", self.get("/stream"))
+        self.assertIn(
+            'http_response_size_bytes_sum{endpoint="stream"} 5', self.metrics.render()
+        )
+
+    def test_in_flight(self):
+        response = self.client.get("/stream", buffered=False)
+        self.assertIn("http_requests_in_flight 1\n", self.metrics.render())
+        response.get_data()
+        response.close()
+        self.assertIn("http_requests_in_flight 0\n", self.metrics.render())
+
+    def test_body_not_closed(self):
+        finished = []
+        body = RecordingIterable(iter([b"ab", b"c"]), finished.append)
+        self.assertEqual(b"abc", b"".join(body))
+        self.assertEqual([3], finished)
+        body.close()
+        self.assertEqual([3], finished)
+
+    def test_body_dropped(self):
+        finished = []
+        body = RecordingIterable(iter([b"ab"]), finished.append)
+        del body
+        gc.collect()
+        self.assertEqual([0], finished)
+
+    def test_threads_added_up(self):
+        def record():
+            for _ in range(100):
+                self.metrics.record("items", "GET", "200", 0.1, 10)
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        text = self.metrics.render()
+        self.assertIn(
+            'http_requests_total{endpoint="items",method="GET",status="200"} 400', text
+        )
+        self.assertIn('http_request_duration_seconds_count{endpoint="items"} 400', text)
+
+
+if __name__ == "__main__":
+    unittest.main()
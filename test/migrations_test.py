@@ -0,0 +1,122 @@
+"""
+    Schema migrations tests
+"""
+import re
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from migrations import MATERIAL_MIGRATIONS, migrate, schema_version
+from plugins.vocabulary.db_words import DBWords
+from sqlite_repository import SQLiteRepository
+
+# Plan steps that read a whole table, or subquery
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+# Plan steps that run a subquery
+SUBQUERY = re.compile(r"^(?:CO-ROUTINE|MATERIALIZE) (\w+)")
+
+
+def query_plans(connection, statements):
+    """Query plan details of every statement"""
+    return {
+        statement: [
+            row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {statement}")
+        ]
+        for statement in statements
+    }
+
+
+class MigrationsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = Path(self.directory.name, "material.db3")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_new_database(self):
+        repository = SQLiteRepository(self.database)
+        repository.run_script("Material_database.sql")
+        self.assertEqual(len(MATERIAL_MIGRATIONS), repository.migrate())
+        repository.close()
+
+    def test_upgrade_in_place(self):
+        connection = sqlite3.connect(self.database)
+        connection.executescript(Path("Material_database.sql").read_text())
+        connection.execute("INSERT INTO Categories (Id, Name) VALUES (1, 'Banderas')")
+        connection.commit()
+        self.assertEqual(0, schema_version(connection))
+        connection.close()
+
+        repository = SQLiteRepository(self.database)
+        self.assertEqual(len(MATERIAL_MIGRATIONS), repository.migrate())
+        self.assertEqual(1, len(repository.all_table_content("Categories")))
+        indexes = repository.execute_sql_select(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name = 'Items_CategoryId'"
+        )
+        self.assertEqual(1, len(indexes))
+        repository.close()
+
+    def test_failed_migration(self):
+        connection = sqlite3.connect(self.database)
+        migrations = [
+            ("CREATE TABLE First (Id INTEGER)",),
+            ("CREATE TABLE Second (Id INTEGER)", "CREATE INDEX Bad ON Missing (Id)"),
+        ]
+        self.assertRaises(sqlite3.Error, migrate, connection, migrations)
+        self.assertEqual(1, schema_version(connection))
+        tables = [row[0] for row in connection.execute("SELECT name FROM sqlite_master")]
+        self.assertEqual(["First"], tables)
+        connection.close()
+
+
+class QueryPlanTest(unittest.TestCase):
+    """Hot queries search through indexes instead of reading whole tables"""
+
+    def assertNoFullScan(self, plans):
+        for statement, details in plans.items():
+            subqueries = {m.group(1) for m in map(SUBQUERY.match, details) if m}
+            for detail in details:
+                scan = FULL_SCAN.match(detail)
+                if scan and scan.group(1) not in subqueries:
+                    self.fail(f"{statement}: {detail}")
+
+    def test_material_queries(self):
+        repository = SQLiteRepository(":memory:")
+        repository.run_script("Material_database.sql")
+        statements = []
+        repository.set_trace_callback(statements.append)
+        repository.category(1)
+        repository.load_category(1)
+        repository.get_recent(5)
+        repository.load_recent_items([1, 2, 3])
+        repository.get_item(1)
+        repository.load_items_page(10, 0)
+        repository.load_categories_page(10, 0)
+        repository.set_trace_callback(None)
+        connection = sqlite3.connect(":memory:")
+        connection.executescript(Path("Material_database.sql").read_text())
+        migrate(connection, MATERIAL_MIGRATIONS)
+        plans = query_plans(connection, statements)
+        self.assertNoFullScan(plans)
+        for statement, details in plans.items():
+            if "ORDER BY LastUse DESC" in statement:
+                self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", details)
+        repository.close()
+
+    def test_words_queries(self):
+        db_words = DBWords(":memory:")
+        db_words.create_category({"name": "animals", "words": [{"word": "cat"}]})
+        statements = []
+        db_words.connection.set_trace_callback(statements.append)
+        db_words.select_category(1)
+        db_words.get_words_for_categories([1, 2])
+        db_words.get_recent(7, 5)
+        db_words.connection.set_trace_callback(None)
+        self.assertNoFullScan(query_plans(db_words.connection, statements))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+    In-memory replica tests
+"""
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from sqlite_repository import SQLiteRepository
+from storage_profile import get_profile
+
+
+class ReplicaTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = Path(self.directory.name, "material.db3")
+        repository = SQLiteRepository(self.database)
+        repository.run_script("Material_database.sql")
+        repository.execute("INSERT INTO Categories (Id, Name) VALUES (?, ?)", (1, "Banderas"))
+        repository.execute_many(
+            "INSERT INTO Items (Id, Text, Views, CategoryId) VALUES (?, ?, ?, ?)",
+            [(1, "item1", 0, 1), (2, "item2", 0, 1)],
+        )
+        repository.commit()
+        repository.close()
+        self.repository = SQLiteRepository(self.database, profile=get_profile("memory"))
+
+    def tearDown(self):
+        self.repository.close()
+        self.directory.cleanup()
+
+    def read_file(self, sql):
+        connection = sqlite3.connect(self.database)
+        try:
+            return connection.execute(sql).fetchall()
+        finally:
+            connection.close()
+
+    def test_reads_from_memory(self):
+        self.assertEqual([1, 2], [item.Id for item in self.repository.load_category(1).Items])
+        self.assertEqual(
+            [("main", "")],
+            [(row[1], row[2]) for row in self.repository.execute_sql_objects("PRAGMA database_list")],
+        )
+        # Changes made to the file by others are not seen
+        connection = sqlite3.connect(self.database)
+        connection.execute("DELETE FROM Items")
+        connection.commit()
+        connection.close()
+        self.assertEqual(2, len(self.repository.load_items()))
+
+    def test_writes_to_both(self):
+        self.repository.update_views([("2024-01-01 10:00:00", 1)], [(3, "2024-01-01 10:00:00", 1)])
+        self.repository.execute_many(
+            "INSERT INTO Items (Text, CategoryId) VALUES (?, ?)",
+            ((text, 1) for text in ("perro", "gato")),
+        )
+        self.repository.commit()
+
+        self.assertEqual(3, self.repository.load_item(1).Views)
+        self.assertEqual(4, len(self.repository.load_category(1).Items))
+        self.assertEqual([(3,)], self.read_file("SELECT Views FROM Items WHERE Id = 1"))
+        self.assertEqual([(4,)], self.read_file("SELECT COUNT(*) FROM Items"))
+
+    def test_failed_write_leaves_both_unchanged(self):
+        with self.assertRaises(sqlite3.Error):
+            self.repository.update_views([("2024-01-01 10:00:00", 1)], [(1, "2024-01-01 10:00:00")])
+        self.assertIsNone(self.repository.load_category(1).LastUse)
+        self.assertEqual([(None,)], self.read_file("SELECT LastUse FROM Categories"))
+
+    def test_replica_reloaded_when_it_fails(self):
+        self.assertEqual(2, len(self.repository.load_items()))
+        # A table the replica does not have: the insert only works on the file
+        connection = sqlite3.connect(self.database)
+        connection.execute("CREATE TABLE Notes (Id INTEGER PRIMARY KEY, Text TEXT)")
+        connection.commit()
+        connection.close()
+        with self.assertRaises(sqlite3.Error):
+            self.repository.execute("INSERT INTO Notes (Text) VALUES (?)", ("note",))
+        self.assertEqual([(0,)], self.read_file("SELECT COUNT(*) FROM Notes"))
+        self.assertEqual(
+            [(0,)], self.repository.execute_sql_objects("SELECT COUNT(*) FROM Notes")
+        )
+        self.repository.execute("INSERT INTO Notes (Text) VALUES (?)", ("note",))
+        self.assertEqual(
+            [(1,)], self.repository.execute_sql_objects("SELECT COUNT(*) FROM Notes")
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
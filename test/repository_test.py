@@ -1,5 +1,10 @@
 import datetime as dt
+import sqlite3
+import tempfile
+import threading
 import unittest
+from pathlib import Path
+from unittest import mock
 from model import Category, Item
 
 from sqlite_repository import SQLiteRepository
@@ -63,3 +68,173 @@ class RepositoryTest(unittest.TestCase):
         category_id = categ["id"]
         items = [it for it in rows if it["CategoryId"] == category_id]
         self.assertEqual("item1", items[0]["text"])
+
+    def test_iter_items(self):
+        self.repository.execute_many(
+            "insert into Items (Id, Text, CategoryId) values (?, ?, ?)",
+            [(i, f"item{i}", 1) for i in range(1, 1201)],
+        )
+
+        items = self.repository.iter_item_objects()
+        self.assertEqual(1, next(items).Id)
+        self.assertEqual(list(range(2, 1201)), [item.Id for item in items])
+
+    def test_read_from_other_thread(self):
+        self.repository.execute("insert into Categories (Id, Name) values (?, ?)", (1, "Banderas"))
+        self.repository.commit()
+        found = []
+        thread = threading.Thread(
+            target=lambda: found.extend(self.repository.all_table_content("Categories"))
+        )
+        thread.start()
+        thread.join()
+        self.assertEqual(["Banderas"], [row["Name"] for row in found])
+
+    def test_get_items(self):
+        self.repository.execute_many(
+            "insert into Items (Id, Text, CategoryId) values (?, ?, ?)",
+            [(1, "item1", 1), (2, "item2", 2), (3, "item3", 3)],
+        )
+        rows = self.repository.get_items([2])
+        self.assertEqual([2], [row["Id"] for row in rows])
+        self.assertEqual([], self.repository.get_items([]))
+
+    def test_select_error_logged(self):
+        with mock.patch("sqlite_repository.logger") as logger:
+            self.assertRaises(
+                sqlite3.OperationalError, self.repository.all_table_content, "Missing"
+            )
+        logger.exception.assert_called_once()
+        self.assertIn("no such table: Missing", logger.exception.call_args.args[0])
+
+    def test_load_objects(self):
+        self.repository.execute_many(
+            "insert into Categories (Id, Name, Type) values (?, ?, ?)",
+            [(1, "Banderas", 1), (2, "Vacia", 0)],
+        )
+        self.repository.execute_many(
+            "insert into Items (Id, Text, Image, Views, CategoryId) values (?, ?, ?, ?, ?)",
+            [(1, "item1", "item1.jpg", 3, 1), (2, "item2", None, 0, 1)],
+        )
+
+        self.assertEqual(
+            [Item(Text="item1", Image="item1.jpg", Views=3, Id=1), Item(Text="item2", Id=2)],
+            self.repository.load_items(),
+        )
+        self.assertEqual("item2", self.repository.load_item(2).Text)
+        self.assertIsNone(self.repository.load_item(3))
+
+        category = self.repository.load_category(1)
+        self.assertEqual(("Banderas", 1, 1), (category.Name, category.Type, category.Id))
+        self.assertEqual([1, 2], [item.Id for item in category.Items])
+        self.assertIsNone(self.repository.load_category(2))
+
+        categories = self.repository.load_complete_categories()
+        self.assertEqual([1, 2], [c.Id for c in categories])
+        self.assertEqual([], categories[1].Items)
+        self.assertEqual([2], [c.Id for c in self.repository.load_categories_page(5, 1)])
+
+    def test_iter_objects(self):
+        self.repository.execute_many(
+            "insert into Categories (Id, Name, Type) values (?, ?, ?)",
+            [(i, f"category{i}", 1) for i in range(1, 601)],
+        )
+        self.repository.execute_many(
+            "insert into Items (Id, Text, CategoryId) values (?, ?, ?)",
+            [(i, f"item{i}", (i + 1) // 2) for i in range(1, 1201)],
+        )
+        statements = []
+        self.repository.set_trace_callback(statements.append)
+
+        categories = self.repository.iter_category_objects()
+        self.assertEqual([], statements)
+        first = next(categories)
+        self.assertEqual([1, 2], [item.Id for item in first.Items])
+        self.assertEqual(list(range(2, 601)), [c.Id for c in categories])
+        self.assertEqual(1, len(statements))
+
+        items = self.repository.iter_item_objects()
+        self.assertEqual(Item(Text="item1", Id=1), next(items))
+        items.close()
+        self.assertEqual([], list(items))
+        self.assertEqual(2, len(statements))
+
+        pairs = self.repository.load_recent_items([3, 1])
+        self.assertEqual([5, 6, 1, 2], [item.Id for _, item in pairs])
+
+    def test_save_categories(self):
+        self.repository.execute("insert into Categories (Id, Name) values (?, ?)", (1, "Vacia"))
+        self.repository.execute("insert into Items (Id, Text) values (?, ?)", (1, "item1"))
+        self.repository.commit()
+        indexes = self.repository.execute_sql_objects(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL ORDER BY name"
+        )
+        categories = [
+            Category("Banderas", [Item("item2", "item2.jpg"), Item("item1", Id=1)]),
+            Category("Animales", [Item("item3")]),
+        ]
+
+        result = self.repository.save_categories(categories, defer_indexes=True)
+
+        self.assertEqual((2, 3), (result.categories, result.items))
+        self.assertGreater(result.rows_per_second, 0)
+        self.assertEqual([2, 3], [category.Id for category in categories])
+        self.assertEqual(
+            ["item1", "item2"], [item.Text for item in self.repository.load_category(2).Items]
+        )
+        self.assertEqual(
+            indexes,
+            self.repository.execute_sql_objects(
+                "SELECT sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL ORDER BY name"
+            ),
+        )
+
+    def test_save_categories_holds_write_lock(self):
+        with tempfile.TemporaryDirectory() as directory:
+            database = Path(directory, "material.db3")
+            repository = SQLiteRepository(database)
+            repository.run_script("Material_database.sql")
+            other = sqlite3.connect(database, timeout=0)
+            blocked = []
+
+            def insert_from_other(statement):
+                # Another process adding a category while the last Id is read
+                if "MAX(Id)" not in statement:
+                    return
+                try:
+                    other.execute("INSERT INTO Categories (Id, Name) VALUES (1, 'other')")
+                    other.commit()
+                except sqlite3.OperationalError:
+                    other.rollback()
+                    blocked.append(statement)
+
+            repository.set_trace_callback(insert_from_other)
+            self.assertEqual(1, repository.save_category(Category("Banderas")))
+            self.assertEqual(1, len(blocked))
+            other.close()
+            repository.close()
+
+    def test_commit_writes_made_on_cur(self):
+        with tempfile.TemporaryDirectory() as directory:
+            database = Path(directory, "material.db3")
+            repository = SQLiteRepository(database)
+            repository.run_script("Material_database.sql")
+            repository.cur.execute("INSERT INTO Categories (Id, Name) VALUES (1, 'Banderas')")
+            version = repository.data_version()
+            repository.commit()
+            self.assertNotEqual(version, repository.data_version())
+            other = sqlite3.connect(database)
+            self.assertEqual(1, other.execute("SELECT COUNT(*) FROM Categories").fetchone()[0])
+            other.close()
+            repository.close()
+
+    def test_save_categories_in_one_transaction(self):
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.repository.save_categories(
+                [Category("Banderas", [Item("item1")]), Category("Banderas")], defer_indexes=True
+            )
+        self.assertEqual([], self.repository.load_items())
+        indexes = self.repository.execute_sql_objects(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+        )
+        self.assertEqual(2, len(indexes))
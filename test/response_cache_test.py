@@ -0,0 +1,71 @@
+"""
+    ResponseCache tests
+"""
+import unittest
+
+from response_cache import ResponseCache
+from sqlite_repository import SQLiteRepository
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(max_size=10)
+
+    def test_hit_same_version(self):
+        self.cache.put("items", 1, b"[]")
+        self.assertEqual(b"[]", self.cache.get("items", 1).body)
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual(0, self.cache.misses)
+
+    def test_miss_other_version(self):
+        self.cache.put("items", 1, b"[]")
+        self.assertIsNone(self.cache.get("items", 2))
+        self.assertEqual(1, self.cache.misses)
+
+    def test_get_or_create(self):
+        calls = []
+
+        def create():
+            calls.append(1)
+            return b"[1]"
+
+        self.assertEqual(b"[1]", self.cache.get_or_create("items", 1, create).body)
+        self.assertEqual(b"[1]", self.cache.get_or_create("items", 1, create).body)
+        self.assertEqual(1, len(calls))
+        self.cache.get_or_create("items", 2, create)
+        self.assertEqual(2, len(calls))
+        self.assertEqual(1, len(self.cache))
+
+    def test_etag_from_content(self):
+        first = self.cache.put("a", 1, b"[1]")
+        second = self.cache.put("b", 2, b"[1]")
+        third = self.cache.put("c", 1, b"[2]")
+        self.assertEqual(first.etag, second.etag)
+        self.assertNotEqual(first.etag, third.etag)
+
+    def test_evict_least_recently_used(self):
+        self.cache.put("a", 1, b"aaaa")
+        self.cache.put("b", 1, b"bbbb")
+        self.cache.get("a", 1)
+        self.cache.put("c", 1, b"cccc")
+        self.assertIsNotNone(self.cache.get("a", 1))
+        self.assertIsNone(self.cache.get("b", 1))
+        self.assertEqual(8, self.cache.size)
+
+    def test_body_larger_than_cache(self):
+        self.cache.put("a", 1, b"a" * 11)
+        self.assertEqual(0, len(self.cache))
+        self.assertEqual(0, self.cache.size)
+
+    def test_repository_data_version(self):
+        repository = SQLiteRepository(":memory:")
+        repository.run_script("Material_database.sql")
+        version = repository.data_version()
+        self.assertEqual(version, repository.data_version())
+        repository.execute("INSERT INTO Categories (Name) VALUES (?)", ("Banderas",))
+        repository.commit()
+        self.assertNotEqual(version, repository.data_version())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -173,6 +173,47 @@ class ServiceTest(unittest.TestCase):
         batch = self.service.build_batch_from_category_id(category["id"])
         self.assertTrue(batch["completed"])
 
+    def test_view_order_kept_between_batches(self):
+        """ Expect the next batch from the kept view order, without reading
+            the category, until other data changes.
+        """
+        category = self.service.create_category(self.category)
+        batch = self.service.build_batch_from_category_id(category["id"])
+        self.service.update_views(batch)
+        self.assertIn(category["id"], self.service.view_orders)
+
+        reads = []
+        select_category = self.service.db_words.select_category
+        self.service.db_words.select_category = \
+            lambda category_id: reads.append(category_id) or select_category(category_id)
+        batch = self.service.build_batch_from_category_id(category["id"])
+        self.assertEqual([], reads)
+        fresh = self.service.build_batch_from_category(select_category(category["id"]))
+        self.assertEqual([w["id"] for w in fresh["words"]],
+                         [w["id"] for w in batch["words"]])
+        self.assertEqual([w["views"] for w in fresh["words"]],
+                         [w["views"] for w in batch["words"]])
+
+        self.service.create_category(
+            {"name": "other", "lastUse": None, "words": [{"word": "other", "views": 0}]})
+        reads.clear()
+        self.service.build_batch_from_category_id(category["id"])
+        self.assertEqual([category["id"]], reads)
+
+    def test_batch_words_after_update(self):
+        """ Expect words of the kept view order as select_category reads them """
+        category = self.service.create_category(self.category)
+        batch = self.service.build_batch_from_category_id(category["id"])
+        before = batch["words"][0]
+        self.service.update_views(batch)
+        batch = self.service.build_batch_from_category_id(category["id"])
+        fresh = self.service.build_batch_from_category(
+            self.service.db_words.select_category(category["id"]))
+        self.assertEqual(fresh["words"], batch["words"])
+        for word in batch["words"]:
+            self.assertEqual(set(before), set(word))
+            self.assertIsInstance(word["lastUse"], (datetime, type(None)))
+
     def test_datetime(self):
         """ Verify type of datetime type values is preserved """
         self.category["lastUse"] = datetime.now()
@@ -0,0 +1,165 @@
+"""
+    Storage profile tests
+"""
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from plugins.vocabulary.db_words import DBWords
+from sqlite_repository import SQLiteRepository
+from storage_profile import StorageProfile, WriterThread, get_profile
+
+
+class StorageProfileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = Path(self.directory.name, "material.db3")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get_profile(self):
+        self.assertEqual("default", get_profile(None).name)
+        self.assertEqual("wal", get_profile("wal").name)
+        self.assertRaises(ValueError, get_profile, "fast")
+
+    def test_apply(self):
+        connection = sqlite3.connect(self.database)
+        get_profile("wal").apply(connection)
+        self.assertEqual("wal", connection.execute("PRAGMA journal_mode").fetchone()[0])
+        self.assertEqual(1, connection.execute("PRAGMA synchronous").fetchone()[0])
+        connection.close()
+
+    def test_repository_writes_from_threads(self):
+        repository = SQLiteRepository(self.database, profile=get_profile("wal"))
+        repository.run_script("Material_database.sql")
+
+        def insert(first):
+            for category_id in range(first, first + 10):
+                repository.execute(
+                    "INSERT INTO Categories (Id, Name) VALUES (?, ?)",
+                    (category_id, f"category{category_id}"),
+                )
+                repository.commit()
+
+        threads = [threading.Thread(target=insert, args=(n * 10 + 1,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        rows = repository.all_table_content("Categories")
+        self.assertEqual(list(range(1, 41)), sorted(row["Id"] for row in rows))
+        repository.close()
+
+    def test_repository_closed_once(self):
+        close = WriterThread.close
+        with mock.patch.object(WriterThread, "close", autospec=True, side_effect=close) as closed:
+            with SQLiteRepository(self.database, profile=get_profile("memory")) as repository:
+                repository.run_script("Material_database.sql")
+            repository.close()
+            repository.__del__()
+        self.assertEqual(1, closed.call_count)
+
+    def test_db_words(self):
+        for database in (":memory:", str(self.database)):
+            db_words = DBWords(database, get_profile("wal"))
+            db_words.create_category({"name": "animals", "words": [{"word": "cat"}]})
+            self.assertEqual(["animals"], [c["name"] for c in db_words.select_categories()])
+            db_words.close()
+
+    def test_streaming_does_not_block_writes(self):
+        profiles = (
+            StorageProfile(busy_timeout=100),  # Reads on the writer connection
+            StorageProfile(reader_pool=True, busy_timeout=100),  # Rollback journal
+            get_profile("wal"),
+        )
+        for profile in profiles:
+            self.database.unlink(missing_ok=True)
+            repository = SQLiteRepository(self.database, profile=profile)
+            repository.run_script("Material_database.sql")
+            repository.execute_many(
+                "INSERT INTO Items (Text) VALUES (?)", [(f"item{n}",) for n in range(1200)]
+            )
+            repository.commit()
+            items = repository.iter_item_objects()
+            next(items)
+            repository.execute("INSERT INTO Items (Text) VALUES (?)", ("added",))
+            repository.commit()
+            self.assertLessEqual(1199, sum(1 for _ in items))
+            repository.close()
+
+    def test_reads_without_pool(self):
+        repository = SQLiteRepository(self.database)
+        repository.run_script("Material_database.sql")
+
+        def insert_and_count():
+            repository.execute("INSERT INTO Categories (Id, Name) VALUES (?, ?)", (1, "a"))
+            # Same connection as the writer: the change is seen before the commit
+            return len(repository.all_table_content("Categories"))
+
+        self.assertEqual(1, repository.transaction(insert_and_count))
+        repository.close()
+
+    def test_transactions_from_threads(self):
+        repository = SQLiteRepository(self.database, profile=get_profile("wal"))
+        repository.run_script("Material_database.sql")
+
+        def insert(first, fail):
+            def write():
+                for category_id in range(first, first + 5):
+                    repository.execute(
+                        "INSERT INTO Categories (Id, Name) VALUES (?, ?)",
+                        (category_id, f"category{category_id}"),
+                    )
+                    time.sleep(0.001)
+                if fail:
+                    raise ValueError(first)
+
+            try:
+                repository.transaction(write)
+            except ValueError:
+                pass
+
+        threads = [
+            threading.Thread(target=insert, args=(n * 10 + 1, n % 2 == 1)) for n in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Failed transactions are rolled back whole, without undoing the others
+        rows = repository.all_table_content("Categories")
+        self.assertEqual([1, 2, 3, 4, 5, 21, 22, 23, 24, 25], sorted(row["Id"] for row in rows))
+        repository.close()
+
+
+class WriterThreadTest(unittest.TestCase):
+    def setUp(self):
+        self.writer = WriterThread()
+
+    def tearDown(self):
+        self.writer.close()
+
+    def test_call(self):
+        self.assertEqual(3, self.writer.call(lambda a, b: a + b, 1, 2))
+
+    def test_runs_in_writer_thread(self):
+        caller = threading.current_thread()
+        self.assertIsNot(caller, self.writer.call(threading.current_thread))
+
+    def test_exception(self):
+        self.assertRaises(ZeroDivisionError, self.writer.call, lambda: 1 / 0)
+
+    def test_order(self):
+        done = []
+        futures = [self.writer.submit(done.append, n) for n in range(100)]
+        futures[-1].result()
+        self.assertEqual(list(range(100)), done)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,268 @@
+"""
+    util module tests
+"""
+import tempfile
+import unittest
+from pathlib import Path
+
+from flask import Flask
+from werkzeug.exceptions import NotFound
+
+from response_cache import ByteCache, ResponseCache
+from model import Category, Item
+from util import (
+    app_response_cache,
+    iter_json_array,
+    make_cached_json_response,
+    make_image_response,
+    make_json_response,
+    to_json,
+)
+
+
+class JsonResponseTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.cache = ResponseCache()
+
+    def test_to_json(self):
+        self.assertEqual('["ñ"]'.encode("utf-8"), to_json(["ñ"]))
+
+    def test_etag(self):
+        with self.app.test_request_context("/"):
+            response = make_json_response(b"[1]")
+        self.assertEqual(200, response.status_code)
+        self.assertIsNotNone(response.get_etag()[0])
+        self.assertEqual(b"[1]", response.get_data())
+
+    def test_not_modified(self):
+        with self.app.test_request_context("/"):
+            etag = make_json_response(b"[1]").get_etag()[0]
+        headers = {"If-None-Match": f'"{etag}"'}
+        with self.app.test_request_context("/", headers=headers):
+            response = make_json_response(b"[1]")
+            self.assertEqual(304, response.status_code)
+            self.assertEqual(b"", response.get_data())
+            response = make_json_response(b"[2]")
+            self.assertEqual(200, response.status_code)
+
+    def test_not_modified_skips_load(self):
+        calls = []
+
+        def load():
+            calls.append(1)
+            return [1]
+
+        with self.app.test_request_context("/"):
+            response = make_cached_json_response(self.cache, "key", 1, load)
+        etag = response.get_etag()[0]
+        with self.app.test_request_context("/", headers={"If-None-Match": f'"{etag}"'}):
+            response = make_cached_json_response(self.cache, "key", 1, load)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(1, len(calls))
+
+    def test_app_response_cache(self):
+        with self.app.app_context():
+            default = app_response_cache()
+            self.assertIs(default, app_response_cache())
+        self.app.config["RESPONSE_CACHE"] = self.cache
+        with self.app.app_context():
+            self.assertIs(self.cache, app_response_cache())
+
+
+class JsonStreamTest(unittest.TestCase):
+    def test_same_as_to_json(self):
+        elements = [
+            Category(Name="Banderas", Items=[Item(Text="ñ", Id=1)], Id=1),
+            Category(Name="Animales", Id=2),
+        ]
+        self.assertEqual(to_json(elements), b"".join(iter_json_array(elements)))
+
+    def test_empty(self):
+        self.assertEqual(b"[]", b"".join(iter_json_array(iter([]))))
+
+    def test_chunks(self):
+        elements = [Item(Text=f"item{i}", Id=i) for i in range(100)]
+        chunks = list(iter_json_array(iter(elements), chunk_size=256))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(to_json(elements), b"".join(chunks))
+
+    def test_closes_elements(self):
+        closed = []
+
+        def elements():
+            try:
+                yield from (Item(Text=f"item{i}", Id=i) for i in range(100))
+            finally:
+                closed.append(True)
+
+        chunks = iter_json_array(elements(), chunk_size=256)
+        next(chunks)
+        chunks.close()
+        self.assertEqual([True], closed)
+
+
+class ImageResponseTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.directory = tempfile.TemporaryDirectory()
+        self.image = Path(self.directory.name, "images", "image 1.jpg")
+        self.image.parent.mkdir()
+        self.image.write_bytes(bytes(range(256)) * 10)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get(self, path, headers=None):
+        with self.app.test_request_context("/", headers=headers):
+            response = make_image_response(path)
+            data = b"".join(response.response)
+            response.close()
+            return response, data
+
+    def test_file(self):
+        response, data = self.get(self.image)
+        self.assertEqual(2560, response.content_length)
+        self.assertEqual(self.image.read_bytes(), data)
+
+    def test_cache_headers(self):
+        self.app.config["IMAGE_MAX_AGE"] = 3600
+        response, _ = self.get(self.image)
+        self.assertIsNotNone(response.get_etag()[0])
+        self.assertIsNotNone(response.last_modified)
+        self.assertEqual(3600, response.cache_control.max_age)
+        self.assertTrue(response.cache_control.public)
+
+    def test_not_modified(self):
+        response, _ = self.get(self.image)
+        etag = response.get_etag()[0]
+        last_modified = response.headers["Last-Modified"]
+        for headers in (
+            {"If-None-Match": f'"{etag}"'},
+            {"If-Modified-Since": last_modified},
+        ):
+            with self.app.test_request_context("/", headers=headers):
+                response = make_image_response(self.image)
+            self.assertEqual(304, response.status_code)
+            self.assertEqual(etag, response.get_etag()[0])
+
+    def test_modified(self):
+        response, _ = self.get(self.image)
+        etag = response.get_etag()[0]
+        self.image.write_bytes(b"changed")
+        with self.app.test_request_context("/", headers={"If-None-Match": f'"{etag}"'}):
+            response = make_image_response(self.image)
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(b"changed", b"".join(response.response))
+            response.close()
+
+    def test_range(self):
+        response, data = self.get(self.image, {"Range": "bytes=10-19"})
+        self.assertEqual(206, response.status_code)
+        self.assertEqual(self.image.read_bytes()[10:20], data)
+        self.assertEqual(10, response.content_length)
+        self.assertEqual("bytes 10-19/2560", response.headers["Content-Range"])
+
+    def test_suffix_range(self):
+        response, data = self.get(self.image, {"Range": "bytes=-100"})
+        self.assertEqual(206, response.status_code)
+        self.assertEqual(self.image.read_bytes()[-100:], data)
+
+    def test_multiple_ranges(self):
+        response, data = self.get(self.image, {"Range": "bytes=0-3,100-199"})
+        self.assertEqual(206, response.status_code)
+        self.assertEqual("multipart/byteranges", response.mimetype)
+        self.assertEqual(len(data), response.content_length)
+        boundary = response.mimetype_params["boundary"].encode()
+        parts = data.split(b"--" + boundary)
+        self.assertEqual(b"--\r\n", parts[-1])
+        content = self.image.read_bytes()
+        self.assertIn(b"Content-Range: bytes 0-3/2560", parts[1])
+        self.assertTrue(parts[1].endswith(b"\r\n\r\n" + content[:4] + b"\r\n"))
+        self.assertTrue(parts[2].endswith(b"\r\n\r\n" + content[100:200] + b"\r\n"))
+
+    def test_unsatisfiable_range(self):
+        response, _ = self.get(self.image, {"Range": "bytes=5000-"})
+        self.assertEqual(416, response.status_code)
+        self.assertEqual("bytes */2560", response.headers["Content-Range"])
+
+    def test_if_range(self):
+        response, _ = self.get(self.image)
+        etag = response.get_etag()[0]
+        self.assertEqual("bytes", response.headers["Accept-Ranges"])
+        response, _ = self.get(self.image, {"Range": "bytes=0-9", "If-Range": f'"{etag}"'})
+        self.assertEqual(206, response.status_code)
+        response, data = self.get(self.image, {"Range": "bytes=0-9", "If-Range": '"x"'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2560, len(data))
+
+    def test_missing_file(self):
+        self.assertRaises(NotFound, self.get, self.image.with_name("missing.jpg"))
+
+    def test_x_sendfile(self):
+        self.app.config["IMAGE_OFFLOAD"] = "x-sendfile"
+        response, data = self.get(self.image)
+        self.assertEqual(str(self.image.resolve()), response.headers["X-Sendfile"])
+        self.assertEqual(b"", data)
+
+    def test_x_accel_redirect(self):
+        self.app.config["IMAGE_OFFLOAD"] = "x-accel-redirect"
+        self.app.config["IMAGE_OFFLOAD_LOCATIONS"] = {self.directory.name: "/bits/"}
+        response, data = self.get(self.image)
+        self.assertEqual(
+            "/bits/images/image%201.jpg", response.headers["X-Accel-Redirect"]
+        )
+        self.assertEqual(b"", data)
+
+    def test_x_accel_redirect_unmapped(self):
+        self.app.config["IMAGE_OFFLOAD"] = "x-accel-redirect"
+        self.app.config["IMAGE_OFFLOAD_LOCATIONS"] = {"/elsewhere": "/bits/"}
+        response, data = self.get(self.image)
+        self.assertNotIn("X-Accel-Redirect", response.headers)
+        self.assertEqual(2560, len(data))
+
+    def test_image_cache(self):
+        cache = ByteCache(10000)
+        self.app.config["IMAGE_CACHE"] = cache
+        _, data = self.get(self.image)
+        response, cached = self.get(self.image)
+        self.assertEqual(self.image.read_bytes(), cached)
+        self.assertEqual(data, cached)
+        self.assertEqual(2560, response.content_length)
+        self.assertEqual({"hits": 1, "misses": 1, "size": 2560}, {
+            key: cache.stats()[key] for key in ("hits", "misses", "size")
+        })
+
+    def test_image_cache_ranges(self):
+        self.app.config["IMAGE_CACHE"] = ByteCache(10000)
+        self.get(self.image)
+        content = self.image.read_bytes()
+        response, data = self.get(self.image, {"Range": "bytes=10-19"})
+        self.assertEqual(206, response.status_code)
+        self.assertEqual(content[10:20], data)
+        self.assertEqual("bytes 10-19/2560", response.headers["Content-Range"])
+        response, data = self.get(self.image, {"Range": "bytes=0-3,100-199"})
+        self.assertEqual(len(data), response.content_length)
+        self.assertIn(b"\r\n\r\n" + content[100:200] + b"\r\n", data)
+        response, _ = self.get(self.image, {"Range": "bytes=5000-"})
+        self.assertEqual(416, response.status_code)
+
+    def test_image_cache_file_changed(self):
+        self.app.config["IMAGE_CACHE"] = ByteCache(10000)
+        self.get(self.image)
+        self.image.write_bytes(b"changed")
+        _, data = self.get(self.image)
+        self.assertEqual(b"changed", data)
+
+    def test_image_cache_large_file(self):
+        cache = ByteCache(10000, max_entry_size=1000)
+        self.app.config["IMAGE_CACHE"] = cache
+        _, data = self.get(self.image)
+        self.assertEqual(2560, len(data))
+        self.assertEqual(0, len(cache))
+        # Files over the entry limit are not looked up
+        self.assertEqual(0, cache.stats()["misses"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""
+    View order tests
+"""
+import random
+import unittest
+from dataclasses import replace
+
+from model import Item
+from view_order import ViewOrder
+
+
+def sorted_batch(items, batch_size, max_views, refresh_rate):
+    """Batch selection sorting the items, as get_batch did"""
+    if all(item.Views >= max_views for item in items):
+        return items, True
+    if len(items) <= batch_size:
+        return items, False
+    ordered = sorted(items, key=lambda item: item.Views, reverse=True)
+    pos = next(i for i, item in enumerate(ordered) if item.Views < max_views)
+    if pos > refresh_rate:
+        pos = pos - pos % refresh_rate
+    if len(ordered) - (pos + 1) >= batch_size:
+        return ordered[pos : pos + batch_size], False
+    return ordered[len(ordered) - batch_size :], False
+
+
+class ViewOrderTest(unittest.TestCase):
+    def test_same_batches_as_sorting(self):
+        rand = random.Random(7)
+        for size in (0, 3, 5, 12, 40):
+            items = [Item(f"item{i}", Views=rand.randrange(7), Id=i) for i in range(size)]
+            order = ViewOrder(items)
+            for _ in range(60):
+                self.assertEqual(sorted_batch(items, 5, 5, 3), order.next_batch(5, 5, 3))
+                if not items:
+                    break
+                item_id = rand.randrange(size)
+                items[item_id] = replace(items[item_id], Views=items[item_id].Views + 1)
+                order.update(items[item_id])
+
+    def test_range(self):
+        order = ViewOrder([Item(f"item{i}", Views=i % 3, Id=i) for i in range(9)])
+        self.assertEqual([2, 5, 8, 1, 4, 7], [item.Id for item in order.range(0, 6)])
+        self.assertEqual([7, 0, 3], [item.Id for item in order.range(5, 8)])
+        self.assertEqual(3, order.count_viewed(2))
+        self.assertEqual(4, order.get(4).Id)
+        self.assertIsNone(order.get(10))
+
+
+if __name__ == "__main__":
+    unittest.main()
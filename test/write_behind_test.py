@@ -0,0 +1,105 @@
+"""
+    ViewBuffer tests
+"""
+import time
+import unittest
+from datetime import datetime
+
+from material_service import MaterialService
+from model import Category, Item
+from sqlite_repository import SQLiteRepository
+from write_behind import ViewBuffer
+
+
+class ViewBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.repository = SQLiteRepository(":memory:")
+        self.repository.run_script("Material_database.sql")
+        self.repository.execute_many(
+            "INSERT INTO Categories (Id, Name) VALUES (?, ?)", [(1, "Banderas")]
+        )
+        self.repository.execute_many(
+            "INSERT INTO Items (Id, Text, Views, CategoryId) VALUES (?, ?, ?, ?)",
+            [(item_id, f"item{item_id}", 0, 1) for item_id in range(1, 6)],
+        )
+        self.repository.commit()
+
+    def views(self):
+        rows = self.repository.execute_sql_select("SELECT Id, Views FROM Items ORDER BY Id")
+        return [row["Views"] for row in rows]
+
+    def test_coalesce(self):
+        buffer = ViewBuffer(self.repository, flush_interval=60)
+        buffer.add(1, [1, 2], datetime.now())
+        buffer.add(1, [2, 3], datetime.now())
+        self.assertEqual(3, buffer.pending())
+        self.assertEqual([0, 0, 0, 0, 0], self.views())
+        buffer.flush()
+        self.assertEqual([1, 2, 1, 0, 0], self.views())
+        self.assertEqual(1, buffer.flushes)
+        buffer.close()
+
+    def test_flush_when_full(self):
+        buffer = ViewBuffer(self.repository, max_pending=3, flush_interval=60)
+        buffer.add(1, [1, 2], datetime.now())
+        self.assertEqual(0, buffer.flushes)
+        buffer.add(1, [3], datetime.now())
+        self.assertEqual(1, buffer.flushes)
+        self.assertEqual(0, buffer.pending())
+        buffer.close()
+
+    def test_flush_periodically(self):
+        buffer = ViewBuffer(self.repository, flush_interval=0.01)
+        buffer.add(1, [1], datetime.now())
+        for _ in range(100):
+            if buffer.flushes:
+                break
+            time.sleep(0.01)
+        self.assertEqual([1, 0, 0, 0, 0], self.views())
+        buffer.close()
+
+    def test_close_flushes(self):
+        buffer = ViewBuffer(self.repository, flush_interval=60)
+        buffer.add(1, [4, 5], datetime.now())
+        buffer.close()
+        self.assertEqual([0, 0, 0, 1, 1], self.views())
+        rows = self.repository.execute_sql_select("SELECT LastUse FROM Categories")
+        self.assertIsNotNone(rows[0]["LastUse"])
+
+    def test_marks_completed(self):
+        buffer = ViewBuffer(self.repository, flush_interval=60)
+        buffer.add(1, [1, 2, 3, 4], datetime.now(), max_views=1)
+        buffer.flush()
+        self.assertFalse(self.repository.load_category(1).Completed)
+        buffer.add(1, [5], datetime.now(), max_views=1)
+        buffer.close()
+        self.assertTrue(self.repository.load_category(1).Completed)
+
+    def test_failed_flush_kept(self):
+        buffer = ViewBuffer(self.repository, flush_interval=60)
+        buffer.add(1, [1], datetime.now())
+        self.repository.execute_statement("ALTER TABLE Items RENAME TO Renamed")
+        self.assertRaises(Exception, buffer.flush)
+        buffer.add(1, [1], datetime.now())
+        self.repository.execute_statement("ALTER TABLE Renamed RENAME TO Items")
+        buffer.close()
+        self.assertEqual([2, 0, 0, 0, 0], self.views())
+
+    def test_update_batch(self):
+        buffer = ViewBuffer(self.repository, flush_interval=60)
+        service = MaterialService(self.repository, buffer)
+        batch = Category(Id=1, Name="Banderas", Items=[Item(Text="item1", Id=1)])
+        self.assertTrue(service.update_batch(batch))
+        self.assertTrue(service.update_batch(batch))
+        buffer.close()
+        self.assertEqual([2, 0, 0, 0, 0], self.views())
+
+    def test_update_batch_immediate(self):
+        service = MaterialService(self.repository)
+        batch = Category(Id=1, Name="Banderas", Items=[Item(Text="item2", Id=2)])
+        self.assertTrue(service.update_batch(batch))
+        self.assertEqual([0, 1, 0, 0, 0], self.views())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,380 @@
 '''
     Utility functions
 '''
-import io
-from flask import make_response
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import quote
+from flask import Response, abort, current_app, make_response, request
+from werkzeug.http import is_resource_modified
+from werkzeug.wsgi import wrap_file
+from model_encoder import ResponseEncoder
+from pagination import MAX_PAGE_SIZE, parse_cursor
+from response_cache import ResponseCache, etag_for
 
 
 def make_image_response(img_path):
-    ''' Make response for an image '''
-    with io.FileIO(str(img_path)) as img:
-        img_bytes = img.readall()
-    response = make_response(img_bytes)
-    response.headers.set('Content-Type', 'image/jpeg')
+    '''
+        Make response for an image.
+
+        The open file is handed to the server through wsgi.file_wrapper, so
+        waitress sends it in blocks (or with sendfile) instead of reading it
+        whole into memory. With the IMAGE_OFFLOAD setting only the headers
+        for a front proxy are sent, see make_offload_response.
+
+        Images do not change once generated. Responses carry validators taken
+        from the file modification time and size, and may be cached by
+        clients for IMAGE_MAX_AGE seconds. Clients that already have the
+        current file get 304 Not Modified.
+    '''
+    try:
+        stat = os.stat(img_path)
+    except FileNotFoundError:
+        abort(404)
+    etag = f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+    if not is_resource_modified(request.environ, etag, last_modified=last_modified):
+        response = make_response('', 304)
+    else:
+        response = make_file_response(img_path, etag, last_modified, stat.st_size)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get('IMAGE_MAX_AGE', 31536000)
+    return response
+
+
+def make_file_response(img_path, etag=None, last_modified=None, size=None):
+    '''
+        Make response sending the content of an image file.
+
+        Range requests are answered with 206 Partial Content, reading each
+        range from its position in the file. Several ranges are sent as
+        multipart/byteranges. etag and last_modified validate If-Range.
+
+        With an IMAGE_CACHE, a ByteCache, the content of small files is kept
+        in memory, keyed by their resolved path and validated by etag. Files
+        whose size, when known, is over its entry limit skip the cache.
+    '''
+    offload = current_app.config.get('IMAGE_OFFLOAD')
+    if offload:
+        response = make_offload_response(img_path, offload)
+        if response is not None:
+            return response
+    image_cache = current_app.config.get('IMAGE_CACHE')
+    if image_cache is not None and etag is not None and (
+        size is None or image_cache.fits(size)
+    ):
+        content = read_cached_image(image_cache, img_path, etag)
+        if content is not None:
+            return make_content_response(content, etag, last_modified)
+    try:
+        img = open(img_path, 'rb')
+    except FileNotFoundError:
+        abort(404)
+    try:
+        size = os.fstat(img.fileno()).st_size
+        ranges = requested_ranges(size, etag, last_modified)
+    except Exception:
+        img.close()
+        raise
+    if ranges is None:
+        response = Response(wrap_file(request.environ, img), direct_passthrough=True)
+        response.content_length = size
+    elif not ranges:
+        img.close()
+        return make_unsatisfiable_response(size)
+    elif len(ranges) == 1:
+        start, stop = ranges[0]
+        if 'wsgi.file_wrapper' in request.environ:
+            # The server sends up to Content-Length bytes from the current position
+            img.seek(start)
+            body = wrap_file(request.environ, img)
+        else:
+            body = iter_file_range(img, start, stop)
+        response = Response(body, status=206, direct_passthrough=True)
+        response.content_length = stop - start
+        response.headers.set('Content-Range', f'bytes {start}-{stop - 1}/{size}')
+    else:
+        return make_multipart_response(
+            ranges, size, lambda start, stop: read_file_range(img, start, stop), img.close)
+    response.headers.set('Content-Type', IMAGE_TYPE)
+    response.accept_ranges = 'bytes'
+    return response
+
+
+def make_content_response(content, etag=None, last_modified=None):
+    ''' Make response sending image content already in memory, honouring Range requests '''
+    size = len(content)
+    ranges = requested_ranges(size, etag, last_modified)
+    if ranges is None:
+        response = make_response(content)
+    elif not ranges:
+        return make_unsatisfiable_response(size)
+    elif len(ranges) == 1:
+        start, stop = ranges[0]
+        response = make_response(content[start:stop], 206)
+        response.headers.set('Content-Range', f'bytes {start}-{stop - 1}/{size}')
+    else:
+        return make_multipart_response(ranges, size, lambda start, stop: [content[start:stop]])
+    response.headers.set('Content-Type', IMAGE_TYPE)
+    response.accept_ranges = 'bytes'
+    return response
+
+
+def read_cached_image(image_cache, img_path, version):
+    '''
+        Return the content of the image file from the cache, reading and
+        storing it when missing or outdated. Return None for files too large
+        to be cached.
+    '''
+    key = os.path.realpath(img_path)
+    content = image_cache.get(key, version)
+    if content is None:
+        try:
+            with open(key, 'rb') as img:
+                if not image_cache.fits(os.fstat(img.fileno()).st_size):
+                    return None
+                content = img.read()
+        except FileNotFoundError:
+            abort(404)
+        image_cache.put(key, version, content)
+    return content
+
+
+# Content type of images
+IMAGE_TYPE = 'image/jpeg'
+
+# Max number of ranges served from a single request. Requests asking for more
+# get the whole file.
+MAX_RANGES = 16
+
+# Bytes read from a file on each step when sending it
+BLOCK_SIZE = 64 * 1024
+
+
+def requested_ranges(size, etag=None, last_modified=None):
+    '''
+        Byte ranges asked by the request as (start, stop) pairs, stop excluded.
+
+        Return None when the whole file has to be sent: there is no valid Range
+        header, it asks for too many ranges, or the If-Range condition does not
+        hold. An empty list means none of the ranges can be satisfied.
+    '''
+    requested = request.range
+    if requested is None or requested.units != 'bytes' or len(requested.ranges) > MAX_RANGES:
+        return None
+    if_range = request.if_range
+    if if_range.etag is not None and if_range.etag != etag:
+        return None
+    if if_range.date is not None and (last_modified is None or last_modified > if_range.date):
+        return None
+    ranges = []
+    for start, stop in requested.ranges:
+        if start < 0:
+            start = max(size + start, 0)
+        if stop is None or stop > size:
+            stop = size
+        if start < stop:
+            ranges.append((start, stop))
+    return ranges
+
+
+def iter_file_range(file, start, stop):
+    ''' Yield the bytes of file from start to stop in blocks, closing it at the end '''
+    try:
+        yield from read_file_range(file, start, stop)
+    finally:
+        file.close()
+
+
+def read_file_range(file, start, stop):
+    ''' Yield the bytes of file from start to stop in blocks '''
+    file.seek(start)
+    remaining = stop - start
+    while remaining > 0:
+        block = file.read(min(BLOCK_SIZE, remaining))
+        if not block:
+            break
+        remaining -= len(block)
+        yield block
+
+
+def make_unsatisfiable_response(size):
+    ''' Make 416 response for ranges beyond the end of the content '''
+    response = make_response('', 416)
+    response.headers.set('Content-Range', f'bytes */{size}')
+    return response
+
+
+def make_multipart_response(ranges, size, read_range, close=None):
+    '''
+        Make multipart/byteranges response with the given ranges of an image.
+        read_range(start, stop) yields the bytes of a range and close, if
+        given, is called once the response has been sent.
+    '''
+    boundary = uuid.uuid4().hex
+    headers = [
+        (
+            f'--{boundary}\r\nContent-Type: {IMAGE_TYPE}\r\n'
+            f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n'
+        ).encode('ascii')
+        for start, stop in ranges
+    ]
+    end = f'--{boundary}--\r\n'.encode('ascii')
+
+    def iter_parts():
+        try:
+            for header, (start, stop) in zip(headers, ranges):
+                yield header
+                yield from read_range(start, stop)
+                yield b'\r\n'
+            yield end
+        finally:
+            if close is not None:
+                close()
+
+    response = Response(iter_parts(), status=206, direct_passthrough=True)
+    response.content_length = (
+        sum(len(header) + stop - start + 2 for header, (start, stop) in zip(headers, ranges))
+        + len(end)
+    )
+    response.headers.set('Content-Type', f'multipart/byteranges; boundary={boundary}')
+    response.accept_ranges = 'bytes'
+    return response
+
+
+def make_offload_response(img_path, offload):
+    '''
+        Make response that lets the front proxy send the image file.
+
+        offload is either 'x-sendfile', which sends the absolute file path
+        (Apache mod_xsendfile, lighttpd), or 'x-accel-redirect' (nginx), which
+        sends the internal URI the file is mapped to in IMAGE_OFFLOAD_LOCATIONS,
+        a dictionary from directory to URI prefix.
+        Return None when the file can not be offloaded.
+    '''
+    path = Path(img_path).resolve()
+    if not path.is_file():
+        abort(404)
+    if offload == 'x-sendfile':
+        header, value = 'X-Sendfile', str(path)
+    elif offload == 'x-accel-redirect':
+        value = None
+        for location, prefix in current_app.config.get('IMAGE_OFFLOAD_LOCATIONS', {}).items():
+            try:
+                relative = path.relative_to(Path(location).resolve())
+            except ValueError:
+                continue
+            value = prefix.rstrip('/') + '/' + quote(relative.as_posix())
+            break
+        if value is None:
+            return None
+        header = 'X-Accel-Redirect'
+    else:
+        raise ValueError(f'Unknown image offload mode: {offload}')
+    response = make_response('')
+    response.headers.set(header, value)
+    response.headers.set('Content-Type', IMAGE_TYPE)
+    return response
+
+
+def to_json(data) -> bytes:
+    ''' Encode data as UTF-8 JSON '''
+    return json.dumps(data, cls=ResponseEncoder, ensure_ascii=False).encode('utf-8')
+
+
+def make_json_response(body: bytes, etag: str = None):
+    '''
+        Make response for an encoded JSON body.
+
+        The response carries a strong ETag, computed from the body when not
+        given. Clients that already have it get 304 Not Modified instead.
+    '''
+    if etag is None:
+        etag = etag_for(body)
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(body)
+        response.content_type = 'application/json'
+    response.set_etag(etag)
     return response
+
+
+def app_response_cache():
+    '''
+        Response cache shared by the endpoints of the application, the
+        RESPONSE_CACHE in its config. A default one is created when the
+        application sets none.
+    '''
+    return current_app.config.setdefault('RESPONSE_CACHE', ResponseCache())
+
+
+def make_cached_json_response(cache, key, version, load):
+    '''
+        Make JSON response from the cached encoding of load() for the given
+        data version. While the version does not change, repeated requests
+        neither call load() nor encode again.
+    '''
+    cached = cache.get_or_create(key, version, lambda: to_json(load()))
+    return make_json_response(cached.body, cached.etag)
+
+
+def iter_json_array(elements, chunk_size=64 * 1024):
+    '''
+        Encode elements as a JSON array one at a time, yielding chunks of about
+        chunk_size bytes. The result is the same as to_json(list(elements)).
+        elements is closed, if it can be, once encoded or when the response is
+        closed before.
+    '''
+    encoder = ResponseEncoder(ensure_ascii=False)
+    chunk = [b'[']
+    size = 1
+    try:
+        for position, element in enumerate(elements):
+            encoded = (', ' if position else '') + encoder.encode(element)
+            chunk.append(encoded.encode('utf-8'))
+            size += len(chunk[-1])
+            if size >= chunk_size:
+                yield b''.join(chunk)
+                chunk = []
+                size = 0
+    finally:
+        # Release the cursor behind elements also when the client goes away
+        close = getattr(elements, 'close', None)
+        if close is not None:
+            close()
+    chunk.append(b']')
+    yield b''.join(chunk)
+
+
+def make_streamed_json_response(elements):
+    ''' Make response that encodes elements as a JSON array while they are sent '''
+    return Response(iter_json_array(elements), content_type='application/json')
+
+
+def page_arguments():
+    '''
+        Read limit and after arguments of a paged request.
+
+        Return (limit, after), or None when the request does not ask for a page.
+    '''
+    limit = request.args.get('limit')
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+        after = parse_cursor(request.args.get('after'))
+    except ValueError:
+        abort(400, 'Invalid limit or after argument.')
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        abort(400, f'limit must be between 1 and {MAX_PAGE_SIZE}.')
+    return limit, after
+
+
+def page_body(elements, next_cursor):
+    ''' Body of a paged response: the elements and the cursor of the next page '''
+    return {'data': elements, 'next': next_cursor}
@@ -0,0 +1,126 @@
+"""
+    Write-behind buffer for view updates.
+
+    Views and last use dates are accumulated in memory and written to the
+    repository together, in a single transaction, when max_pending items are
+    waiting or every flush_interval seconds. Repeated views of an item are
+    added up into one update. Categories whose items all reach the max_views
+    given with their views are marked as completed in the same transaction.
+
+    Updates still in the buffer are lost if the process dies; at most
+    flush_interval seconds of them. close() writes them on shutdown.
+"""
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Iterable
+
+from repository import Repository
+
+logger = logging.getLogger(__name__)
+
+
+class ViewBuffer:
+    """Views waiting to be written to the repository"""
+
+    def __init__(
+        self,
+        repository: Repository,
+        max_pending: int = 1000,
+        flush_interval: float = 1.0,
+    ):
+        self.repository = repository
+        self.max_pending = max_pending  # Items waiting that trigger a flush
+        self.flush_interval = flush_interval  # Max seconds an update waits
+        self.flushes = 0  # Number of transactions written
+        self.__views: Dict[int, int] = {}  # Views to add by item Id
+        self.__item_use: Dict[int, str] = {}
+        self.__category_use: Dict[int, str] = {}
+        self.__max_views: Dict[int, int] = {}  # Completion checked by category Id
+        self.__lock = threading.Lock()
+        self.__flush_lock = threading.Lock()  # Keeps flushes in order
+        self.__closed = threading.Event()
+        self.__thread = threading.Thread(
+            target=self.__flush_periodically, name="view-buffer", daemon=True
+        )
+        self.__thread.start()
+
+    def add(
+        self,
+        category_id: int,
+        item_ids: Iterable[int],
+        last_use: datetime,
+        max_views: int = None,
+    ) -> None:
+        """Add a view of the given items of a category. With max_views, the
+        category is marked as completed once all its items have that many views.
+        """
+        last_use = str(last_use)
+        with self.__lock:
+            self.__category_use[category_id] = last_use
+            if max_views is not None:
+                self.__max_views[category_id] = max_views
+            for item_id in item_ids:
+                self.__views[item_id] = self.__views.get(item_id, 0) + 1
+                self.__item_use[item_id] = last_use
+            full = len(self.__views) >= self.max_pending
+        if full:
+            self.flush()
+
+    def pending(self) -> int:
+        """Number of items with views not yet written"""
+        with self.__lock:
+            return len(self.__views)
+
+    def flush(self) -> None:
+        """Write the buffered updates in a single transaction"""
+        with self.__flush_lock:
+            with self.__lock:
+                views, item_use, category_use, max_views = (
+                    self.__views,
+                    self.__item_use,
+                    self.__category_use,
+                    self.__max_views,
+                )
+                self.__views, self.__item_use, self.__category_use = {}, {}, {}
+                self.__max_views = {}
+            if not views and not category_use:
+                return
+            try:
+                self.repository.update_views(
+                    [(last_use, category_id) for category_id, last_use in category_use.items()],
+                    [(count, item_use[item_id], item_id) for item_id, count in views.items()],
+                    list(max_views.items()),
+                )
+                self.flushes += 1
+            except Exception:
+                self.__restore(views, item_use, category_use, max_views)
+                raise
+
+    def __restore(self, views, item_use, category_use, max_views) -> None:
+        """Put back updates that could not be written, before the newer ones"""
+        with self.__lock:
+            for item_id, count in self.__views.items():
+                views[item_id] = views.get(item_id, 0) + count
+            item_use.update(self.__item_use)
+            category_use.update(self.__category_use)
+            max_views.update(self.__max_views)
+            self.__views, self.__item_use, self.__category_use, self.__max_views = (
+                views,
+                item_use,
+                category_use,
+                max_views,
+            )
+
+    def __flush_periodically(self) -> None:
+        while not self.__closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as error:
+                logger.error(f"Could not write views: {error}")
+
+    def close(self) -> None:
+        """Stop flushing periodically and write the pending updates"""
+        self.__closed.set()
+        self.__thread.join()
+        self.flush()